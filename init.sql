@@ -1,5 +1,6 @@
 -- Инициализация базы данных для RAG системы POLIOM
 CREATE EXTENSION IF NOT EXISTS vector;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Таблица администраторов
 CREATE TABLE IF NOT EXISTS admins (
@@ -56,6 +57,9 @@ CREATE TABLE IF NOT EXISTS document_chunks (
     content_length INTEGER NOT NULL,
     embedding_vector VECTOR(312),
     chunk_metadata TEXT,
+    chunk_type VARCHAR(20),
+    -- Полнотекстовый поиск (морфология русского языка), поддерживается PostgreSQL
+    content_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('russian', content)) STORED,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
 );
 
@@ -109,18 +113,25 @@ CREATE INDEX IF NOT EXISTS idx_documents_uploaded_by ON documents(uploaded_by);
 CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at);
 CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id ON document_chunks(document_id);
 CREATE INDEX IF NOT EXISTS idx_document_chunks_chunk_index ON document_chunks(chunk_index);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_document_chunk ON document_chunks(document_id, chunk_index);
 CREATE INDEX IF NOT EXISTS idx_document_chunks_content_length ON document_chunks(content_length);
 CREATE INDEX IF NOT EXISTS idx_document_chunks_created_at ON document_chunks(created_at);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_chunk_type ON document_chunks(chunk_type);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_content_tsv ON document_chunks USING gin (content_tsv);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_content_trgm ON document_chunks USING gin (content gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_query_logs_user_id ON query_logs(user_id);
 CREATE INDEX IF NOT EXISTS idx_query_logs_created_at ON query_logs(created_at);
 CREATE INDEX IF NOT EXISTS idx_menu_sections_order_index ON menu_sections(order_index);
 CREATE INDEX IF NOT EXISTS idx_menu_items_section_id ON menu_items(section_id);
 CREATE INDEX IF NOT EXISTS idx_menu_items_order_index ON menu_items(order_index);
 
--- Индекс для векторного поиска
+-- Индекс для векторного поиска (HNSW не требует перестроения при росте корпуса).
+-- Частичный: служебные чанки (приложения, титульные листы) в поиск не попадают.
+-- Тип и параметры можно сменить через manage_vector_index.py reindex
 CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding_vector 
-ON document_chunks USING ivfflat (embedding_vector vector_cosine_ops) 
-WITH (lists = 100);
+ON document_chunks USING hnsw (embedding_vector vector_cosine_ops) 
+WITH (m = 16, ef_construction = 64)
+WHERE chunk_type = 'content';
 
 -- Создание администратора по умолчанию (пароль: poliom_secure_487_admin)
 INSERT INTO admins (username, email, hashed_password, full_name) 
@@ -0,0 +1,43 @@
+-- Классификация чанков без типа (document_chunks.chunk_type)
+-- Чанки, загруженные до появления колонки, не попадают в векторный поиск
+-- (частичный индекс WHERE chunk_type = 'content'), пока им не назначен тип.
+-- Правила повторяют chunk_quality.classify_chunk; запуск повторно безопасен.
+
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS chunk_type VARCHAR(20);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_chunk_type ON document_chunks(chunk_type);
+
+DO $$
+DECLARE
+    classified INTEGER;
+BEGIN
+    UPDATE document_chunks SET chunk_type = CASE
+        WHEN lower(content) LIKE '%приложение%' THEN 'appendix'
+        WHEN lower(content) LIKE '%утверждаю%'
+          OR lower(content) LIKE '%генеральный директор%'
+          OR lower(content) LIKE '%введено впервые%'
+          OR lower(content) LIKE '%дата введения%' THEN 'title_page'
+        -- Шапка положения в начале чанка (REGULATION_HEADER_PATTERN)
+        WHEN left(lower(content), 200) ~ 'положение\s+о\s' THEN 'title_page'
+        WHEN lower(content) LIKE '%система менеджмента%' THEN 'boilerplate'
+        -- Три и более технических маркера (TECHNICAL_MARKERS)
+        WHEN (lower(content) LIKE '%область применения%')::int
+           + (lower(content) LIKE '%настоящее положение направлено%')::int
+           + (lower(content) LIKE '%акционерное общество%')::int
+           + (lower(content) LIKE '%сибгазполимер%')::int > 2 THEN 'boilerplate'
+        ELSE 'content'
+    END
+    WHERE chunk_type IS NULL;
+
+    GET DIAGNOSTICS classified = ROW_COUNT;
+    RAISE NOTICE 'Классифицировано чанков: %', classified;
+
+    -- Шапки положений, классифицированные как content до появления правила
+    -- (раньше они отсеивались в текстовом поиске через NOT ILIKE)
+    UPDATE document_chunks SET chunk_type = 'title_page'
+    WHERE chunk_type = 'content'
+      AND lower(content) NOT LIKE '%приложение%'
+      AND left(lower(content), 200) ~ 'положение\s+о\s';
+
+    GET DIAGNOSTICS classified = ROW_COUNT;
+    RAISE NOTICE 'Переклассифицировано шапок положений: %', classified;
+END $$;
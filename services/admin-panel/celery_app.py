@@ -6,6 +6,7 @@ import os
 import sys
 from pathlib import Path
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 import socket
 
 # Добавляем путь к shared модулям
@@ -66,5 +67,25 @@ app.conf.update(
     task_reject_on_worker_lost=True,
 )
 
+
+@worker_process_init.connect
+def warmup_embedding_model(**kwargs):
+    """Загружаем модель эмбеддингов один раз при старте процесса воркера"""
+    try:
+        from shared.utils.model_registry import warmup
+        stats = warmup()
+        print(f"🔥 Модель эмбеддингов прогрета: {stats}")
+    except Exception as e:
+        # Модель загрузится лениво при первой задаче
+        print(f"⚠️ Не удалось прогреть модель эмбеддингов: {e}")
+
+
+@worker_init.connect
+def warmup_solo_worker(**kwargs):
+    """В solo pool задачи выполняются в главном процессе - прогреваем его"""
+    if app.conf.worker_pool == 'solo':
+        warmup_embedding_model()
+
+
 if __name__ == '__main__':
     app.start() 
\ No newline at end of file
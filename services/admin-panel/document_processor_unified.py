@@ -6,6 +6,7 @@
 
 import os
 import sys
+import time
 import logging
 from pathlib import Path
 from datetime import datetime
@@ -19,15 +20,17 @@ sys.path.append(str(services_path))
 from dotenv import load_dotenv
 load_dotenv('.env.local')
 
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import text
-from shared.models.database import engine
+from sqlalchemy.orm import Session
+from sqlalchemy import text, insert
+# Общий движок и пул соединений процесса
+from shared.models.database import SessionLocal
 from shared.models import Document, DocumentChunk
 from shared.utils.document_processor import DocumentProcessor
-from shared.utils.embeddings import EmbeddingService
-
-# Создаем сессию базы данных
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from shared.utils.embeddings import EmbeddingService, get_default_batch_size
+from shared.utils.answer_cache import invalidate_document_answers
+from shared.utils.exact_cache import bump_corpus_version
+from shared.utils.document_metadata import invalidate_document_metadata
+from shared.utils.chunk_quality import classify_chunk
 
 # Настройка логирования
 logging.basicConfig(
@@ -215,6 +218,10 @@ class DocumentProcessorUnified:
             if not self.safe_delete_old_chunks(db, document_id):
                 logger.warning("Не удалось удалить старые чанки, продолжаем...")
             
+            # Ответы по старой версии документа больше не актуальны
+            invalidate_document_answers(document_id)
+            bump_corpus_version()
+            
             # Извлекаем текст из документа
             logger.info("Извлекаем текст из документа...")
             text_content = self.document_processor.extract_text(document.file_path)
@@ -235,61 +242,63 @@ class DocumentProcessorUnified:
             chunk_sizes = [len(chunk) for chunk in chunks]
             logger.info(f"Статистика чанков: мин={min(chunk_sizes)}, макс={max(chunk_sizes)}, средний={sum(chunk_sizes)/len(chunk_sizes):.1f}")
             
-            # Создаем чанки в базе данных
-            logger.info("Создаем чанки в базе данных...")
-            created_chunks = []
+            # Генерируем эмбеддинги батчами (транзакция не держится открытой во время инференса)
+            batch_size = get_default_batch_size()
+            logger.info(f"Генерируем эмбеддинги батчами по {batch_size}...")
+            embedding_start = time.perf_counter()
             
-            for i, chunk_text in enumerate(chunks):
-                try:
-                    logger.debug(f"Обрабатываем чанк {i+1}/{len(chunks)}")
-                    
-                    # Генерируем эмбеддинг для чанка
-                    embedding = self.embedding_service.get_embedding(chunk_text)
-                    
-                    # Создаем чанк в базе данных
-                    chunk = DocumentChunk(
-                        document_id=document.id,
-                        chunk_index=i,
-                        content=chunk_text,
-                        content_length=len(chunk_text),
-                        embedding_vector=embedding,
-                        created_at=datetime.utcnow()
-                    )
-                    
-                    db.add(chunk)
-                    created_chunks.append(chunk)
-                    
-                    # Коммитим каждые 5 чанков для избежания проблем с памятью
-                    if (i + 1) % 5 == 0:
-                        db.commit()
-                        logger.debug(f"Сохранено {i+1} чанков...")
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка создания чанка {i}: {str(e)}")
-                    continue
-            
-            if not created_chunks:
+            chunk_rows = []
+            for batch_start in range(0, len(chunks), batch_size):
+                batch = chunks[batch_start:batch_start + batch_size]
+                embeddings = self.embedding_service.get_embeddings_batch(batch, batch_size=batch_size)
+                
+                for offset, (chunk_text, embedding) in enumerate(zip(batch, embeddings)):
+                    chunk_rows.append({
+                        "document_id": document_id,
+                        "chunk_index": batch_start + offset,
+                        "content": chunk_text,
+                        "content_length": len(chunk_text),
+                        "embedding_vector": embedding,
+                        # Тип чанка определяется один раз при загрузке
+                        "chunk_type": classify_chunk(chunk_text),
+                        "created_at": datetime.utcnow()
+                    })
+                logger.debug(f"Эмбеддинги: {min(batch_start + batch_size, len(chunks))}/{len(chunks)}")
+            
+            embedding_time = time.perf_counter() - embedding_start
+            logger.info(f"Эмбеддинги созданы за {embedding_time:.2f} с "
+                        f"({len(chunk_rows) / max(embedding_time, 1e-6):.1f} чанков/с)")
+            
+            if not chunk_rows:
                 raise Exception("Не удалось создать ни одного чанка")
             
-            # Финальное сохранение
-            logger.info("Финальное сохранение чанков...")
+            # Массовая вставка одним executemany (многострочный INSERT ... VALUES)
+            logger.info("Сохраняем чанки в базе данных...")
+            insert_start = time.perf_counter()
+            db.execute(insert(DocumentChunk), chunk_rows)
             db.commit()
+            logger.info(f"Сохранено {len(chunk_rows)} чанков за {time.perf_counter() - insert_start:.2f} с")
             
             # Обновляем статус документа на "completed"
             document.processing_status = "completed"
             document.processed_at = datetime.utcnow()
             document.updated_at = datetime.utcnow()
-            document.chunks_count = len(created_chunks)
+            document.chunks_count = len(chunk_rows)
             db.commit()
             
-            success_msg = f"Документ {document_id} успешно обработан. Создано {len(created_chunks)} качественных чанков"
+            # Повторно: ответы могли закэшироваться, пока документ обрабатывался
+            invalidate_document_answers(document_id)
+            invalidate_document_metadata(document_id)
+            bump_corpus_version()
+            
+            success_msg = f"Документ {document_id} успешно обработан. Создано {len(chunk_rows)} качественных чанков"
             logger.info(success_msg)
             
             return {
                 "status": "completed",
                 "document_id": document_id,
                 "filename": document.original_filename,
-                "chunks_created": len(created_chunks),
+                "chunks_created": len(chunk_rows),
                 "chunk_stats": {
                     "min_size": min(chunk_sizes),
                     "max_size": max(chunk_sizes),
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Офлайн-сравнение методов объединения ретриверов (nDCG@k и задержка)
+
+Использование:
+    python evaluate_retrieval.py [--configs rrf:60 rrf:20 zscore] [--k 10] [--queries 100]
+    python evaluate_retrieval.py --labels labels.jsonl
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# Добавляем путь к services
+services_path = Path(__file__).parent.parent
+sys.path.append(str(services_path))
+
+# Загружаем переменные окружения
+from dotenv import load_dotenv
+load_dotenv('.env.local')
+
+from shared.models.database import SessionLocal
+from shared.utils.simple_rag import SimpleRAG
+from shared.utils.retrieval_eval import parse_config_spec, load_labels, load_eval_queries, evaluate_configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оценка поиска по журналу запросов")
+    parser.add_argument("--configs", nargs="+", default=["rrf:60", "rrf:20", "zscore"],
+                        help="Конфигурации объединения: rrf[:k] или zscore")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100, help="Максимум вопросов")
+    parser.add_argument("--labels", default=None, help="JSONL-файл с разметкой релевантности")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        labels = load_labels(args.labels) if args.labels else None
+        queries = load_eval_queries(db, limit=args.queries, labels=labels)
+        if not queries:
+            print("⚠️ Нет размеченных вопросов для оценки")
+            return
+
+        configs = [parse_config_spec(spec) for spec in args.configs]
+        rag = SimpleRAG(os.getenv("GIGACHAT_API_KEY", ""))
+
+        print(f"📊 Оценка {len(configs)} конфигураций на {len(queries)} вопросах...")
+        report = evaluate_configs(rag, db, queries, configs, k=args.k)
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -52,6 +52,9 @@ def create_vector_indexes():
     
     db = SessionLocal()
     try:
+        # Построение индексов дольше DB_STATEMENT_TIMEOUT_MS
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        
         # Создаем IVFFLAT индекс для косинусного расстояния
         print("🔨 Создаем IVFFLAT индекс...")
         db.execute(text("""
@@ -16,6 +16,7 @@ from dotenv import load_dotenv
 load_dotenv('.env.local')
 
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request, Cookie, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -34,18 +35,34 @@ if shared_path.exists():
 # Импортируем shared модули
 try:
     # Пробуем импорт для Docker
-    from shared.models.database import SessionLocal, engine, Base
+    from shared.models.database import SessionLocal, engine, Base, get_pool_stats
     from shared.models import Document, DocumentChunk, Admin, User
     from shared.models.query_log import QueryLog
     from shared.models.menu import MenuSection, MenuItem
     from shared.utils.auth import get_password_hash, verify_password
+    from shared.utils.vector_index import get_index_info, rebuild_vector_index, benchmark_recall
+    from shared.utils.answer_cache import get_answer_cache, invalidate_document_answers
+    from shared.utils.exact_cache import get_exact_cache, bump_corpus_version
+    from shared.utils.chunk_quality import ensure_chunk_quality_schema
+    from shared.utils.fulltext import ensure_fulltext_schema
+    from shared.utils.document_metadata import invalidate_document_metadata
+    from shared.utils.context_expansion import ensure_context_index
+    from shared.utils.user_events import publish_user_invalidation
 except ImportError:
     # Если не получилось, пробуем локальный импорт
-    from models.database import SessionLocal, engine, Base
+    from models.database import SessionLocal, engine, Base, get_pool_stats
     from models import Document, DocumentChunk, Admin, User
     from models.query_log import QueryLog
     from models.menu import MenuSection, MenuItem
     from utils.auth import get_password_hash, verify_password
+    from utils.vector_index import get_index_info, rebuild_vector_index, benchmark_recall
+    from utils.answer_cache import get_answer_cache, invalidate_document_answers
+    from utils.exact_cache import get_exact_cache, bump_corpus_version
+    from utils.chunk_quality import ensure_chunk_quality_schema
+    from utils.fulltext import ensure_fulltext_schema
+    from utils.document_metadata import invalidate_document_metadata
+    from utils.context_expansion import ensure_context_index
+    from utils.user_events import publish_user_invalidation
 
 # Импортируем Celery для обработки документов
 try:
@@ -60,7 +77,7 @@ try:
     # Теперь импортируем celery_app с правильными переменными окружения
     from celery_app import app as celery_app
     # И затем импортируем задачи
-    from tasks import process_document
+    from tasks import process_document, rebuild_vector_index_task
     CELERY_AVAILABLE = True
     
 except ImportError:
@@ -69,6 +86,7 @@ except ImportError:
     AsyncResult = None
     celery_app = None
     process_document = None
+    rebuild_vector_index_task = None
 
 # Настройка логирования
 logging.basicConfig(
@@ -102,6 +120,26 @@ async def startup_event():
     Base.metadata.create_all(bind=engine)
     logger.info("База данных инициализирована")
     
+    # Колонки chunk_type и content_tsv для баз, созданных до их появления
+    db = SessionLocal()
+    try:
+        ensure_chunk_quality_schema(db)
+    except Exception as e:
+        logger.error(f"Ошибка классификации чанков: {e}")
+        db.rollback()
+    try:
+        ensure_fulltext_schema(db)
+    except Exception as e:
+        logger.error(f"Ошибка создания полнотекстового индекса: {e}")
+        db.rollback()
+    try:
+        ensure_context_index(db)
+    except Exception as e:
+        logger.error(f"Ошибка создания индекса соседних чанков: {e}")
+        db.rollback()
+    finally:
+        db.close()
+    
     # Создаем администратора по умолчанию, если его нет
     db = SessionLocal()
     try:
@@ -460,6 +498,9 @@ async def delete_document(document_id: int, request: Request, db: Session = Depe
             if doc_result.rowcount > 0:
                 db.commit()
                 logger.info(f"Документ {document_id} успешно удален")
+                invalidate_document_answers(document_id)
+                invalidate_document_metadata(document_id)
+                bump_corpus_version()
                 return RedirectResponse(url="/documents?success=deleted", status_code=303)
             else:
                 logger.error(f"Не удалось удалить документ {document_id} из базы данных")
@@ -592,8 +633,10 @@ async def delete_user(user_id: int, request: Request, db: Session = Depends(get_
             logger.warning(f"Ошибка удаления логов пользователя {user_id}: {str(e)}")
         
         # Теперь удаляем пользователя
+        telegram_id = user.telegram_id
         db.delete(user)
         db.commit()
+        publish_user_invalidation(telegram_id)
         
         logger.info(f"Администратор {admin.username} удалил пользователя {user_id}: {user_info}")
         
@@ -621,6 +664,7 @@ async def block_user(user_id: int, request: Request, db: Session = Depends(get_d
         
         user.is_active = False
         db.commit()
+        publish_user_invalidation(user.telegram_id)
         
         return RedirectResponse(url="/users?success=blocked", status_code=303)
         
@@ -645,6 +689,7 @@ async def unblock_user(user_id: int, request: Request, db: Session = Depends(get
         
         user.is_active = True
         db.commit()
+        publish_user_invalidation(user.telegram_id)
         
         return RedirectResponse(url="/users?success=unblocked", status_code=303)
         
@@ -880,6 +925,96 @@ async def get_document_status_api(document_id: int, db: Session = Depends(get_db
         return {"error": "Ошибка получения статуса"}
 
 
+@app.get("/api/vector-index")
+async def get_vector_index_api(db: Session = Depends(get_db), admin: Admin = Depends(require_auth)):
+    """API для получения информации о векторном индексе"""
+    try:
+        return get_index_info(db)
+    except Exception as e:
+        logger.error(f"Ошибка получения информации о векторном индексе: {str(e)}")
+        return {"error": "Ошибка получения информации об индексе"}
+
+
+@app.post("/api/vector-index/reindex")
+async def reindex_vector_index_api(
+    index_type: Optional[str] = None,
+    db: Session = Depends(get_db),
+    admin: Admin = Depends(require_auth)
+):
+    """API для перестроения векторного индекса (после массовой загрузки документов)"""
+    try:
+        if CELERY_AVAILABLE and rebuild_vector_index_task:
+            task = rebuild_vector_index_task.delay(index_type)
+            logger.info(f"Перестроение векторного индекса запущено администратором {admin.username}. Task ID: {task.id}")
+            return {"status": "queued", "task_id": task.id}
+        
+        # Без Celery перестраиваем в пуле потоков, не блокируя цикл событий
+        info = await run_in_threadpool(rebuild_vector_index, db, index_type)
+        return {"status": "completed", "index": info}
+        
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Ошибка перестроения векторного индекса: {str(e)}")
+        return {"error": "Ошибка перестроения индекса"}
+
+
+@app.get("/api/vector-index/benchmark")
+async def benchmark_vector_index_api(
+    k: int = 10,
+    sample_size: int = 50,
+    db: Session = Depends(get_db),
+    admin: Admin = Depends(require_auth)
+):
+    """API для замера recall@k индекса относительно точного поиска"""
+    try:
+        # Точный поиск по выборке долгий, выполняется в пуле потоков
+        return await run_in_threadpool(benchmark_recall, db, k=k, sample_size=min(sample_size, 500))
+    except Exception as e:
+        logger.error(f"Ошибка бенчмарка векторного индекса: {str(e)}")
+        return {"error": "Ошибка бенчмарка индекса"}
+
+
+@app.get("/api/db-pool")
+async def get_db_pool_api(admin: Admin = Depends(require_auth)):
+    """API для заполненности пулов соединений с БД (занятые, ожидающие, сверх пула)"""
+    return get_pool_stats()
+
+
+@app.get("/api/answer-cache")
+async def get_answer_cache_api(admin: Admin = Depends(require_auth)):
+    """API для статистики кэша ответов (доля попаданий, сэкономленное время)"""
+    cache = get_answer_cache()
+    exact_cache = get_exact_cache()
+    try:
+        stats = {"enabled": cache is not None}
+        if cache is not None:
+            stats.update(cache.get_stats())
+        stats["exact"] = exact_cache.get_stats() if exact_cache is not None else {"enabled": False}
+        return stats
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики кэша ответов: {str(e)}")
+        return {"error": "Ошибка получения статистики кэша"}
+
+
+@app.post("/api/answer-cache/clear")
+async def clear_answer_cache_api(admin: Admin = Depends(require_auth)):
+    """API для полной очистки кэша ответов"""
+    cache = get_answer_cache()
+    if cache is None and get_exact_cache() is None:
+        return {"enabled": False}
+    try:
+        if cache is not None:
+            cache.clear()
+        # Кэш точных совпадений сбрасывается сменой версии корпуса
+        bump_corpus_version()
+        logger.info(f"Кэш ответов очищен администратором {admin.username}")
+        return {"status": "cleared"}
+    except Exception as e:
+        logger.error(f"Ошибка очистки кэша ответов: {str(e)}")
+        return {"error": "Ошибка очистки кэша"}
+
+
 @app.get("/documents/{document_id}/download")
 async def download_document(
     document_id: int, 
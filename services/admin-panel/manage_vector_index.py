@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Управление векторным индексом document_chunks.embedding_vector
+
+Использование:
+    python manage_vector_index.py info
+    python manage_vector_index.py reindex [--type hnsw|ivfflat]
+    python manage_vector_index.py benchmark [--k 10] [--samples 50]
+    python manage_vector_index.py classify [--all]
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# Добавляем путь к services
+services_path = Path(__file__).parent.parent
+sys.path.append(str(services_path))
+
+# Загружаем переменные окружения
+from dotenv import load_dotenv
+load_dotenv('.env.local')
+
+from shared.models.database import SessionLocal
+from shared.utils.vector_index import get_index_info, rebuild_vector_index, benchmark_recall, needs_rebuild
+from shared.utils.chunk_quality import ensure_chunk_quality_schema, backfill_chunk_types
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Управление векторным индексом")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("info", help="Показать текущий индекс")
+
+    reindex_parser = subparsers.add_parser("reindex", help="Перестроить индекс")
+    reindex_parser.add_argument("--type", choices=["hnsw", "ivfflat"], default=None,
+                                help="Тип индекса (по умолчанию VECTOR_INDEX_TYPE)")
+    reindex_parser.add_argument("--if-needed", action="store_true",
+                                help="Перестроить только если индекс устарел")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Замерить recall@k относительно точного поиска")
+    benchmark_parser.add_argument("--k", type=int, default=10)
+    benchmark_parser.add_argument("--samples", type=int, default=50)
+
+    classify_parser = subparsers.add_parser("classify", help="Классифицировать чанки (chunk_type)")
+    classify_parser.add_argument("--all", action="store_true",
+                                 help="Переклассифицировать все чанки, а не только новые")
+
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "info":
+            info = get_index_info(db)
+            info["needs_rebuild"] = needs_rebuild(info)
+            print("🔍 Векторный индекс:")
+            print(json.dumps(info, ensure_ascii=False, indent=2, default=str))
+
+        elif args.command == "reindex":
+            if args.if_needed and not needs_rebuild(get_index_info(db)):
+                print("✅ Индекс актуален, перестроение не требуется")
+                return
+            print("🔄 Перестраиваем векторный индекс...")
+            info = rebuild_vector_index(db, args.type)
+            print(f"✅ Индекс перестроен за {info['rebuild_seconds']} с")
+            print(json.dumps(info, ensure_ascii=False, indent=2, default=str))
+
+        elif args.command == "benchmark":
+            print(f"📊 Бенчмарк recall@{args.k} на {args.samples} запросах...")
+            report = benchmark_recall(db, k=args.k, sample_size=args.samples)
+            print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+
+        elif args.command == "classify":
+            print("🏷️ Классифицируем чанки...")
+            report = ensure_chunk_quality_schema(db)
+            if args.all:
+                report = backfill_chunk_types(db, reclassify=True)
+            print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,11 +15,10 @@ current_dir = Path(__file__).parent
 services_dir = current_dir.parent
 sys.path.insert(0, str(services_dir))
 
-from sqlalchemy.orm import sessionmaker
-
-# Импортируем shared модули
-from shared.models.database import engine
+# Импортируем shared модули (общий движок и пул соединений процесса)
+from shared.models.database import SessionLocal
 from shared.models import Document, DocumentChunk
+from shared.utils.vector_index import get_index_info, needs_rebuild, rebuild_vector_index
 
 # Импортируем ЕДИНЫЙ процессор документов
 from document_processor_unified import process_document_unified
@@ -27,9 +26,6 @@ from document_processor_unified import process_document_unified
 # Импортируем Celery app
 from celery_app import app
 
-# Создаем сессию базы данных
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -54,6 +50,7 @@ def process_document(self, document_id: int):
         
         if result["status"] == "completed":
             logger.info(f"Celery task: документ {document_id} успешно обработан. Создано {result['chunks_created']} чанков")
+            schedule_vector_index_rebuild()
         else:
             logger.error(f"Celery task: ошибка обработки документа {document_id}: {result.get('error', 'Unknown error')}")
         
@@ -70,6 +67,39 @@ def process_document(self, document_id: int):
         }
 
 
+def schedule_vector_index_rebuild():
+    """Ставит перестроение векторного индекса в очередь, если корпус заметно вырос"""
+    db = SessionLocal()
+    try:
+        info = get_index_info(db)
+        if needs_rebuild(info):
+            logger.info(f"Векторный индекс устарел ({info.get('definition')}), ставим перестроение в очередь")
+            rebuild_vector_index_task.delay()
+    except Exception as e:
+        logger.warning(f"Не удалось проверить состояние векторного индекса: {str(e)}")
+    finally:
+        db.close()
+
+
+@app.task(name='tasks.rebuild_vector_index')
+def rebuild_vector_index_task(index_type: Optional[str] = None):
+    """
+    Перестроение векторного индекса document_chunks.embedding_vector
+    """
+    db = SessionLocal()
+    
+    try:
+        info = rebuild_vector_index(db, index_type)
+        return {"status": "completed", "index": info}
+        
+    except Exception as e:
+        logger.error(f"Ошибка перестроения векторного индекса: {str(e)}")
+        return {"status": "failed", "error": str(e)}
+        
+    finally:
+        db.close()
+
+
 @app.task
 def cleanup_failed_documents():
     """
@@ -47,6 +47,9 @@ class DocumentChunk(Base):
     content_length = Column(Integer, nullable=False, index=True)
     embedding_vector = Column(Vector(312), nullable=True)  # pgvector эмбеддинг
     chunk_metadata = Column(Text, nullable=True)  # JSON метаданные
+    chunk_type = Column(String(20), nullable=True, index=True)  # content / appendix / title_page / boilerplate
+    # content_tsv (tsvector, GENERATED из content) создается в init.sql / fulltext.ensure_fulltext_schema
+    # и не отображается в модель, чтобы не читать его вместе с чанками
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
     
     # Связи
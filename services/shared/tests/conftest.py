@@ -0,0 +1,13 @@
+"""
+Общие настройки тестов shared
+
+Модули utils импортируются напрямую (как в fallback-импортах самих модулей),
+чтобы не загружать utils/__init__ с моделью эмбеддингов.
+"""
+
+import sys
+from pathlib import Path
+
+UTILS_DIR = Path(__file__).resolve().parent.parent / "utils"
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
@@ -0,0 +1,30 @@
+"""Тесты классификации чанков при загрузке (chunk_quality)"""
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from chunk_quality import (
+    CHUNK_TYPE_APPENDIX,
+    CHUNK_TYPE_CONTENT,
+    CHUNK_TYPE_TITLE_PAGE,
+    classify_chunk,
+)
+
+
+def test_regulation_header_is_title_page():
+    content = "ПОЛОЖЕНИЕ\nо порядке предоставления ежегодных отпусков работникам"
+    assert classify_chunk(content) == CHUNK_TYPE_TITLE_PAGE
+
+
+def test_regulation_mentioned_in_body_stays_content():
+    content = (
+        "Отпуск предоставляется по графику отпусков. " * 10
+        + "Порядок переноса определяется в соответствии с положением о персонале."
+    )
+    assert classify_chunk(content) == CHUNK_TYPE_CONTENT
+
+
+def test_appendix_takes_precedence_over_header():
+    content = "Приложение 1 к Положению о оплате труда"
+    assert classify_chunk(content) == CHUNK_TYPE_APPENDIX
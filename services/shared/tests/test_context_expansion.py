@@ -0,0 +1,73 @@
+"""Тесты склейки соседних чанков без перекрытия (context_expansion)"""
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from context_expansion import GAP_SEPARATOR, merge_chunk_texts, strip_overlap
+
+
+def _words(start: int, count: int) -> str:
+    return " ".join(f"слово{index}" for index in range(start, start + count))
+
+
+def test_no_overlap_keeps_text():
+    previous = _words(0, 30)
+    current = _words(100, 30)
+
+    assert strip_overlap(previous, current) == current
+
+
+def test_overlap_is_removed():
+    previous = _words(0, 30)
+    current = _words(20, 30)
+
+    assert strip_overlap(previous, current) == _words(30, 20)
+
+
+def test_full_overlap_leaves_nothing():
+    previous = _words(0, 30)
+    current = _words(15, 15)
+
+    assert strip_overlap(previous, current) == ""
+
+
+def test_overlap_exactly_at_window_edge_is_removed():
+    overlap = _words(50, 10)
+    previous = _words(0, 20) + " " + overlap
+    current = overlap + " " + _words(60, 5)
+
+    assert strip_overlap(previous, current, max_overlap=len(overlap)) == _words(60, 5)
+
+
+def test_overlap_longer_than_window_is_kept():
+    overlap = _words(50, 10)
+    previous = _words(0, 20) + " " + overlap
+    current = overlap + " " + _words(60, 5)
+
+    assert strip_overlap(previous, current, max_overlap=len(overlap) - 1) == current
+
+
+def test_short_match_is_not_treated_as_overlap():
+    previous = _words(0, 10) + " и"
+    current = "и " + _words(100, 10)
+
+    assert strip_overlap(previous, current) == current
+
+
+def test_merge_adjacent_chunks_without_repeats():
+    merged = merge_chunk_texts([(1, _words(0, 30)), (2, _words(20, 30))])
+
+    assert merged == _words(0, 50)
+
+
+def test_merge_separates_gaps():
+    merged = merge_chunk_texts([(1, _words(0, 5)), (4, _words(100, 5))])
+
+    assert merged == _words(0, 5) + GAP_SEPARATOR + _words(100, 5)
+
+
+def test_merge_skips_fully_repeated_chunk():
+    merged = merge_chunk_texts([(1, _words(0, 30)), (2, _words(10, 20)), (3, _words(30, 5))])
+
+    assert merged == _words(0, 35)
@@ -0,0 +1,68 @@
+"""Тесты упаковки контекста в бюджет токенов (context_packer)"""
+
+from context_packer import SOURCE_HEADER_TOKENS, estimate_tokens, pack_context
+
+
+def _text(topic: str, words: int = 120) -> str:
+    # Уникальные слова темы: фрагменты разных тем не пересекаются по словам
+    return " ".join(f"{topic}{index:03d}" for index in range(words)) + "."
+
+
+def _chunk(chunk_id: int, content: str, score: float) -> dict:
+    return {'id': chunk_id, 'content': content, 'content_length': len(content), 'fusion_score': score}
+
+
+def _cost(content: str) -> int:
+    return estimate_tokens(content) + SOURCE_HEADER_TOKENS
+
+
+def test_total_tokens_stay_within_budget():
+    chunks = [_chunk(chunk_id, _text(f"тема{chunk_id}"), 1.0 - chunk_id / 10) for chunk_id in range(6)]
+    budget = 2 * _cost(chunks[0]['content']) + 200
+
+    packed = pack_context(chunks, token_budget=budget, mmr_lambda=0.7)
+
+    assert sum(chunk['context_tokens'] for chunk in packed) <= budget
+    assert 0 < len(packed) < len(chunks)
+    # Последний фрагмент обрезан под остаток бюджета
+    assert packed[-1].get('truncated') is True
+    assert packed[-1]['content_length'] == len(packed[-1]['content'])
+
+
+def test_near_duplicates_are_skipped_for_diverse_chunks():
+    original = _text("отпуск")
+    duplicate = original.replace("отпуск000", "отпуск999")
+    chunks = [
+        _chunk(1, original, 1.0),
+        _chunk(2, duplicate, 0.95),
+        _chunk(3, _text("премия"), 0.6)
+    ]
+    # Помещаются два фрагмента, на третий остатка не хватает даже для обрезки
+    budget = 2 * _cost(original) + 20
+
+    packed = pack_context(chunks, token_budget=budget, mmr_lambda=0.7)
+
+    assert [chunk['id'] for chunk in packed] == [1, 3]
+
+
+def test_first_chunk_is_most_relevant():
+    chunks = [_chunk(1, _text("а"), 0.4), _chunk(2, _text("б"), 0.9), _chunk(3, _text("в"), 0.7)]
+
+    packed = pack_context(chunks, token_budget=10_000, mmr_lambda=0.5)
+
+    assert packed[0]['id'] == 2
+    assert {chunk['id'] for chunk in packed} == {1, 2, 3}
+
+
+def test_first_chunk_is_kept_even_if_budget_is_small():
+    chunks = [_chunk(1, _text("договор", words=400), 1.0), _chunk(2, _text("график"), 0.5)]
+
+    packed = pack_context(chunks, token_budget=60, mmr_lambda=0.7)
+
+    assert [chunk['id'] for chunk in packed] == [1]
+    assert packed[0]['truncated'] is True
+    assert packed[0]['context_tokens'] <= 60
+
+
+def test_empty_input():
+    assert pack_context([], token_budget=100) == []
@@ -0,0 +1,37 @@
+"""Тесты построения полнотекстового запроса (fulltext)"""
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from fulltext import SYNONYMS, build_fulltext_query, find_synonym_groups
+
+
+def _query_terms(question: str) -> set:
+    # Ключевые слова из групп синонимов - как в SimpleRAG._extract_keywords
+    keywords = []
+    for group, word in find_synonym_groups(question.lower()).items():
+        keywords.extend([group, word])
+    return set(build_fulltext_query(keywords).split(" OR "))
+
+
+def test_when_question_does_not_expand_date_group():
+    terms = _query_terms("когда выплачивается зарплата")
+
+    assert 'срок' not in terms and 'период' not in terms
+    assert not set(SYNONYMS['дата']) & terms
+    # Содержательная группа по-прежнему раскрывается
+    assert 'зарплата' in terms and '"оплата труда"' in terms
+
+
+def test_how_much_question_does_not_expand_size_group():
+    terms = _query_terms("сколько дней отпуска положено")
+
+    assert not set(SYNONYMS['размер']) & terms
+    assert 'отпуск' in terms
+
+
+def test_explicit_group_word_still_expands():
+    terms = _query_terms("какая дата выплаты")
+
+    assert {'дата', 'срок', 'период'} <= terms
@@ -0,0 +1,123 @@
+"""Тесты объединения результатов ретриверов (rank_fusion)"""
+
+import pytest
+
+from rank_fusion import FusionConfig, fuse, rrf_scores, zscore_scores
+
+
+def _chunk(chunk_id: int, similarity: float = 0.5) -> dict:
+    return {'id': chunk_id, 'similarity': similarity, 'content': f"чанк {chunk_id}"}
+
+
+def _config(**kwargs) -> FusionConfig:
+    weights = kwargs.pop('weights', {'vector': 1.0, 'text': 0.5})
+    budgets = kwargs.pop('budgets', {'vector': 10.0, 'text': 10.0})
+    return FusionConfig(weights=weights, budgets=budgets, **kwargs)
+
+
+class TestReciprocalRankFusion:
+    def test_scores_sum_weighted_reciprocal_ranks(self):
+        config = _config(rrf_k=60)
+        ranked = {
+            'vector': [(_chunk(1), 0.9), (_chunk(2), 0.8)],
+            'text': [(_chunk(2), 3.0), (_chunk(3), 1.0)]
+        }
+
+        scores = rrf_scores(ranked, config)
+
+        assert scores[1] == pytest.approx(1.0 / 61)
+        assert scores[2] == pytest.approx(1.0 / 62 + 0.5 / 61)
+        assert scores[3] == pytest.approx(0.5 / 62)
+
+    def test_chunk_found_by_several_retrievers_ranks_first(self):
+        ranked = {
+            'vector': [(_chunk(1), 0.9), (_chunk(2), 0.8)],
+            'text': [(_chunk(2), 3.0)]
+        }
+
+        fused = fuse(ranked, _config(), limit=10)
+
+        assert [chunk['id'] for chunk in fused] == [2, 1]
+        assert fused[0]['retrievers'] == ['vector', 'text']
+        assert fused[0]['search_type'] == 'vector'
+
+    def test_empty_lists(self):
+        assert rrf_scores({}, _config()) == {}
+        assert fuse({}, _config(), limit=5) == []
+        assert fuse({'vector': [], 'text': []}, _config(), limit=5) == []
+
+    def test_single_retriever_keeps_its_order(self):
+        ranked = {'text': [(_chunk(3), 5.0), (_chunk(1), 2.0), (_chunk(2), 1.0)]}
+
+        fused = fuse(ranked, _config(), limit=10)
+
+        assert [chunk['id'] for chunk in fused] == [3, 1, 2]
+        assert all(chunk['search_type'] == 'text' for chunk in fused)
+        assert fused[0]['fusion_score'] == pytest.approx(0.5 / 61, abs=1e-6)
+
+    def test_unknown_method_falls_back_to_rrf(self):
+        ranked = {'vector': [(_chunk(1), 0.9), (_chunk(2), 0.8)]}
+
+        fused = fuse(ranked, _config(method='unknown'), limit=10)
+
+        assert [chunk['id'] for chunk in fused] == [1, 2]
+
+
+class TestZScoreFusion:
+    def test_constant_scores_do_not_divide_by_zero(self):
+        ranked = {'vector': [(_chunk(1), 0.7), (_chunk(2), 0.7), (_chunk(3), 0.7)]}
+
+        scores = zscore_scores(ranked, _config(method='zscore'))
+
+        # Нулевое отклонение - все z-оценки 0, вклад ретривера равен весу
+        assert scores == {1: pytest.approx(1.0), 2: pytest.approx(1.0), 3: pytest.approx(1.0)}
+
+    def test_single_candidate_keeps_retriever_weight(self):
+        scores = zscore_scores({'text': [(_chunk(5), 12.0)]}, _config(method='zscore'))
+
+        assert scores == {5: pytest.approx(0.5)}
+
+    def test_scales_of_retrievers_are_normalized(self):
+        ranked = {
+            'vector': [(_chunk(1), 0.9), (_chunk(2), 0.1)],
+            'text': [(_chunk(2), 1000.0), (_chunk(1), 0.0)]
+        }
+        config = _config(method='zscore', weights={'vector': 1.0, 'text': 1.0})
+
+        scores = zscore_scores(ranked, config)
+
+        # Большая шкала text не перевешивает: z-оценки обоих ретриверов равны +-1
+        assert scores[1] == pytest.approx(scores[2])
+
+    def test_empty_retriever_is_skipped(self):
+        assert zscore_scores({'vector': []}, _config(method='zscore')) == {}
+
+
+class TestBudgets:
+    def test_budget_is_share_of_limit_rounded_up(self):
+        config = _config(budgets={'vector': 1.5, 'fuzzy': 0.5})
+
+        assert config.budget('vector', 10) == 15
+        assert config.budget('fuzzy', 5) == 3
+        # Неизвестный ретривер получает limit
+        assert config.budget('text', 7) == 7
+
+    def test_budget_is_at_least_one(self):
+        assert _config(budgets={'salary_specific': 0.2}).budget('salary_specific', 1) == 1
+
+    def test_fuse_truncates_each_retriever_to_its_budget(self):
+        config = _config(budgets={'vector': 0.5, 'text': 10.0})
+        ranked = {
+            'vector': [(_chunk(chunk_id), 1.0 - chunk_id / 10) for chunk_id in range(1, 6)],
+            'text': [(_chunk(9), 1.0)]
+        }
+
+        fused = fuse(ranked, config, limit=4)
+
+        # Бюджет vector = ceil(4 * 0.5) = 2: кандидаты 3-5 не участвуют
+        assert {chunk['id'] for chunk in fused} == {1, 2, 9}
+
+    def test_result_is_cut_to_limit(self):
+        ranked = {'vector': [(_chunk(chunk_id), 1.0) for chunk_id in range(1, 11)]}
+
+        assert len(fuse(ranked, _config(), limit=3)) == 3
@@ -0,0 +1,401 @@
+"""
+Семантический кэш ответов RAG
+- Новый вопрос сопоставляется с закэшированными по косинусной близости эмбеддингов
+- Хранилище Redis (общее для процессов) с TTL и LRU-вытеснением,
+  либо память процесса, если Redis не настроен
+- Если Redis настроен, но недоступен, кэш отключается до следующей попытки
+  подключения: иначе инвалидация из админ-панели не дошла бы до бота
+- Записи удаляются при переобработке или удалении документа, использованного в ответе
+- Статистика: доля попаданий и сэкономленное время
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Iterable
+
+import numpy as np
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_REDIS_URL = os.getenv("ANSWER_CACHE_REDIS_URL") or os.getenv("REDIS_URL", "")
+# Через сколько секунд повторить подключение к недоступному Redis
+ANSWER_CACHE_RETRY_SECONDS = int(os.getenv("ANSWER_CACHE_RETRY_SECONDS", "60"))
+
+KEY_PREFIX = "answer_cache"
+
+
+def _json_default(value):
+    """Сериализация numpy-скаляров и дат в JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _normalize(embedding) -> Optional[np.ndarray]:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if vector.size == 0 or norm == 0:
+        return None
+    return vector / norm
+
+
+class SemanticAnswerCache:
+    """
+    Кэш ответов с поиском по смыслу вопроса
+
+    В Redis хранятся:
+        answer_cache:entry:{id}  - JSON ответа (TTL)
+        answer_cache:emb:{id}    - эмбеддинг вопроса float32 (TTL)
+        answer_cache:lru         - sorted set id -> время последнего обращения
+        answer_cache:doc:{doc}   - множество id записей, использующих документ
+        answer_cache:version     - счетчик изменений (для синхронизации локальной матрицы)
+        answer_cache:stats       - счетчики попаданий/промахов всех процессов
+
+    Поиск ближайшего вопроса выполняется по локальной копии эмбеддингов,
+    которая перечитывается только при изменении answer_cache:version.
+    """
+
+    def __init__(self, redis_url: str = ANSWER_CACHE_REDIS_URL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: int = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._redis = self._connect_redis(redis_url)
+
+        # Локальные эмбеддинги: id -> вектор (копия Redis или основное хранилище)
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[str] = []
+        self._version: Optional[int] = None
+
+        # Хранилище в памяти процесса (без Redis): id -> (expires_at, payload, document_ids)
+        self._entries: Dict[str, tuple] = {}
+
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidated': 0,
+                       'saved_seconds': 0.0, 'lookup_seconds': 0.0}
+
+    def _connect_redis(self, redis_url: str):
+        """Клиент Redis; ошибка подключения пробрасывается (см. get_answer_cache)"""
+        if not redis_url:
+            logger.info("Кэш ответов: хранилище в памяти процесса")
+            return None
+        if redis is None:
+            raise RuntimeError("пакет redis не установлен")
+        client = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+        client.ping()
+        logger.info("🗄️ Кэш ответов: хранилище Redis")
+        return client
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "memory"
+
+    # ------------------------------------------------------------------
+    # Локальная матрица эмбеддингов
+    # ------------------------------------------------------------------
+
+    def _rebuild_matrix(self):
+        self._matrix_ids = list(self._embeddings.keys())
+        if self._matrix_ids:
+            self._matrix = np.vstack([self._embeddings[i] for i in self._matrix_ids])
+        else:
+            self._matrix = None
+
+    def _sync_from_redis(self):
+        """Перечитывает эмбеддинги, если кэш менялся в другом процессе"""
+        version = int(self._redis.get(f"{KEY_PREFIX}:version") or 0)
+        if version == self._version:
+            return
+
+        ids = [i.decode() for i in self._redis.zrange(f"{KEY_PREFIX}:lru", 0, -1)]
+        known = {i: self._embeddings[i] for i in ids if i in self._embeddings}
+        missing = [i for i in ids if i not in known]
+        if missing:
+            raw = self._redis.mget([f"{KEY_PREFIX}:emb:{i}" for i in missing])
+            for entry_id, value in zip(missing, raw):
+                if value:
+                    known[entry_id] = np.frombuffer(value, dtype=np.float32)
+
+        self._embeddings = OrderedDict((i, known[i]) for i in ids if i in known)
+        self._rebuild_matrix()
+        self._version = version
+
+    def _nearest(self, vector: np.ndarray) -> Optional[tuple]:
+        if self._matrix is None:
+            return None
+        similarities = self._matrix @ vector
+        best = int(np.argmax(similarities))
+        return self._matrix_ids[best], float(similarities[best])
+
+    # ------------------------------------------------------------------
+    # Публичный API
+    # ------------------------------------------------------------------
+
+    def lookup(self, question_embedding) -> Optional[Dict[str, Any]]:
+        """
+        Поиск ответа на близкий по смыслу вопрос
+
+        Returns:
+            Dict: Закэшированный результат answer_question (с полем 'cache')
+            или None при промахе
+        """
+        vector = _normalize(question_embedding)
+        if vector is None:
+            return None
+
+        start_time = time.perf_counter()
+        try:
+            with self._lock:
+                if self._redis is not None:
+                    self._sync_from_redis()
+                nearest = self._nearest(vector)
+
+            payload = None
+            if nearest and nearest[1] >= self.threshold:
+                payload = self._load_payload(nearest[0])
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша ответов: {e}")
+            nearest, payload = None, None
+
+        lookup_time = time.perf_counter() - start_time
+        self._stats['lookup_seconds'] += lookup_time
+
+        if payload is None:
+            self._count('misses')
+            return None
+
+        entry_id, similarity = nearest
+        original_time = payload.get('telemetry', {}).get('total_time', 0.0)
+        self._count('hits', saved_seconds=max(0.0, original_time - lookup_time))
+
+        payload['cache'] = {
+            'hit': True,
+            'type': 'semantic',
+            'similarity': round(similarity, 4),
+            'cached_question': payload.pop('cached_question', None),
+            'lookup_ms': round(lookup_time * 1000, 2)
+        }
+        logger.info(f"⚡ Кэш ответов: попадание (similarity={similarity:.3f}, {lookup_time * 1000:.1f} мс)")
+        return payload
+
+    def _load_payload(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        if self._redis is not None:
+            raw = self._redis.get(f"{KEY_PREFIX}:entry:{entry_id}")
+            if raw is None:
+                # Запись истекла по TTL - убираем из индекса
+                self._remove_ids([entry_id])
+                return None
+            self._redis.zadd(f"{KEY_PREFIX}:lru", {entry_id: time.time()})
+            return json.loads(raw)
+
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None or entry[0] < time.time():
+                self._drop_local(entry_id)
+                return None
+            self._embeddings.move_to_end(entry_id)
+            return json.loads(entry[1])
+
+    def store(self, question: str, question_embedding, result: Dict[str, Any],
+              document_ids: Iterable[int]):
+        """
+        Сохранение успешного ответа
+
+        Args:
+            question: Исходный вопрос
+            question_embedding: Эмбеддинг вопроса
+            result: Результат answer_question
+            document_ids: Документы, использованные в ответе (для инвалидации)
+        """
+        vector = _normalize(question_embedding)
+        if vector is None:
+            return
+
+        entry_id = uuid.uuid4().hex
+        document_ids = sorted({int(d) for d in document_ids})
+        payload = dict(result)
+        payload['cached_question'] = question
+        payload['cached_at'] = time.time()
+        raw = json.dumps(payload, ensure_ascii=False, default=_json_default)
+
+        try:
+            if self._redis is not None:
+                self._store_redis(entry_id, vector, raw, document_ids)
+            else:
+                self._store_local(entry_id, vector, raw, document_ids)
+            self._count('stores')
+        except Exception as e:
+            logger.warning(f"Ошибка записи в кэш ответов: {e}")
+
+    def _store_redis(self, entry_id: str, vector: np.ndarray, raw: str, document_ids: List[int]):
+        pipe = self._redis.pipeline()
+        pipe.set(f"{KEY_PREFIX}:entry:{entry_id}", raw, ex=self.ttl)
+        pipe.set(f"{KEY_PREFIX}:emb:{entry_id}", vector.astype(np.float32).tobytes(), ex=self.ttl)
+        pipe.zadd(f"{KEY_PREFIX}:lru", {entry_id: time.time()})
+        for document_id in document_ids:
+            pipe.sadd(f"{KEY_PREFIX}:doc:{document_id}", entry_id)
+            pipe.expire(f"{KEY_PREFIX}:doc:{document_id}", self.ttl)
+        pipe.incr(f"{KEY_PREFIX}:version")
+        pipe.execute()
+
+        # LRU: удаляем давно не использованные записи сверх лимита
+        overflow = self._redis.zcard(f"{KEY_PREFIX}:lru") - self.max_entries
+        if overflow > 0:
+            evicted = [i.decode() for i in self._redis.zrange(f"{KEY_PREFIX}:lru", 0, overflow - 1)]
+            self._remove_ids(evicted)
+
+    def _store_local(self, entry_id: str, vector: np.ndarray, raw: str, document_ids: List[int]):
+        with self._lock:
+            self._entries[entry_id] = (time.time() + self.ttl, raw, document_ids)
+            self._embeddings[entry_id] = vector
+            while len(self._embeddings) > self.max_entries:
+                oldest = next(iter(self._embeddings))
+                self._drop_local(oldest)
+            self._rebuild_matrix()
+
+    def _drop_local(self, entry_id: str):
+        self._entries.pop(entry_id, None)
+        if self._embeddings.pop(entry_id, None) is not None:
+            self._rebuild_matrix()
+
+    def _remove_ids(self, entry_ids: List[str]):
+        if not entry_ids:
+            return
+        pipe = self._redis.pipeline()
+        for entry_id in entry_ids:
+            pipe.delete(f"{KEY_PREFIX}:entry:{entry_id}", f"{KEY_PREFIX}:emb:{entry_id}")
+        pipe.zrem(f"{KEY_PREFIX}:lru", *entry_ids)
+        pipe.incr(f"{KEY_PREFIX}:version")
+        pipe.execute()
+
+    def invalidate_document(self, document_id: int) -> int:
+        """
+        Удаление ответов, использующих документ
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        try:
+            if self._redis is not None:
+                doc_key = f"{KEY_PREFIX}:doc:{document_id}"
+                entry_ids = [i.decode() for i in self._redis.smembers(doc_key)]
+                self._remove_ids(entry_ids)
+                self._redis.delete(doc_key)
+            else:
+                with self._lock:
+                    entry_ids = [i for i, entry in self._entries.items() if document_id in entry[2]]
+                    for entry_id in entry_ids:
+                        self._drop_local(entry_id)
+        except Exception as e:
+            logger.warning(f"Ошибка инвалидации кэша ответов для документа {document_id}: {e}")
+            return 0
+
+        if entry_ids:
+            self._count('invalidated', amount=len(entry_ids))
+            logger.info(f"🗑️ Кэш ответов: удалено {len(entry_ids)} записей документа {document_id}")
+        return len(entry_ids)
+
+    def clear(self):
+        """Полная очистка кэша"""
+        if self._redis is not None:
+            keys = list(self._redis.scan_iter(f"{KEY_PREFIX}:*"))
+            if keys:
+                self._redis.delete(*keys)
+        with self._lock:
+            self._entries.clear()
+            self._embeddings.clear()
+            self._rebuild_matrix()
+            self._version = None
+
+    # ------------------------------------------------------------------
+    # Статистика
+    # ------------------------------------------------------------------
+
+    def _count(self, name: str, amount: int = 1, saved_seconds: float = 0.0):
+        self._stats[name] += amount
+        self._stats['saved_seconds'] += saved_seconds
+        if self._redis is not None:
+            try:
+                pipe = self._redis.pipeline()
+                pipe.hincrby(f"{KEY_PREFIX}:stats", name, amount)
+                if saved_seconds:
+                    pipe.hincrbyfloat(f"{KEY_PREFIX}:stats", 'saved_seconds', saved_seconds)
+                pipe.execute()
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Доля попаданий и сэкономленное время (по всем процессам при Redis)"""
+        stats = dict(self._stats)
+        if self._redis is not None:
+            try:
+                shared = {k.decode(): float(v) for k, v in self._redis.hgetall(f"{KEY_PREFIX}:stats").items()}
+                for name in ('hits', 'misses', 'stores', 'invalidated', 'saved_seconds'):
+                    stats[name] = shared.get(name, 0)
+                stats['entries'] = self._redis.zcard(f"{KEY_PREFIX}:lru")
+            except Exception as e:
+                stats['error'] = str(e)
+        else:
+            stats['entries'] = len(self._entries)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['saved_seconds'] = round(stats['saved_seconds'], 2)
+        stats['avg_lookup_ms'] = round(self._stats['lookup_seconds'] / max(1, self._stats['hits'] + self._stats['misses']) * 1000, 2)
+        stats.pop('lookup_seconds', None)
+        stats['backend'] = self.backend
+        stats['threshold'] = self.threshold
+        stats['ttl'] = self.ttl
+        return stats
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_lock = threading.Lock()
+_retry_at = 0.0
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """
+    Общий кэш ответов процесса
+
+    None, если ANSWER_CACHE_ENABLED=false или настроенный Redis недоступен
+    (повторное подключение - не чаще раза в ANSWER_CACHE_RETRY_SECONDS).
+    """
+    global _cache, _retry_at
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _cache is None and time.monotonic() >= _retry_at:
+        with _cache_lock:
+            if _cache is None and time.monotonic() >= _retry_at:
+                try:
+                    _cache = SemanticAnswerCache()
+                except Exception as e:
+                    _retry_at = time.monotonic() + ANSWER_CACHE_RETRY_SECONDS
+                    logger.error(f"❌ Redis для кэша ответов недоступен, кэш отключен "
+                                 f"(повтор через {ANSWER_CACHE_RETRY_SECONDS} с): {e}")
+    return _cache
+
+
+def invalidate_document_answers(document_id: int) -> int:
+    """Инвалидация ответов по документу (переобработка или удаление)"""
+    cache = get_answer_cache()
+    if cache is None:
+        return 0
+    return cache.invalidate_document(document_id)
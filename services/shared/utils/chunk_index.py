@@ -0,0 +1,364 @@
+"""
+In-memory индекс эмбеддингов чанков
+- Непрерывная float32 матрица нормализованных эмбеддингов
+- Параллельные массивы: id чанка, id документа, длина контента
+- Инкрементальное обновление при смене processing_status документов
+- Снимки в .npy для memory-mapping: несколько воркеров делят одну копию
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+try:
+    from shared.models.document import DocumentChunk
+except ImportError:
+    try:
+        from models.document import DocumentChunk
+    except ImportError:
+        from services.shared.models.document import DocumentChunk
+
+try:
+    from .chunk_quality import CHUNK_TYPE_CONTENT
+except ImportError:
+    from chunk_quality import CHUNK_TYPE_CONTENT
+
+logger = logging.getLogger(__name__)
+
+CHUNK_INDEX_ENABLED = os.getenv("CHUNK_INDEX_ENABLED", "false").lower() == "true"
+CHUNK_INDEX_DIR = os.getenv("CHUNK_INDEX_DIR", "")
+CHUNK_INDEX_REFRESH_SECONDS = float(os.getenv("CHUNK_INDEX_REFRESH_SECONDS", "30"))
+EMBEDDING_DIM = 312
+
+_ARRAY_NAMES = ("matrix", "chunk_ids", "document_ids", "content_lengths")
+
+
+@dataclass(frozen=True)
+class _IndexSnapshot:
+    """Неизменяемый снимок индекса (заменяется целиком при обновлении)"""
+    matrix: np.ndarray
+    chunk_ids: np.ndarray
+    document_ids: np.ndarray
+    content_lengths: np.ndarray
+    document_versions: Dict[int, str] = field(default_factory=dict)
+    signature: str = ""
+
+
+def _empty_snapshot() -> _IndexSnapshot:
+    return _IndexSnapshot(
+        matrix=np.zeros((0, EMBEDDING_DIM), dtype=np.float32),
+        chunk_ids=np.zeros(0, dtype=np.int64),
+        document_ids=np.zeros(0, dtype=np.int64),
+        content_lengths=np.zeros(0, dtype=np.int32)
+    )
+
+
+def _signature(document_versions: Dict[int, str]) -> str:
+    """Подпись состояния корпуса: набор завершенных документов и их версий"""
+    payload = ";".join(f"{doc_id}:{version}" for doc_id, version in sorted(document_versions.items()))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ChunkIndex:
+    """
+    Индекс чанков в памяти процесса для поиска без обращения к pgvector
+
+    Поиск - одно матричное умножение (BLAS) и argpartition по top-k.
+    Обновление инкрементальное: перечитываются только чанки документов,
+    которые стали (или перестали быть) 'completed' либо были переобработаны.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None,
+                 refresh_interval: float = CHUNK_INDEX_REFRESH_SECONDS):
+        """
+        Args:
+            snapshot_dir: Каталог общих снимков для memory-mapping (опционально)
+            refresh_interval: Как часто (сек) проверять изменения документов
+        """
+        self.snapshot_dir = snapshot_dir or None
+        self.refresh_interval = refresh_interval
+        self._snapshot = _empty_snapshot()
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+
+    @property
+    def size(self) -> int:
+        """Количество векторов в индексе"""
+        return len(self._snapshot.chunk_ids)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика индекса"""
+        snapshot = self._snapshot
+        return {
+            'vectors': len(snapshot.chunk_ids),
+            'documents': len(snapshot.document_versions),
+            'memory_mb': round(snapshot.matrix.nbytes / (1024 * 1024), 2),
+            'memory_mapped': isinstance(snapshot.matrix, np.memmap),
+            'signature': snapshot.signature[:12]
+        }
+
+    def ensure_fresh(self, db: Session):
+        """Обновление индекса не чаще refresh_interval секунд"""
+        if time.monotonic() - self._last_check < self.refresh_interval and self._snapshot.signature:
+            return
+
+        with self._lock:
+            if time.monotonic() - self._last_check < self.refresh_interval and self._snapshot.signature:
+                return
+            try:
+                self.refresh(db)
+            finally:
+                self._last_check = time.monotonic()
+
+    def refresh(self, db: Session) -> bool:
+        """
+        Инкрементальное обновление индекса по состоянию документов
+
+        Returns:
+            bool: True если индекс изменился
+        """
+        versions = self._load_document_versions(db)
+        signature = _signature(versions)
+        current = self._snapshot
+
+        if signature == current.signature:
+            return False
+
+        # Другой воркер уже построил снимок для этого состояния - подключаем его
+        if self.snapshot_dir:
+            published = self._load_published()
+            if published is not None and published.signature == signature:
+                self._snapshot = published
+                logger.info(f"ChunkIndex: подключен общий снимок ({len(published.chunk_ids)} векторов)")
+                return True
+
+        start_time = time.perf_counter()
+
+        changed = {doc_id for doc_id, version in current.document_versions.items()
+                   if versions.get(doc_id) != version}
+        added = [doc_id for doc_id, version in versions.items()
+                 if current.document_versions.get(doc_id) != version]
+
+        if changed:
+            keep = ~np.isin(current.document_ids, list(changed))
+            parts = [(current.matrix[keep], current.chunk_ids[keep],
+                      current.document_ids[keep], current.content_lengths[keep])]
+        else:
+            parts = [(current.matrix, current.chunk_ids, current.document_ids, current.content_lengths)]
+
+        if added:
+            parts.append(self._fetch_document_chunks(db, added))
+
+        snapshot = _IndexSnapshot(
+            matrix=np.ascontiguousarray(np.concatenate([p[0] for p in parts]), dtype=np.float32),
+            chunk_ids=np.concatenate([p[1] for p in parts]).astype(np.int64),
+            document_ids=np.concatenate([p[2] for p in parts]).astype(np.int64),
+            content_lengths=np.concatenate([p[3] for p in parts]).astype(np.int32),
+            document_versions=versions,
+            signature=signature
+        )
+        self._snapshot = snapshot
+
+        logger.info(
+            f"ChunkIndex обновлен за {time.perf_counter() - start_time:.3f} с: "
+            f"-{len(changed)} / +{len(added)} документов, всего {len(snapshot.chunk_ids)} векторов"
+        )
+
+        if self.snapshot_dir:
+            try:
+                self._publish(snapshot)
+            except Exception as e:
+                logger.warning(f"ChunkIndex: не удалось сохранить общий снимок: {e}")
+
+        return True
+
+    def search(self, query_embedding: List[float], k: int,
+               min_similarity: float = 0.0,
+               min_length: int = 0,
+               max_length: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k чанков по косинусной схожести
+
+        Args:
+            query_embedding: Эмбеддинг запроса
+            k: Количество результатов
+            min_similarity: Минимальная схожесть
+            min_length: Минимальная длина контента (строго больше)
+            max_length: Максимальная длина контента (строго меньше)
+
+        Returns:
+            List[Dict]: id, document_id, similarity, content_length
+        """
+        snapshot = self._snapshot
+        if len(snapshot.chunk_ids) == 0 or k <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        query = query / query_norm
+
+        similarities = snapshot.matrix @ query
+
+        mask = similarities > min_similarity
+        if min_length:
+            mask &= snapshot.content_lengths > min_length
+        if max_length is not None:
+            mask &= snapshot.content_lengths < max_length
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-similarities[candidates], k - 1)[:k]]
+        top = top[np.argsort(-similarities[top])]
+
+        return [
+            {
+                'id': int(snapshot.chunk_ids[i]),
+                'document_id': int(snapshot.document_ids[i]),
+                'similarity': float(similarities[i]),
+                'content_length': int(snapshot.content_lengths[i])
+            }
+            for i in top
+        ]
+
+    def _load_document_versions(self, db: Session) -> Dict[int, str]:
+        """Завершенные документы и их версии (время последней обработки)"""
+        result = db.execute(text("""
+            SELECT id, COALESCE(processed_at, updated_at) AS version
+            FROM documents
+            WHERE processing_status = 'completed'
+        """))
+        return {row.id: str(row.version) for row in result}
+
+    def _fetch_document_chunks(self, db: Session, document_ids: List[int]):
+        """Загрузка эмбеддингов чанков указанных документов"""
+        rows = db.query(
+            DocumentChunk.id,
+            DocumentChunk.document_id,
+            DocumentChunk.content_length,
+            DocumentChunk.embedding_vector
+        ).filter(
+            DocumentChunk.document_id.in_(document_ids),
+            DocumentChunk.embedding_vector.isnot(None),
+            DocumentChunk.chunk_type == CHUNK_TYPE_CONTENT
+        ).all()
+
+        if not rows:
+            empty = _empty_snapshot()
+            return empty.matrix, empty.chunk_ids, empty.document_ids, empty.content_lengths
+
+        matrix = np.asarray([row.embedding_vector for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1.0
+        matrix /= norms[:, None]
+
+        return (
+            matrix,
+            np.asarray([row.id for row in rows], dtype=np.int64),
+            np.asarray([row.document_id for row in rows], dtype=np.int64),
+            np.asarray([row.content_length for row in rows], dtype=np.int32)
+        )
+
+    def _publish(self, snapshot: _IndexSnapshot):
+        """
+        Атомарная запись снимка для других процессов
+
+        Снимок пишется во временный каталог, переименовывается, и только
+        затем указатель CURRENT переключается через os.replace.
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        version_name = f"v{snapshot.signature[:16]}"
+        version_dir = os.path.join(self.snapshot_dir, version_name)
+
+        if not os.path.isdir(version_dir):
+            tmp_dir = f"{version_dir}.tmp{os.getpid()}"
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name in _ARRAY_NAMES:
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), getattr(snapshot, name))
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as meta:
+                json.dump({
+                    'signature': snapshot.signature,
+                    'document_versions': {str(k): v for k, v in snapshot.document_versions.items()}
+                }, meta)
+            try:
+                os.rename(tmp_dir, version_dir)
+            except OSError:
+                # Этот же снимок параллельно опубликовал другой процесс
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        pointer_tmp = os.path.join(self.snapshot_dir, f"CURRENT.tmp{os.getpid()}")
+        with open(pointer_tmp, "w", encoding="utf-8") as pointer:
+            pointer.write(version_name)
+        os.replace(pointer_tmp, os.path.join(self.snapshot_dir, "CURRENT"))
+
+        self._cleanup_old_versions(keep={version_name})
+
+    def _load_published(self) -> Optional[_IndexSnapshot]:
+        """Подключение текущего общего снимка через memory-mapping"""
+        try:
+            with open(os.path.join(self.snapshot_dir, "CURRENT"), encoding="utf-8") as pointer:
+                version_dir = os.path.join(self.snapshot_dir, pointer.read().strip())
+            with open(os.path.join(version_dir, "meta.json"), encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            arrays = {
+                name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r")
+                for name in _ARRAY_NAMES
+            }
+        except (OSError, ValueError) as e:
+            logger.debug(f"ChunkIndex: общий снимок недоступен: {e}")
+            return None
+
+        return _IndexSnapshot(
+            document_versions={int(k): v for k, v in meta['document_versions'].items()},
+            signature=meta['signature'],
+            **arrays
+        )
+
+    def _cleanup_old_versions(self, keep: set):
+        """Удаление старых снимков (уже подключенные mmap продолжают работать)"""
+        versions = sorted(
+            (entry for entry in os.scandir(self.snapshot_dir)
+             if entry.is_dir() and entry.name.startswith("v") and ".tmp" not in entry.name),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        # Оставляем текущий и один предыдущий снимок
+        for entry in versions[2:]:
+            if entry.name not in keep:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+_chunk_index: Optional[ChunkIndex] = None
+_chunk_index_lock = threading.Lock()
+
+
+def get_chunk_index() -> Optional[ChunkIndex]:
+    """
+    Общий индекс чанков процесса
+
+    Returns:
+        ChunkIndex или None, если индекс отключен (CHUNK_INDEX_ENABLED=false)
+    """
+    global _chunk_index
+    if not CHUNK_INDEX_ENABLED:
+        return None
+
+    if _chunk_index is None:
+        with _chunk_index_lock:
+            if _chunk_index is None:
+                _chunk_index = ChunkIndex(snapshot_dir=CHUNK_INDEX_DIR or None)
+                logger.info(f"ChunkIndex включен (снимки: {CHUNK_INDEX_DIR or 'только в памяти'})")
+    return _chunk_index
@@ -0,0 +1,121 @@
+"""
+Классификация чанков по качеству при загрузке документа
+- content     - содержательный текст (участвует в поиске)
+- appendix    - приложения к документу
+- title_page  - титульные листы, реквизиты утверждения и шапки положений
+- boilerplate - служебный текст системы менеджмента
+
+Тип сохраняется в document_chunks.chunk_type, поэтому поиск фильтрует
+чанки по индексированной колонке вместо NOT ILIKE по тексту.
+"""
+
+import re
+import time
+import logging
+from typing import Dict, Any
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TYPE_CONTENT = "content"
+CHUNK_TYPE_APPENDIX = "appendix"
+CHUNK_TYPE_TITLE_PAGE = "title_page"
+CHUNK_TYPE_BOILERPLATE = "boilerplate"
+
+APPENDIX_MARKERS = ['приложение']
+TITLE_PAGE_MARKERS = ['утверждаю', 'генеральный директор', 'введено впервые', 'дата введения']
+BOILERPLATE_MARKERS = ['система менеджмента']
+
+# Шапка положения ("ПОЛОЖЕНИЕ о ...") в начале чанка; migrate_chunk_types.sql
+# повторяет правило: left(lower(content), 200) ~ 'положение\s+о\s'
+REGULATION_HEADER_PATTERN = re.compile(r'положение\s+о\s')
+REGULATION_HEADER_WINDOW = 200
+
+# Чанк с тремя и более техническими маркерами считается служебным
+TECHNICAL_MARKERS = [
+    'приложение', 'утверждаю', 'генеральный директор',
+    'система менеджмента', 'введено впервые', 'дата введения',
+    'область применения', 'настоящее положение направлено',
+    'акционерное общество', 'сибгазполимер'
+]
+
+# SQL-условие для содержательных чанков (совпадает с предикатом частичного индекса)
+CONTENT_CHUNKS_PREDICATE = f"chunk_type = '{CHUNK_TYPE_CONTENT}'"
+
+
+def classify_chunk(content: str) -> str:
+    """Определение типа чанка по его тексту"""
+    content_lower = content.lower()
+
+    if any(marker in content_lower for marker in APPENDIX_MARKERS):
+        return CHUNK_TYPE_APPENDIX
+    if any(marker in content_lower for marker in TITLE_PAGE_MARKERS):
+        return CHUNK_TYPE_TITLE_PAGE
+    if REGULATION_HEADER_PATTERN.search(content_lower[:REGULATION_HEADER_WINDOW]):
+        return CHUNK_TYPE_TITLE_PAGE
+    if any(marker in content_lower for marker in BOILERPLATE_MARKERS):
+        return CHUNK_TYPE_BOILERPLATE
+    if sum(1 for marker in TECHNICAL_MARKERS if marker in content_lower) > 2:
+        return CHUNK_TYPE_BOILERPLATE
+    return CHUNK_TYPE_CONTENT
+
+
+def ensure_chunk_quality_schema(db: Session) -> Dict[str, Any]:
+    """
+    Колонка chunk_type и ее индекс для существующих баз
+
+    Новые базы получают их из init.sql. Чанки без типа (загруженные до
+    появления колонки) классифицируются здесь же; до запуска админ-панели
+    это можно сделать миграцией migrate_chunk_types.sql (те же правила).
+
+    Returns:
+        Dict: Количество классифицированных чанков по типам
+    """
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    db.execute(text("ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS chunk_type VARCHAR(20)"))
+    db.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_document_chunks_chunk_type ON document_chunks(chunk_type)"
+    ))
+    db.commit()
+    return backfill_chunk_types(db)
+
+
+def backfill_chunk_types(db: Session, batch_size: int = 500, reclassify: bool = False) -> Dict[str, Any]:
+    """
+    Классификация чанков без типа (или всех при reclassify=True)
+
+    Args:
+        db: Сессия базы данных
+        batch_size: Размер пачки обновлений
+        reclassify: Переклассифицировать все чанки (после изменения правил)
+    """
+    start_time = time.perf_counter()
+    counts: Dict[str, int] = {}
+    last_id = 0
+    condition = "" if reclassify else "AND chunk_type IS NULL"
+
+    while True:
+        rows = db.execute(text(f"""
+            SELECT id, content FROM document_chunks
+            WHERE id > :last_id {condition}
+            ORDER BY id
+            LIMIT :batch_size
+        """), {'last_id': last_id, 'batch_size': batch_size}).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            chunk_type = classify_chunk(row.content)
+            counts[chunk_type] = counts.get(chunk_type, 0) + 1
+            updates.append({'id': row.id, 'chunk_type': chunk_type})
+
+        db.execute(text("UPDATE document_chunks SET chunk_type = :chunk_type WHERE id = :id"), updates)
+        db.commit()
+        last_id = rows[-1].id
+
+    total = sum(counts.values())
+    if total:
+        logger.info(f"🏷️ Классифицировано {total} чанков за {time.perf_counter() - start_time:.2f} с: {counts}")
+    return {'classified': total, 'by_type': counts}
@@ -0,0 +1,184 @@
+"""
+Расширение контекста соседними чанками
+- Для лучших найденных чанков дочитываются соседи ±N одним запросом по (document_id, chunk_index)
+- Пересекающиеся и смежные окна одного документа объединяются в один фрагмент
+- Перекрытие соседних чанков (overlap при разбиении документа) вырезается
+"""
+
+import os
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+try:
+    from .chunk_quality import CONTENT_CHUNKS_PREDICATE
+except ImportError:
+    from chunk_quality import CONTENT_CHUNKS_PREDICATE
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_EXPANSION_ENABLED = os.getenv("CONTEXT_EXPANSION_ENABLED", "true").lower() == "true"
+# Сколько соседних чанков с каждой стороны добавлять
+CONTEXT_EXPANSION_WINDOW = int(os.getenv("CONTEXT_EXPANSION_WINDOW", "1"))
+# Для скольких лучших чанков расширять контекст
+CONTEXT_EXPANSION_TOP_K = int(os.getenv("CONTEXT_EXPANSION_TOP_K", "3"))
+
+# Перекрытие при разбиении - 200 символов, запас на пробелы по краям чанков
+MAX_CHUNK_OVERLAP = 400
+# Более короткие совпадения считаются случайными
+MIN_CHUNK_OVERLAP = 20
+
+GAP_SEPARATOR = "\n...\n"
+
+
+def strip_overlap(previous: str, current: str,
+                  max_overlap: int = MAX_CHUNK_OVERLAP,
+                  min_overlap: int = MIN_CHUNK_OVERLAP) -> str:
+    """
+    Текст current без начала, повторяющего конец previous
+
+    Чанки разбиваются с перекрытием и обрезаются по краям (strip),
+    поэтому ищется самый длинный суффикс previous, с которого начинается current.
+    """
+    if len(current) < min_overlap:
+        return current
+
+    tail = previous[-max_overlap:]
+    probe = current[:min_overlap]
+    position = tail.find(probe)
+    while position != -1:
+        overlap = tail[position:]
+        if current.startswith(overlap):
+            return current[len(overlap):].lstrip()
+        position = tail.find(probe, position + 1)
+    return current
+
+
+def merge_chunk_texts(parts: List[Tuple[int, str]]) -> str:
+    """Склейка чанков одного документа (chunk_index, текст) без повторов на стыках"""
+    merged = []
+    previous_index, previous_text = None, None
+    for chunk_index, content in parts:
+        if previous_index is not None and chunk_index == previous_index + 1:
+            remainder = strip_overlap(previous_text, content)
+            if remainder:
+                merged.append(" " + remainder)
+        else:
+            if merged:
+                merged.append(GAP_SEPARATOR)
+            merged.append(content)
+        previous_index, previous_text = chunk_index, content
+    return "".join(merged)
+
+
+def _build_windows(chunks: List[Dict], window: int, top_k: int) -> List[Dict[str, Any]]:
+    """Окна по документам: пересекающиеся и смежные объединяются, rank - лучший из вошедших чанков"""
+    by_document: Dict[int, List[Tuple[int, int, int]]] = {}
+    for rank, chunk in enumerate(chunks):
+        radius = window if rank < top_k else 0
+        chunk_index = chunk['chunk_index']
+        by_document.setdefault(chunk['document_id'], []).append(
+            (max(0, chunk_index - radius), chunk_index + radius, rank)
+        )
+
+    windows = []
+    for document_id, intervals in by_document.items():
+        intervals.sort()
+        current = None
+        for start, end, rank in intervals:
+            if current is not None and start <= current['end'] + 1:
+                current['end'] = max(current['end'], end)
+                current['ranks'].append(rank)
+            else:
+                current = {'document_id': document_id, 'start': start, 'end': end, 'ranks': [rank]}
+                windows.append(current)
+    windows.sort(key=lambda item: min(item['ranks']))
+    return windows
+
+
+def _fetch_windows(db: Session, windows: List[Dict[str, Any]]) -> Dict[Tuple[int, int], str]:
+    """Все чанки окон одним запросом (индекс document_id, chunk_index)"""
+    rows = db.execute(text(f"""
+        SELECT dc.document_id, dc.chunk_index, dc.content
+        FROM unnest(CAST(:document_ids AS integer[]),
+                    CAST(:start_indexes AS integer[]),
+                    CAST(:end_indexes AS integer[])) AS w(document_id, start_index, end_index)
+        JOIN document_chunks dc
+          ON dc.document_id = w.document_id
+         AND dc.chunk_index BETWEEN w.start_index AND w.end_index
+        WHERE dc.{CONTENT_CHUNKS_PREDICATE}
+    """), {
+        'document_ids': [item['document_id'] for item in windows],
+        'start_indexes': [item['start'] for item in windows],
+        'end_indexes': [item['end'] for item in windows]
+    }).fetchall()
+    return {(row.document_id, row.chunk_index): row.content for row in rows}
+
+
+def expand_context(db: Session, chunks: List[Dict],
+                   window: Optional[int] = None,
+                   top_k: Optional[int] = None) -> List[Dict]:
+    """
+    Замена найденных чанков фрагментами с соседним контекстом
+
+    Args:
+        db: Сессия базы данных
+        chunks: Чанки по убыванию релевантности (document_id, chunk_index, content)
+        window: Число соседей с каждой стороны (по умолчанию CONTEXT_EXPANSION_WINDOW)
+        top_k: Для скольких лучших чанков добавлять соседей (остальные только склеиваются)
+
+    Returns:
+        List[Dict]: Фрагменты в порядке лучшего вошедшего чанка; поля лучшего чанка
+        сохраняются, content заменяется склеенным текстом, добавляются
+        chunk_range и merged_chunks
+    """
+    if not chunks:
+        return []
+
+    window = CONTEXT_EXPANSION_WINDOW if window is None else window
+    top_k = CONTEXT_EXPANSION_TOP_K if top_k is None else top_k
+    windows = _build_windows(chunks, window, top_k)
+
+    known = {(chunk['document_id'], chunk['chunk_index']): chunk['content'] for chunk in chunks}
+    incomplete = [
+        item for item in windows
+        if any((item['document_id'], index) not in known for index in range(item['start'], item['end'] + 1))
+    ]
+    if incomplete:
+        fetched = _fetch_windows(db, incomplete)
+        known.update({key: content for key, content in fetched.items() if key not in known})
+
+    passages = []
+    original_length = sum(len(chunk['content']) for chunk in chunks)
+    for item in windows:
+        parts = [
+            (index, known[(item['document_id'], index)])
+            for index in range(item['start'], item['end'] + 1)
+            if (item['document_id'], index) in known
+        ]
+        best = chunks[min(item['ranks'])]
+        content = merge_chunk_texts(parts)
+        passages.append({
+            **best,
+            'content': content,
+            'content_length': len(content),
+            'chunk_range': [parts[0][0], parts[-1][0]],
+            'merged_chunks': len(parts)
+        })
+
+    logger.info(
+        f"🧩 Контекст: {len(chunks)} чанков -> {len(passages)} фрагментов, "
+        f"{original_length} -> {sum(p['content_length'] for p in passages)} символов"
+    )
+    return passages
+
+
+def ensure_context_index(db: Session):
+    """Составной индекс (document_id, chunk_index) для выборки окон соседних чанков"""
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    db.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_document_chunks_document_chunk "
+        "ON document_chunks(document_id, chunk_index)"
+    ))
+    db.commit()
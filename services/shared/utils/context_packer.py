@@ -0,0 +1,123 @@
+"""
+Упаковка контекста для промпта GigaChat в бюджет токенов
+- Число токенов оценивается по длине текста (для русского текста ~3.5 символа на токен)
+- Фрагменты выбираются жадно по MMR: релевантность минус сходство с уже выбранными,
+  поэтому почти одинаковые фрагменты разных документов не дублируют друг друга
+- Фрагмент, не помещающийся целиком, обрезается по границе предложения;
+  самый релевантный фрагмент попадает в контекст всегда (при малом бюджете - обрезанным)
+"""
+
+import os
+import re
+import math
+import logging
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+# 1.0 - только релевантность, 0.0 - только разнообразие
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+CHARS_PER_TOKEN = 3.5
+# Остаток бюджета, меньше которого фрагмент не обрезается (слишком мало смысла)
+MIN_TRUNCATED_TOKENS = 120
+# Заголовок источника в format_context ("[Источник N: название]")
+SOURCE_HEADER_TOKENS = 15
+
+_WORDS = re.compile(r"[а-яёa-z0-9]{4,}", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"[.!?;](\s|$)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов GigaChat по длине текста"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _word_set(text: str) -> Set[str]:
+    # Первые 6 букв слова - грубая замена стемминга для оценки сходства
+    return {word[:6] for word in _WORDS.findall(text.lower())}
+
+
+def _jaccard(first: Set[str], second: Set[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Обрезка текста до max_tokens по последней границе предложения"""
+    limit = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    ends = list(_SENTENCE_END.finditer(cut))
+    if ends and ends[-1].end() > limit // 2:
+        return cut[:ends[-1].end()].rstrip()
+    return cut[:cut.rfind(' ')].rstrip() + "..." if ' ' in cut else cut
+
+
+def _relevance(chunk: Dict) -> float:
+    return chunk.get('fusion_score') or chunk.get('similarity') or 0.0
+
+
+def pack_context(chunks: List[Dict],
+                 token_budget: Optional[int] = None,
+                 mmr_lambda: Optional[float] = None) -> List[Dict]:
+    """
+    Выбор фрагментов для промпта в пределах бюджета токенов
+
+    Args:
+        chunks: Фрагменты по убыванию релевантности (после expand_context)
+        token_budget: Бюджет токенов контекста (по умолчанию CONTEXT_TOKEN_BUDGET)
+        mmr_lambda: Баланс релевантности и разнообразия (по умолчанию CONTEXT_MMR_LAMBDA)
+
+    Returns:
+        List[Dict]: Выбранные фрагменты в порядке выбора, с полем context_tokens
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    mmr_lambda = CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    if not chunks:
+        return []
+
+    top_relevance = max(_relevance(chunk) for chunk in chunks) or 1.0
+    candidates = [
+        {'chunk': chunk, 'relevance': _relevance(chunk) / top_relevance, 'words': _word_set(chunk['content'])}
+        for chunk in chunks
+    ]
+
+    selected: List[Dict] = []
+    selected_words: List[Set[str]] = []
+    remaining = token_budget
+
+    while candidates and remaining > SOURCE_HEADER_TOKENS:
+        best_index, best_score = 0, float('-inf')
+        for index, candidate in enumerate(candidates):
+            redundancy = max((_jaccard(candidate['words'], words) for words in selected_words), default=0.0)
+            score = mmr_lambda * candidate['relevance'] - (1 - mmr_lambda) * redundancy
+            if score > best_score:
+                best_index, best_score = index, score
+
+        candidate = candidates.pop(best_index)
+        chunk = candidate['chunk']
+        tokens = estimate_tokens(chunk['content']) + SOURCE_HEADER_TOKENS
+
+        if tokens > remaining:
+            # Обрезаем, только если остаток бюджета еще осмысленный; первый
+            # фрагмент берем в любом случае, иначе LLM получит пустой контекст
+            available = remaining - SOURCE_HEADER_TOKENS
+            if available < MIN_TRUNCATED_TOKENS and selected:
+                continue
+            content = _truncate(chunk['content'], available)
+            chunk = {**chunk, 'content': content, 'content_length': len(content), 'truncated': True}
+            tokens = estimate_tokens(content) + SOURCE_HEADER_TOKENS
+
+        selected.append({**chunk, 'context_tokens': tokens})
+        selected_words.append(candidate['words'])
+        remaining -= tokens
+
+    logger.info(
+        f"📦 Контекст упакован: {len(selected)} из {len(chunks)} фрагментов, "
+        f"~{token_budget - remaining} из {token_budget} токенов"
+    )
+    return selected
@@ -0,0 +1,138 @@
+"""
+Кэш метаданных документов (название, путь, тип файла) в памяти процесса
+- Метаданные всех документов ответа читаются одним запросом WHERE id = ANY(:ids)
+- Запись сбрасывается при изменении документа (invalidate_document_metadata)
+  и при смене версии корпуса (exact_cache), а в остальном живет TTL секунд
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+try:
+    from .exact_cache import get_exact_cache
+except ImportError:
+    from exact_cache import get_exact_cache
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_METADATA_TTL = int(os.getenv("DOCUMENT_METADATA_TTL", "300"))
+
+UNKNOWN_DOCUMENT_TITLE = "Неизвестный документ"
+
+
+class DocumentMetadataCache:
+    """
+    Метаданные документов по id
+
+    Админ-панель сбрасывает записи сразу при изменении документа.
+    Другие процессы (бот) узнают об изменениях через версию корпуса
+    в Redis, если включен кэш точных совпадений, иначе - по TTL.
+    """
+
+    def __init__(self, ttl: int = DOCUMENT_METADATA_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[int, tuple] = {}  # document_id -> (expires_at, metadata)
+        self._corpus_version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_corpus_version(self):
+        exact_cache = get_exact_cache()
+        if exact_cache is None:
+            return
+        try:
+            version = exact_cache.get_corpus_version()
+        except Exception:
+            return
+        if version != self._corpus_version:
+            with self._lock:
+                self._entries.clear()
+                self._corpus_version = version
+
+    def get_many(self, db: Session, document_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Метаданные нескольких документов (отсутствующие в кэше - одним запросом)
+
+        Returns:
+            Dict: document_id -> {'id', 'title', 'file_path', 'original_filename',
+            'file_type', 'file_size', 'created_at'}; удаленных документов в словаре нет
+        """
+        ids = {document_id for document_id in document_ids if document_id is not None}
+        if not ids:
+            return {}
+
+        self._check_corpus_version()
+        now = time.time()
+        result, missing = {}, []
+        with self._lock:
+            for document_id in ids:
+                entry = self._entries.get(document_id)
+                if entry is not None and entry[0] > now:
+                    result[document_id] = entry[1]
+                else:
+                    missing.append(document_id)
+        self.hits += len(result)
+        self.misses += len(missing)
+
+        if missing:
+            rows = db.execute(text("""
+                SELECT id, title, file_path, original_filename, file_type, file_size, created_at
+                FROM documents WHERE id = ANY(:ids)
+            """), {'ids': missing}).fetchall()
+            expires_at = now + self.ttl
+            with self._lock:
+                for row in rows:
+                    metadata = dict(row._mapping)
+                    self._entries[row.id] = (expires_at, metadata)
+                    result[row.id] = metadata
+        return result
+
+    def invalidate(self, document_id: Optional[int] = None):
+        """Сброс записи документа (или всего кэша)"""
+        with self._lock:
+            if document_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(document_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries), 'ttl': self.ttl,
+            'hits': self.hits, 'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+_cache = DocumentMetadataCache()
+
+
+def get_document_metadata_cache() -> DocumentMetadataCache:
+    return _cache
+
+
+def get_documents_metadata(db: Session, document_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Метаданные документов через общий кэш процесса"""
+    return _cache.get_many(db, document_ids)
+
+
+def attach_document_metadata(db: Session, chunks: List[Dict]) -> List[Dict]:
+    """Добавление document_title, file_path и file_type к чанкам (на месте)"""
+    documents = _cache.get_many(db, (chunk['document_id'] for chunk in chunks))
+    for chunk in chunks:
+        document = documents.get(chunk['document_id'])
+        chunk['document_title'] = document['title'] if document and document['title'] else UNKNOWN_DOCUMENT_TITLE
+        chunk['file_path'] = document['file_path'] if document else None
+        chunk['file_type'] = document['file_type'] if document else None
+    return chunks
+
+
+def invalidate_document_metadata(document_id: Optional[int] = None):
+    """Сброс метаданных после изменения или удаления документа"""
+    _cache.invalidate(document_id)
@@ -2,13 +2,32 @@
 Простейший сервис эмбеддингов без тяжелых зависимостей
 """
 
+import os
 import logging
 from typing import List, Optional
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
+try:
+    from .model_registry import get_embedding_model
+except ImportError:
+    from model_registry import get_embedding_model
+
 logger = logging.getLogger(__name__)
 
+
+def get_default_batch_size() -> int:
+    """
+    Размер батча эмбеддингов: EMBEDDING_BATCH_SIZE или по числу ядер CPU
+    
+    rubert-tiny2 маленькая модель, поэтому батч растет с числом ядер
+    (8 текстов на ядро), но ограничен 128 для экономии памяти.
+    """
+    configured = int(os.getenv("EMBEDDING_BATCH_SIZE", "0"))
+    if configured > 0:
+        return configured
+    return max(16, min(128, 8 * (os.cpu_count() or 1)))
+
+
 class SimpleEmbeddings:
     """
     Простая система эмбеддингов
@@ -17,15 +36,13 @@ class SimpleEmbeddings:
     
     def __init__(self):
         """Инициализация с локальной русской моделью"""
-        logger.info("Загружаем локальную модель эмбеддингов...")
-        
         try:
-            # Используем более совместимую русскую модель
-            self.model = SentenceTransformer('cointegrated/rubert-tiny2')
+            # Используем общую русскую модель из реестра (одна копия на процесс)
+            self.model = get_embedding_model()
             self.model_name = "rubert-tiny2"
             self.embedding_dim = 312  # Размерность эмбеддингов для этой модели
             
-            logger.info(f"Модель {self.model_name} успешно загружена!")
+            logger.info(f"Модель {self.model_name} готова к работе")
             
         except Exception as e:
             logger.error(f"Ошибка загрузки модели: {str(e)}")
@@ -59,12 +76,13 @@ class SimpleEmbeddings:
             logger.error(f"Ошибка создания эмбеддинга: {str(e)}")
             return None
     
-    def create_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+    def create_embeddings_batch(self, texts: List[str], batch_size: Optional[int] = None) -> List[Optional[List[float]]]:
         """
         Создание эмбеддингов для списка текстов (батчевая обработка)
         
         Args:
             texts: Список текстов
+            batch_size: Размер батча модели (по умолчанию get_default_batch_size())
             
         Returns:
             List[Optional[List[float]]]: Список эмбеддингов
@@ -80,7 +98,10 @@ class SimpleEmbeddings:
                 return [None] * len(texts)
             
             # Создаем эмбеддинги батчем (быстрее)
-            embeddings = self.model.encode(clean_texts)
+            embeddings = self.model.encode(
+                clean_texts,
+                batch_size=batch_size or get_default_batch_size()
+            )
         
             # Конвертируем в список списков
             result = []
@@ -159,6 +180,14 @@ class EmbeddingService(SimpleEmbeddings):
         result = self.create_embedding(text)
         return result if result is not None else [0.0] * self.embedding_dim
     
+    def get_embeddings_batch(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """Батчевая версия get_embedding (нулевой вектор при ошибке)"""
+        results = self.create_embeddings_batch(texts, batch_size=batch_size)
+        return [
+            result if result is not None else [0.0] * self.embedding_dim
+            for result in results
+        ]
+    
     def similarity(self, text1: str, text2: str) -> float:
         """Вычисляет схожесть между двумя текстами"""
         emb1 = self.get_embedding(text1)
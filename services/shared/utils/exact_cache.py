@@ -0,0 +1,266 @@
+"""
+Кэш точных совпадений вопросов
+- Ключ: нормализованный текст вопроса + версия корпуса документов
+- Два уровня: найденные чанки (search_relevant_chunks) и готовый ответ (answer_question)
+- Версия корпуса увеличивается при обработке и удалении документов,
+  поэтому старые записи просто перестают находиться и истекают по TTL
+- Если Redis настроен, но недоступен, кэш отключается до следующей попытки
+  подключения: версия корпуса в памяти процесса не видела бы изменений из админ-панели
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+EXACT_CACHE_ENABLED = os.getenv("EXACT_CACHE_ENABLED", "false").lower() == "true"
+EXACT_CACHE_TTL = int(os.getenv("EXACT_CACHE_TTL", "86400"))
+EXACT_CACHE_MAX_ENTRIES = int(os.getenv("EXACT_CACHE_MAX_ENTRIES", "5000"))
+EXACT_CACHE_REDIS_URL = os.getenv("EXACT_CACHE_REDIS_URL") or os.getenv("REDIS_URL", "")
+# Через сколько секунд повторить подключение к недоступному Redis
+EXACT_CACHE_RETRY_SECONDS = int(os.getenv("EXACT_CACHE_RETRY_SECONDS", "60"))
+
+KEY_PREFIX = "exact_cache"
+CORPUS_VERSION_KEY = "corpus:version"
+
+LEVEL_CHUNKS = "chunks"
+LEVEL_ANSWER = "answer"
+
+_PUNCTUATION = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Нормализация вопроса: регистр, ё/е, пунктуация, пробелы"""
+    normalized = question.lower().replace('ё', 'е')
+    normalized = _PUNCTUATION.sub(' ', normalized)
+    return _SPACES.sub(' ', normalized).strip()
+
+
+class ExactQueryCache:
+    """
+    Кэш ответов и чанков для дословно повторяющихся вопросов
+
+    С Redis кэш и версия корпуса общие для бота и админ-панели.
+    Без Redis (URL не задан) используется LRU в памяти процесса, а версия
+    корпуса меняется только в текущем процессе (записи ограничены TTL).
+    """
+
+    def __init__(self, redis_url: str = EXACT_CACHE_REDIS_URL,
+                 ttl: int = EXACT_CACHE_TTL,
+                 max_entries: int = EXACT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._redis = self._connect_redis(redis_url)
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, raw)
+        self._local_version = 0
+
+        self._stats = {
+            LEVEL_CHUNKS: {'hits': 0, 'misses': 0},
+            LEVEL_ANSWER: {'hits': 0, 'misses': 0}
+        }
+
+    def _connect_redis(self, redis_url: str):
+        """Клиент Redis; ошибка подключения пробрасывается (см. get_exact_cache)"""
+        if not redis_url:
+            return None
+        if redis is None:
+            raise RuntimeError("пакет redis не установлен")
+        client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=1)
+        client.ping()
+        return client
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "memory"
+
+    # ------------------------------------------------------------------
+    # Версия корпуса
+    # ------------------------------------------------------------------
+
+    def get_corpus_version(self) -> int:
+        if self._redis is not None:
+            return int(self._redis.get(CORPUS_VERSION_KEY) or 0)
+        return self._local_version
+
+    def bump_corpus_version(self) -> int:
+        """Новая версия корпуса: все ранее сохраненные записи становятся недоступны"""
+        if self._redis is not None:
+            version = int(self._redis.incr(CORPUS_VERSION_KEY))
+        else:
+            with self._lock:
+                self._local_version += 1
+                self._entries.clear()
+                version = self._local_version
+        logger.info(f"📚 Версия корпуса документов: {version}")
+        return version
+
+    # ------------------------------------------------------------------
+    # Хранилище
+    # ------------------------------------------------------------------
+
+    def _key(self, level: str, question: str, version: int, suffix: str = "") -> str:
+        digest = hashlib.sha1(normalize_question(question).encode('utf-8')).hexdigest()
+        return f"{KEY_PREFIX}:{level}:{version}:{digest}{suffix}"
+
+    def _get(self, key: str) -> Optional[str]:
+        if self._redis is not None:
+            raw = self._redis.get(key)
+            return raw.decode('utf-8') if raw is not None else None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _set(self, key: str, raw: str):
+        if self._redis is not None:
+            self._redis.set(key, raw, ex=self.ttl)
+            return
+
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, raw)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, level: str, key_builder) -> Tuple[Optional[Any], Optional[int]]:
+        version = None
+        try:
+            version = self.get_corpus_version()
+            raw = self._get(key_builder(version))
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша точных совпадений: {e}")
+            raw = None
+
+        if raw is None:
+            self._stats[level]['misses'] += 1
+            return None, version
+        self._stats[level]['hits'] += 1
+        return json.loads(raw), version
+
+    def _store(self, key_builder, value: Any, version: Optional[int]):
+        # Версия берется на момент поиска: результат, посчитанный до удаления
+        # документа или bump_corpus_version(), не должен попасть под новую версию
+        if version is None:
+            return
+        try:
+            raw = json.dumps(value, ensure_ascii=False, default=_json_default)
+            self._set(key_builder(version), raw)
+        except Exception as e:
+            logger.warning(f"Ошибка записи в кэш точных совпадений: {e}")
+
+    # ------------------------------------------------------------------
+    # Уровень чанков
+    # ------------------------------------------------------------------
+
+    def get_chunks(self, question: str, limit: int) -> Tuple[Optional[List[Dict[str, Any]]], Optional[int]]:
+        """
+        Найденные чанки без текста (id, документ, схожесть)
+
+        Returns:
+            Tuple: чанки (None при промахе) и версия корпуса для set_chunks
+        """
+        return self._lookup(LEVEL_CHUNKS, lambda v: self._key(LEVEL_CHUNKS, question, v, f":{limit}"))
+
+    def set_chunks(self, question: str, limit: int, chunks: List[Dict[str, Any]], version: Optional[int]):
+        # Текст чанков не храним: он дочитывается по id одним запросом
+        stripped = [{k: v for k, v in chunk.items() if k != 'content'} for chunk in chunks]
+        self._store(lambda v: self._key(LEVEL_CHUNKS, question, v, f":{limit}"), stripped, version)
+
+    # ------------------------------------------------------------------
+    # Уровень ответа
+    # ------------------------------------------------------------------
+
+    def get_answer(self, question: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        """
+        Готовый результат answer_question
+
+        Returns:
+            Tuple: результат (None при промахе) и версия корпуса для set_answer
+        """
+        return self._lookup(LEVEL_ANSWER, lambda v: self._key(LEVEL_ANSWER, question, v))
+
+    def set_answer(self, question: str, result: Dict[str, Any], version: Optional[int]):
+        self._store(lambda v: self._key(LEVEL_ANSWER, question, v), result, version)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {'backend': self.backend, 'ttl': self.ttl}
+        try:
+            stats['corpus_version'] = self.get_corpus_version()
+        except Exception as e:
+            stats['corpus_version'] = None
+            stats['error'] = str(e)
+        for level, counters in self._stats.items():
+            lookups = counters['hits'] + counters['misses']
+            stats[level] = dict(counters, hit_rate=round(counters['hits'] / lookups, 4) if lookups else 0.0)
+        if self._redis is None:
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+def _json_default(value):
+    """Сериализация numpy-скаляров и дат в JSON"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+_cache: Optional[ExactQueryCache] = None
+_cache_lock = threading.Lock()
+_retry_at = 0.0
+
+
+def get_exact_cache() -> Optional[ExactQueryCache]:
+    """
+    Общий кэш точных совпадений процесса
+
+    None, если EXACT_CACHE_ENABLED=false или настроенный Redis недоступен
+    (повторное подключение - не чаще раза в EXACT_CACHE_RETRY_SECONDS).
+    """
+    global _cache, _retry_at
+    if not EXACT_CACHE_ENABLED:
+        return None
+    if _cache is None and time.monotonic() >= _retry_at:
+        with _cache_lock:
+            if _cache is None and time.monotonic() >= _retry_at:
+                try:
+                    _cache = ExactQueryCache()
+                except Exception as e:
+                    _retry_at = time.monotonic() + EXACT_CACHE_RETRY_SECONDS
+                    logger.error(f"❌ Redis для кэша точных совпадений недоступен, кэш отключен "
+                                 f"(повтор через {EXACT_CACHE_RETRY_SECONDS} с): {e}")
+    return _cache
+
+
+def bump_corpus_version() -> Optional[int]:
+    """Увеличение версии корпуса после обработки или удаления документа"""
+    cache = get_exact_cache()
+    if cache is None:
+        if EXACT_CACHE_ENABLED:
+            logger.warning("⚠️ Кэш точных совпадений недоступен, версия корпуса не обновлена")
+        return None
+    try:
+        return cache.bump_corpus_version()
+    except Exception as e:
+        logger.warning(f"Не удалось обновить версию корпуса: {e}")
+        return None
@@ -0,0 +1,223 @@
+"""
+Полнотекстовый поиск по чанкам (PostgreSQL tsvector)
+- document_chunks.content_tsv: генерируемая колонка to_tsvector('russian', content)
+- GIN-индекс по content_tsv вместо ILIKE '%слово%' (который не использует индексы)
+- Словарь синонимов раскрывается в запрос websearch_to_tsquery,
+  поэтому "зарплата" находит и "заработную плату", и "оплату труда"
+- Ранжирование: ts_rank_cd
+- Нечеткий поиск (pg_trgm): GIN-индекс триграмм по content для опечаток
+  и частичных совпадений слов, которые не находит tsvector
+"""
+
+import os
+import re
+import logging
+from typing import Dict, Iterable, List
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Конфигурация полнотекстового поиска (морфология русского языка, стемминг snowball)
+FTS_CONFIG = "russian"
+
+# Нормализация ts_rank_cd: 32 -> rank / (rank + 1), значения в [0, 1)
+FTS_RANK_NORMALIZATION = 32
+
+# Нечеткий поиск по триграммам
+FUZZY_SEARCH_ENABLED = os.getenv("FUZZY_SEARCH_ENABLED", "true").lower() == "true"
+# Порог word_similarity (оператор <%), ниже - слово считается не найденным
+FUZZY_SIMILARITY_THRESHOLD = float(os.getenv("FUZZY_SIMILARITY_THRESHOLD", "0.6"))
+FUZZY_MAX_TERMS = int(os.getenv("FUZZY_MAX_TERMS", "4"))
+# Короткие слова дают слишком мало триграмм и много ложных совпадений
+FUZZY_MIN_TERM_LENGTH = 5
+
+# Словарь синонимов: группа -> формы и синонимы, которые ищутся вместе
+SYNONYMS: Dict[str, List[str]] = {
+    # HR и зарплата
+    'аванс': ['аванс', 'авансовая', 'авансовый', 'первая часть', 'первая половина', 'предоплата'],
+    'зарплата': ['зарплата', 'заработная плата', 'оплата труда', 'вознаграждение', 'зп', 'доход'],
+    'выплата': ['выплата', 'выплачивается', 'перечисление', 'начисление', 'выдача', 'платеж'],
+    'дата': ['дата', 'число', 'срок', 'время', 'когда', 'день', 'период'],
+    'размер': ['размер', 'сумма', 'процент', 'сколько', 'величина', 'объем'],
+    'отпуск': ['отпуск', 'отпускные', 'отдых', 'каникулы', 'vacation'],
+    'больничный': ['больничный', 'болезнь', 'нетрудоспособность', 'лист нетрудоспособности'],
+    'премия': ['премия', 'бонус', 'поощрение', 'надбавка', 'стимулирование'],
+    'договор': ['договор', 'контракт', 'соглашение', 'трудовой договор'],
+    'увольнение': ['увольнение', 'расторжение', 'прекращение', 'уход', 'dismissal'],
+    'график': ['график', 'расписание', 'режим', 'время работы', 'смена'],
+    'документы': ['документы', 'справки', 'бумаги', 'формы', 'заявления'],
+
+    # Техника безопасности
+    'безопасность': ['безопасность', 'охрана труда', 'техбезопасность', 'охрана', 'защита'],
+    'инструкция': ['инструкция', 'правила', 'порядок', 'процедура', 'регламент'],
+    'средства_защиты': ['сиз', 'средства защиты', 'спецодежда', 'каска', 'перчатки', 'очки'],
+    'несчастный_случай': ['несчастный случай', 'травма', 'происшествие', 'авария', 'инцидент'],
+    'обучение_бт': ['обучение', 'инструктаж', 'подготовка', 'курсы безопасности'],
+    'медосмотр': ['медосмотр', 'медицинский осмотр', 'диспансеризация', 'здоровье'],
+    'пожарная_безопасность': ['пожар', 'огнетушитель', 'эвакуация', 'пожарная безопасность'],
+
+    # IT и информационная безопасность
+    'компьютер': ['компьютер', 'пк', 'ноутбук', 'рабочее место', 'техника'],
+    'пароль': ['пароль', 'авторизация', 'доступ', 'логин', 'учетная запись'],
+    'интернет': ['интернет', 'сеть', 'wifi', 'подключение', 'онлайн'],
+    'почта': ['почта', 'email', 'емейл', 'электронная почта', 'мейл'],
+    'программы': ['программы', 'софт', 'приложения', 'software', 'система'],
+    'данные': ['данные', 'информация', 'файлы', 'документооборот', 'архив'],
+    'вирус': ['вирус', 'антивирус', 'malware', 'защита', 'угроза'],
+
+    # Общие рабочие процессы
+    'командировка': ['командировка', 'поездка', 'путешествие', 'business trip'],
+    'обед': ['обед', 'перерыв', 'питание', 'столовая', 'кафе'],
+    'транспорт': ['транспорт', 'проезд', 'автобус', 'машина', 'такси'],
+    'парковка': ['парковка', 'стоянка', 'автомобиль', 'место для машины'],
+    'пропуск': ['пропуск', 'доступ', 'проход', 'карта', 'badge'],
+    'дресс_код': ['дресс код', 'одежда', 'внешний вид', 'форма', 'uniform'],
+
+    # Социальные льготы
+    'льготы': ['льготы', 'компенсации', 'возмещение', 'benefits', 'пособия'],
+    'страхование': ['страхование', 'дмс', 'полис', 'медстраховка'],
+    'спорт': ['спорт', 'фитнес', 'тренажерный зал', 'здоровье', 'физкультура'],
+    'обучение': ['обучение', 'курсы', 'тренинги', 'развитие', 'образование'],
+
+    # Организационные вопросы
+    'офис': ['офис', 'помещение', 'рабочее место', 'кабинет', 'space'],
+    'оборудование': ['оборудование', 'инвентарь', 'техника', 'устройства'],
+    'уборка': ['уборка', 'чистота', 'клининг', 'санитария', 'гигиена'],
+    'ремонт': ['ремонт', 'поломка', 'неисправность', 'сервис', 'maintenance']
+}
+
+# Служебные слова групп (дата: "когда", размер: "сколько") не раскрываются
+# в синонимы, иначе почти любой вопрос превращается в поиск по "срок | время | день"
+NON_EXPANDING_TERMS = {'когда', 'сколько', 'время', 'число', 'день'}
+
+_TERM_CLEANUP = re.compile(r"[^\w\s-]+", re.UNICODE)
+
+
+def find_synonym_groups(question_lower: str) -> Dict[str, str]:
+    """
+    Группы синонимов, встречающиеся в вопросе: группа -> найденная форма
+
+    Служебные слова (NON_EXPANDING_TERMS) группу не включают: иначе ключ
+    группы ("дата", "размер") раскрылся бы в синонимы вместо них.
+    """
+    found = {}
+    for group, words in SYNONYMS.items():
+        for word in words:
+            if word in NON_EXPANDING_TERMS:
+                continue
+            if word in question_lower:
+                found[group] = word
+                break
+    return found
+
+
+def expand_synonyms(terms: Iterable[str]) -> List[str]:
+    """Раскрытие терминов в полные группы синонимов (без повторов, порядок сохраняется)"""
+    expanded: List[str] = []
+    seen = set()
+
+    def add(term: str):
+        term = term.replace('_', ' ').strip().lower()
+        if term and term not in seen:
+            seen.add(term)
+            expanded.append(term)
+
+    for term in terms:
+        add(term)
+        term_lower = term.lower()
+        if term_lower in NON_EXPANDING_TERMS:
+            continue
+        for group, words in SYNONYMS.items():
+            if term_lower == group or term_lower in words:
+                for word in words:
+                    add(word)
+    return expanded
+
+
+def build_fulltext_query(terms: Iterable[str], expand: bool = True) -> str:
+    """
+    Строка запроса для websearch_to_tsquery
+
+    Термины объединяются через OR, фразы берутся в кавычки (поиск фразы).
+    websearch_to_tsquery не падает на произвольном вводе, а стемминг
+    применяется к каждому слову на стороне PostgreSQL.
+
+    Returns:
+        str: Запрос вида 'зарплата OR "заработная плата"' (пустая строка, если терминов нет)
+    """
+    parts = []
+    for term in (expand_synonyms(terms) if expand else terms):
+        cleaned = _TERM_CLEANUP.sub(' ', term).strip()
+        if not cleaned:
+            continue
+        parts.append(f'"{cleaned}"' if ' ' in cleaned else cleaned)
+    return " OR ".join(parts)
+
+
+def select_fuzzy_terms(keywords: Iterable[str]) -> List[str]:
+    """
+    Слова вопроса для нечеткого поиска
+
+    Берутся одиночные слова не короче FUZZY_MIN_TERM_LENGTH (опечатки
+    в них tsvector не находит), самые длинные - первыми.
+    """
+    terms = {
+        keyword.lower() for keyword in keywords
+        if len(keyword) >= FUZZY_MIN_TERM_LENGTH and keyword.isalpha()
+    }
+    return sorted(terms, key=len, reverse=True)[:FUZZY_MAX_TERMS]
+
+
+def apply_fuzzy_settings(db: Session):
+    """Порог нечеткого поиска для текущей транзакции (SET LOCAL, как apply_search_settings)"""
+    db.execute(text(f"SET LOCAL pg_trgm.word_similarity_threshold = {float(FUZZY_SIMILARITY_THRESHOLD)}"))
+
+
+def ensure_fulltext_schema(db: Session) -> bool:
+    """
+    Генерируемая колонка content_tsv и GIN-индекс для существующих баз
+
+    Новые базы получают их из init.sql. Добавление STORED-колонки
+    перезаписывает таблицу один раз, дальше PostgreSQL поддерживает ее сам.
+
+    Returns:
+        bool: True, если колонка была добавлена сейчас
+    """
+    exists = db.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'document_chunks' AND column_name = 'content_tsv'
+    """)).scalar() is not None
+
+    # Добавление колонки перезаписывает таблицу - без таймаута запросов
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    if not exists:
+        logger.info("🔤 Добавляем колонку content_tsv для полнотекстового поиска...")
+        db.execute(text(f"""
+            ALTER TABLE document_chunks ADD COLUMN content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('{FTS_CONFIG}', content)) STORED
+        """))
+    db.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_document_chunks_content_tsv "
+        "ON document_chunks USING gin (content_tsv)"
+    ))
+    db.commit()
+
+    ensure_trigram_index(db)
+    return not exists
+
+
+def ensure_trigram_index(db: Session):
+    """Расширение pg_trgm и GIN-индекс триграмм по тексту чанков"""
+    try:
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_document_chunks_content_trgm "
+            "ON document_chunks USING gin (content gin_trgm_ops)"
+        ))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Индекс триграмм недоступен, нечеткий поиск работать не будет: {e}")
+
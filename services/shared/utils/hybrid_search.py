@@ -0,0 +1,167 @@
+"""
+Гибридный поиск чанков одним SQL-запросом
+- Векторные, "зарплатные", лексические (tsvector) и нечеткие (pg_trgm)
+  кандидаты собираются в CTE
+- UNION ALL + GROUP BY объединяет их на стороне сервера (одна сетевая итерация),
+  оценки всех нашедших чанк ретриверов возвращаются для rank_fusion
+- Запросы постоянные и подготавливаются один раз на соединение (prepared_statements)
+- StageTimer измеряет длительность этапов поиска
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    from .chunk_quality import CONTENT_CHUNKS_PREDICATE, CHUNK_TYPE_TITLE_PAGE, CHUNK_TYPE_BOILERPLATE
+    from .fulltext import FTS_CONFIG, FTS_RANK_NORMALIZATION
+    from .prepared_statements import PreparedStatement
+except ImportError:
+    from chunk_quality import CONTENT_CHUNKS_PREDICATE, CHUNK_TYPE_TITLE_PAGE, CHUNK_TYPE_BOILERPLATE
+    from fulltext import FTS_CONFIG, FTS_RANK_NORMALIZATION
+    from prepared_statements import PreparedStatement
+
+logger = logging.getLogger(__name__)
+
+# Служебные фрагменты (приложения, титульные листы, шапки положений) отмечены
+# при загрузке, условие совпадает с предикатом частичного векторного индекса
+VECTOR_EXCLUDED_FILTERS = f"""
+                  AND dc.{CONTENT_CHUNKS_PREDICATE}"""
+
+# "Зарплатные" кандидаты отбираются по тексту пункта о выплатах, который часто ссылается
+# на приложение, поэтому здесь исключаются только титульные листы и служебный текст;
+# чанки без типа (до классификации) считаются содержательными
+SALARY_EXCLUDED_FILTERS = f"""
+                  AND COALESCE(dc.chunk_type, '') NOT IN ('{CHUNK_TYPE_TITLE_PAGE}', '{CHUNK_TYPE_BOILERPLATE}')"""
+
+class StageTimer:
+    """Замер длительности этапов поиска (секунды по этапам)"""
+
+    def __init__(self, target: Optional[Dict[str, float]] = None):
+        self.stages: Dict[str, float] = target if target is not None else {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start_time)
+
+    def summary(self) -> str:
+        return ", ".join(f"{name}={seconds * 1000:.1f} мс" for name, seconds in self.stages.items())
+
+
+# Параметры гибридного запроса:
+#     :embedding       - эмбеддинг вопроса (vector)
+#     :use_salary      - искать "зарплатных" кандидатов, :salary_limit - их число
+#     :use_vector      - искать векторных кандидатов (false, если они взяты из индекса в памяти),
+#                        :vector_limit - их число
+#     :fts_query       - строка websearch_to_tsquery (см. fulltext.build_fulltext_query),
+#                        пустая строка отключает лексических кандидатов; :lexical_limit - их число
+#     :fuzzy_terms     - слова для нечеткого поиска (см. fulltext.select_fuzzy_terms),
+#                        :fuzzy_limit - число нечетких кандидатов
+# Ветки отключаются параметрами (One-Time Filter в плане), а не сборкой текста,
+# поэтому запрос один и подготавливается один раз на соединение.
+#
+# Возвращает id, scores (ретривер -> его оценка: косинусная схожесть, ts_rank_cd
+# или word_similarity), similarity (косинусная схожесть с вопросом для всех
+# кандидатов), document_id, chunk_index, content, content_length
+HYBRID_SEARCH = PreparedStatement("hybrid_search_v3", f"""
+    WITH
+        salary_candidates AS (
+            SELECT dc.id, 1 - (dc.embedding_vector <=> :embedding) AS similarity
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+            WHERE :use_salary
+              AND d.processing_status = 'completed'
+              AND dc.embedding_vector IS NOT NULL{SALARY_EXCLUDED_FILTERS}
+              AND (dc.content ILIKE '%12%' AND dc.content ILIKE '%27%' AND dc.content ILIKE '%выплачивается%')
+            ORDER BY dc.embedding_vector <=> :embedding
+            LIMIT :salary_limit
+        ),
+        vector_candidates AS (
+            SELECT dc.id, 1 - (dc.embedding_vector <=> :embedding) AS similarity
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+            WHERE :use_vector
+              AND d.processing_status = 'completed'
+              AND dc.embedding_vector IS NOT NULL
+              AND dc.content_length > 100
+              AND dc.content_length < 4000{VECTOR_EXCLUDED_FILTERS}
+            ORDER BY dc.embedding_vector <=> :embedding
+            LIMIT :vector_limit
+        ),
+        -- GIN-индекс по content_tsv, ранжирование ts_rank_cd
+        lexical_candidates AS (
+            SELECT dc.id, ts_rank_cd(dc.content_tsv, q, {FTS_RANK_NORMALIZATION}) AS text_rank
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+            CROSS JOIN websearch_to_tsquery('{FTS_CONFIG}', :fts_query) AS q
+            WHERE :fts_query <> ''
+              AND d.processing_status = 'completed'
+              AND dc.content_tsv @@ q
+              AND dc.content_length > 200
+              AND dc.content_length < 3000{VECTOR_EXCLUDED_FILTERS}
+            ORDER BY text_rank DESC
+            LIMIT :lexical_limit
+        ),
+        -- Оператор <% (word_similarity выше порога) использует GIN-индекс триграмм
+        -- отдельно для каждого слова; порог задается fulltext.apply_fuzzy_settings
+        fuzzy_candidates AS (
+            SELECT dc.id, MAX(word_similarity(t.term, dc.content)) AS text_rank
+            FROM unnest(CAST(:fuzzy_terms AS text[])) AS t(term)
+            JOIN document_chunks dc ON t.term <% dc.content
+            JOIN documents d ON dc.document_id = d.id
+            WHERE d.processing_status = 'completed'
+              AND dc.content_length > 200
+              AND dc.content_length < 3000{VECTOR_EXCLUDED_FILTERS}
+            GROUP BY dc.id
+            ORDER BY text_rank DESC
+            LIMIT :fuzzy_limit
+        ),
+        candidates AS (
+            SELECT id, similarity, NULL::float AS text_rank, 'salary_specific' AS search_type, 0 AS priority FROM salary_candidates
+            UNION ALL
+            SELECT id, similarity, NULL::float AS text_rank, 'vector' AS search_type, 1 AS priority FROM vector_candidates
+            UNION ALL
+            SELECT id, NULL::float AS similarity, text_rank, 'text' AS search_type, 2 AS priority FROM lexical_candidates
+            UNION ALL
+            SELECT id, NULL::float AS similarity, text_rank, 'fuzzy' AS search_type, 3 AS priority FROM fuzzy_candidates
+        ),
+        fused AS (
+            SELECT id,
+                   MAX(similarity) AS similarity,
+                   jsonb_object_agg(search_type, COALESCE(text_rank, similarity)) AS scores,
+                   MIN(priority) AS priority
+            FROM candidates
+            GROUP BY id
+        )
+    SELECT f.id, f.scores,
+           COALESCE(f.similarity, 1 - (dc.embedding_vector <=> :embedding), 0.0) AS similarity,
+           dc.document_id, dc.chunk_index, dc.content, dc.content_length
+    FROM fused f
+    JOIN document_chunks dc ON dc.id = f.id
+    ORDER BY f.priority
+""", [
+    ('embedding', 'vector'),
+    ('use_salary', 'boolean'), ('salary_limit', 'integer'),
+    ('use_vector', 'boolean'), ('vector_limit', 'integer'),
+    ('fts_query', 'text'), ('lexical_limit', 'integer'),
+    ('fuzzy_terms', 'text[]'), ('fuzzy_limit', 'integer')
+])
+
+
+# Резервный полнотекстовый поиск (эмбеддинга может не быть, оценка - ранг FTS)
+FALLBACK_SEARCH = PreparedStatement("fallback_search_v1", f"""
+    SELECT dc.id, dc.document_id, dc.chunk_index, dc.content,
+           ts_rank_cd(dc.content_tsv, q, {FTS_RANK_NORMALIZATION}) AS similarity
+    FROM document_chunks dc
+    JOIN documents d ON dc.document_id = d.id
+    CROSS JOIN websearch_to_tsquery('{FTS_CONFIG}', :fts_query) AS q
+    WHERE d.processing_status = 'completed'
+      AND dc.content_tsv @@ q
+    ORDER BY similarity DESC, dc.content_length ASC
+    LIMIT :limit
+""", [('fts_query', 'text'), ('limit', 'integer')])
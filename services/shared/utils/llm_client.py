@@ -1,12 +1,19 @@
 # services/shared/utils/llm_client.py
 
+import os
 import logging
-import requests
+import asyncio
+import threading
 import json
 import time
 import base64
-import uuid
-from typing import Optional, Dict, Any
+import httpx
+
+try:
+    from .token_provider import get_token_provider
+except ImportError:
+    from token_provider import get_token_provider
+from typing import Optional, Dict, Any, Callable, Awaitable
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
@@ -20,85 +27,155 @@ class LLMResponse:
     success: bool
     error: Optional[str] = None
 
+# Настройки HTTP-клиента GigaChat
+GIGACHAT_MAX_CONCURRENCY = int(os.getenv("GIGACHAT_MAX_CONCURRENCY", "8"))
+GIGACHAT_TIMEOUT_BUDGET = float(os.getenv("GIGACHAT_TIMEOUT_BUDGET", "30"))
+GIGACHAT_CONNECT_TIMEOUT = float(os.getenv("GIGACHAT_CONNECT_TIMEOUT", "5"))
+GIGACHAT_KEEPALIVE_CONNECTIONS = int(os.getenv("GIGACHAT_KEEPALIVE_CONNECTIONS", "8"))
+
+
 class GigaChatClient:
-    """Клиент для GigaChat с правильной OAuth аутентификацией"""
+    """
+    Клиент для GigaChat с правильной OAuth аутентификацией
+    
+    Асинхронный API (agenerate_response) использует общий пул keep-alive
+    соединений httpx.AsyncClient и семафор на число одновременных запросов.
+    Синхронный generate_response - обертка для Celery и админ-панели
+    с собственным пулом соединений и тем же лимитом.
+    
+    Весь вызов (токен + генерация) укладывается в GIGACHAT_TIMEOUT_BUDGET секунд.
+    """
     
     def __init__(self, authorization_key: str):
         self.authorization_key = authorization_key
-        self.oauth_url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
         self.base_url = "https://gigachat.devices.sberbank.ru/api/v1"
         self.model = "GigaChat"
         
-        # Токен доступа и время его истечения
-        self.access_token = None
-        self.token_expires_at = 0
+        # Токен общий для всех клиентов процесса (и процессов через Redis)
+        self.token_provider = get_token_provider(authorization_key)
         
-    def _get_access_token(self) -> Optional[str]:
-        """Получение Access token через OAuth"""
-        try:
-            # Проверяем, нужно ли обновить токен (с запасом в 5 минут)
-            if self.access_token and time.time() < (self.token_expires_at - 300):
-                return self.access_token
-            
-            # Генерируем уникальный RqUID
-            rq_uid = str(uuid.uuid4())
-            
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Accept': 'application/json',
-                'RqUID': rq_uid,
-                'Authorization': f'Basic {self.authorization_key}'
-            }
-            
-            data = {
-                'scope': 'GIGACHAT_API_PERS'
-            }
-            
-            logger.info("Запрашиваем новый Access token от GigaChat...")
-            
-            response = requests.post(
-                self.oauth_url,
-                headers=headers,
-                data=data,
-                timeout=30,
+        self.max_concurrency = GIGACHAT_MAX_CONCURRENCY
+        self.timeout_budget = GIGACHAT_TIMEOUT_BUDGET
+        self._limits = httpx.Limits(
+            max_connections=max(self.max_concurrency, GIGACHAT_KEEPALIVE_CONNECTIONS),
+            max_keepalive_connections=GIGACHAT_KEEPALIVE_CONNECTIONS
+        )
+        
+        # Синхронный пул (создается лениво)
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._sync_lock = threading.Lock()
+        
+        # Асинхронный пул привязан к event loop, в котором создан
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _timeout(self, remaining: float) -> httpx.Timeout:
+        """Таймаут запроса с учетом оставшегося бюджета"""
+        remaining = max(1.0, remaining)
+        return httpx.Timeout(remaining, connect=min(GIGACHAT_CONNECT_TIMEOUT, remaining))
+    
+    def _get_sync_client(self) -> httpx.Client:
+        """Общий синхронный клиент с keep-alive соединениями"""
+        if self._sync_client is None:
+            with self._sync_lock:
+                if self._sync_client is None:
+                    self._sync_client = httpx.Client(
+                        limits=self._limits,
+                        timeout=self._timeout(self.timeout_budget),
+                        verify=False  # Отключаем проверку SSL для корпоративной сети
+                    )
+        return self._sync_client
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Общий асинхронный клиент текущего event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                limits=self._limits,
+                timeout=self._timeout(self.timeout_budget),
                 verify=False  # Отключаем проверку SSL для корпоративной сети
             )
-            
-            if response.status_code == 200:
-                token_data = response.json()
-                self.access_token = token_data.get('access_token')
-                
-                # Токен действует 30 минут
-                self.token_expires_at = time.time() + 1800  # 30 минут
-                
-                logger.info("✅ Access token успешно получен")
-                return self.access_token
-            else:
-                logger.error(f"Ошибка получения токена: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Ошибка при получении Access token: {str(e)}")
-            return None
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_loop = loop
+        return self._async_client
+    
+    def _get_access_token(self, remaining: Optional[float] = None) -> Optional[str]:
+        """Получение Access token из общего провайдера процесса"""
+        return self.token_provider.get_token(
+            self._get_sync_client(),
+            remaining if remaining is not None else self.timeout_budget
+        )
+    
+    async def _aget_access_token(self) -> Optional[str]:
+        """Асинхронное получение Access token из общего провайдера процесса"""
+        return await self.token_provider.aget_token(self._get_async_client())
+    
+    def _build_headers(self, access_token: str) -> Dict[str, str]:
+        """Заголовки запроса с токеном"""
+        return {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
     
     def _get_headers(self) -> Optional[Dict[str, str]]:
         """Получение заголовков для запроса с актуальным токеном"""
         access_token = self._get_access_token()
         if not access_token:
             return None
-            
+        return self._build_headers(access_token)
+    
+    def _build_payload(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """Тело запроса chat/completions"""
         return {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature
         }
     
+    def _error_response(self, error: str) -> LLMResponse:
+        """Ответ с ошибкой"""
+        return LLMResponse(
+            text="",
+            tokens_used=0,
+            model=self.model,
+            success=False,
+            error=error
+        )
+    
+    def _parse_response(self, response: httpx.Response) -> LLMResponse:
+        """Разбор ответа chat/completions"""
+        if response.status_code == 200:
+            data = response.json()
+            
+            return LLMResponse(
+                text=data["choices"][0]["message"]["content"],
+                tokens_used=data.get("usage", {}).get("total_tokens", 0),
+                model=self.model,
+                success=True
+            )
+        
+        if response.status_code == 401:
+            # Токен отозван или истек раньше срока - следующий запрос получит новый
+            self.token_provider.invalidate()
+        
+        logger.error(f"GigaChat API error: {response.status_code} - {response.text}")
+        return self._error_response(f"API error: {response.status_code}")
+    
     def generate_response(self, 
                          prompt: str, 
                          max_tokens: int = 2500,
                          temperature: float = 0.7) -> LLMResponse:
         """
-        Генерация ответа от GigaChat
+        Генерация ответа от GigaChat (синхронно)
         
         Args:
             prompt: Текст запроса
@@ -108,65 +185,165 @@ class GigaChatClient:
         Returns:
             LLMResponse: Ответ от модели
         """
+        deadline = time.monotonic() + self.timeout_budget
+        
+        # Ждем свободный слот не дольше бюджета запроса
+        if not self._sync_semaphore.acquire(timeout=self.timeout_budget):
+            return self._error_response("Превышен лимит одновременных запросов к GigaChat")
+        
         try:
-            headers = self._get_headers()
-            if not headers:
-                return LLMResponse(
-                    text="",
-                    tokens_used=0,
-                    model=self.model,
-                    success=False,
-                    error="Не удалось получить токен доступа"
-                )
+            access_token = self._get_access_token(deadline - time.monotonic())
+            if not access_token:
+                return self._error_response("Не удалось получить токен доступа")
             
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self._error_response("Истек бюджет времени запроса")
             
-            response = requests.post(
+            response = self._get_sync_client().post(
                 f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30,
-                verify=False  # Отключаем проверку SSL для корпоративной сети
+                headers=self._build_headers(access_token),
+                json=self._build_payload(prompt, max_tokens, temperature),
+                timeout=self._timeout(remaining)
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                return LLMResponse(
-                    text=data["choices"][0]["message"]["content"],
-                    tokens_used=data.get("usage", {}).get("total_tokens", 0),
-                    model=self.model,
-                    success=True
-                )
-            else:
-                logger.error(f"GigaChat API error: {response.status_code} - {response.text}")
-                return LLMResponse(
-                    text="",
-                    tokens_used=0,
-                    model=self.model,
-                    success=False,
-                    error=f"API error: {response.status_code}"
-                )
+            return self._parse_response(response)
                 
         except Exception as e:
             logger.error(f"Error calling GigaChat: {str(e)}")
+            return self._error_response(str(e))
+        finally:
+            self._sync_semaphore.release()
+    
+    async def agenerate_response(self,
+                                 prompt: str,
+                                 max_tokens: int = 2500,
+                                 temperature: float = 0.7) -> LLMResponse:
+        """
+        Генерация ответа от GigaChat (асинхронно, без потоков executor)
+        
+        Ожидание слота, получение токена и генерация укладываются
+        в общий бюджет GIGACHAT_TIMEOUT_BUDGET.
+        """
+        try:
+            return await asyncio.wait_for(
+                self._agenerate(prompt, max_tokens, temperature),
+                timeout=self.timeout_budget
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"GigaChat не ответил за {self.timeout_budget} с")
+            return self._error_response("Истек бюджет времени запроса")
+        except Exception as e:
+            logger.error(f"Error calling GigaChat: {str(e)}")
+            return self._error_response(str(e))
+    
+    async def _agenerate(self, prompt: str, max_tokens: int, temperature: float) -> LLMResponse:
+        """Запрос к GigaChat в пределах лимита одновременных запросов"""
+        client = self._get_async_client()
+        async with self._async_semaphore:
+            access_token = await self._aget_access_token()
+            if not access_token:
+                return self._error_response("Не удалось получить токен доступа")
+            
+            response = await client.post(
+                f"{self.base_url}/chat/completions",
+                headers=self._build_headers(access_token),
+                json=self._build_payload(prompt, max_tokens, temperature)
+            )
+            return self._parse_response(response)
+    
+    async def astream_response(self,
+                               prompt: str,
+                               on_delta: Callable[[str], Awaitable[None]],
+                               max_tokens: int = 2500,
+                               temperature: float = 0.7) -> LLMResponse:
+        """
+        Потоковая генерация ответа (SSE, stream=true)
+        
+        Args:
+            prompt: Текст запроса
+            on_delta: Корутина, получающая накопленный текст после каждого фрагмента
+            max_tokens: Максимальное количество токенов
+            temperature: Температура генерации (0.0-1.0)
+            
+        Returns:
+            LLMResponse: Полный ответ после завершения потока
+        """
+        try:
+            return await asyncio.wait_for(
+                self._astream(prompt, on_delta, max_tokens, temperature),
+                timeout=self.timeout_budget
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"GigaChat не завершил поток за {self.timeout_budget} с")
+            return self._error_response("Истек бюджет времени запроса")
+        except Exception as e:
+            logger.error(f"Error streaming from GigaChat: {str(e)}")
+            return self._error_response(str(e))
+    
+    async def _astream(self, prompt: str, on_delta: Callable[[str], Awaitable[None]],
+                       max_tokens: int, temperature: float) -> LLMResponse:
+        """Чтение SSE потока chat/completions"""
+        client = self._get_async_client()
+        async with self._async_semaphore:
+            access_token = await self._aget_access_token()
+            if not access_token:
+                return self._error_response("Не удалось получить токен доступа")
+            
+            payload = self._build_payload(prompt, max_tokens, temperature)
+            payload["stream"] = True
+            headers = self._build_headers(access_token)
+            headers["Accept"] = "text/event-stream"
+            
+            parts = []
+            tokens_used = 0
+            
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                headers=headers,
+                json=payload
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    return self._parse_response(response)
+                
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    event = json.loads(data)
+                    usage = event.get("usage")
+                    if usage:
+                        tokens_used = usage.get("total_tokens", tokens_used)
+                    
+                    for choice in event.get("choices", []):
+                        content = choice.get("delta", {}).get("content")
+                        if content:
+                            parts.append(content)
+                            await on_delta("".join(parts))
+            
             return LLMResponse(
-                text="",
-                tokens_used=0,
+                text="".join(parts),
+                tokens_used=tokens_used,
                 model=self.model,
-                success=False,
-                error=str(e)
+                success=True
             )
+    
+    async def aclose(self):
+        """Закрытие пулов соединений"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
+    
+    def close(self):
+        """Закрытие синхронного пула соединений"""
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
 
 class SimpleLLMClient:
     """Упрощенный клиент - только GigaChat"""
@@ -190,8 +367,39 @@ class SimpleLLMClient:
         Returns:
             LLMResponse: Ответ от модели
         """
-        # Формируем промпт для генерации ответа
-        prompt = f"""Ты - справочная система по корпоративным документам. Твоя задача - предоставлять точную информацию из предоставленных документов.
+        return self.gigachat.generate_response(
+            prompt=self._build_answer_prompt(context, question),
+            max_tokens=max_tokens,
+            temperature=0.1  # Очень низкая температура для максимальной точности
+        )
+    
+    async def agenerate_answer(self,
+                               context: str,
+                               question: str,
+                               max_tokens: int = 2500) -> LLMResponse:
+        """Асинхронная версия generate_answer для бота"""
+        return await self.gigachat.agenerate_response(
+            prompt=self._build_answer_prompt(context, question),
+            max_tokens=max_tokens,
+            temperature=0.1  # Очень низкая температура для максимальной точности
+        )
+    
+    async def astream_answer(self,
+                             context: str,
+                             question: str,
+                             on_delta: Callable[[str], Awaitable[None]],
+                             max_tokens: int = 2500) -> LLMResponse:
+        """Потоковая версия generate_answer: on_delta получает накопленный текст"""
+        return await self.gigachat.astream_response(
+            prompt=self._build_answer_prompt(context, question),
+            on_delta=on_delta,
+            max_tokens=max_tokens,
+            temperature=0.1  # Очень низкая температура для максимальной точности
+        )
+    
+    def _build_answer_prompt(self, context: str, question: str) -> str:
+        """Промпт для генерации ответа на основе контекста"""
+        return f"""Ты - справочная система по корпоративным документам. Твоя задача - предоставлять точную информацию из предоставленных документов.
 
 КОНТЕКСТ ИЗ ДОКУМЕНТОВ:
 {context}
@@ -201,8 +409,9 @@ class SimpleLLMClient:
 2. Если в документах есть точные числа, даты или фразы - цитируй их дословно
 3. Не добавляй общую информацию или знания извне
 4. Если информации нет в документах - так и скажи
-5. Отвечай кратко и по существу
+5. Отвечай кратко и по существу, на русском языке
 6. При упоминании конкретных дат или чисел - указывай их точно
+7. Структурируй ответ нумерованными списками, где это уместно
 
 ПРИМЕР ХОРОШЕГО ОТВЕТА:
 Вопрос: "Какие установлены дни для расчетов?"
@@ -211,12 +420,6 @@ class SimpleLLMClient:
 ВОПРОС ПОЛЬЗОВАТЕЛЯ: {question}
 
 ОТВЕТ:"""
-
-        return self.gigachat.generate_response(
-            prompt=prompt,
-            max_tokens=max_tokens,
-            temperature=0.1  # Очень низкая температура для максимальной точности
-        )
     
     def health_check(self) -> bool:
         """Проверка работоспособности LLM"""
@@ -0,0 +1,132 @@
+"""
+Общий реестр моделей эмбеддингов
+Модель загружается один раз на процесс и переиспользуется всеми сервисами
+"""
+
+import os
+import time
+import logging
+import resource
+import threading
+from typing import Dict, Any, Optional
+from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "cointegrated/rubert-tiny2")
+
+# Загруженные модели и статистика их загрузки (по имени модели)
+_models: Dict[str, SentenceTransformer] = {}
+_model_stats: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def _get_rss_mb() -> float:
+    """Текущий объем резидентной памяти процесса в МБ"""
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Fallback для систем без /proc (пиковое значение, Linux - в КБ)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _load_model(model_name: str) -> SentenceTransformer:
+    """Загрузка модели с замером времени и памяти"""
+    logger.info(f"Загружаем модель эмбеддингов {model_name}...")
+
+    rss_before = _get_rss_mb()
+    start_time = time.perf_counter()
+
+    model = SentenceTransformer(model_name)
+
+    load_time = time.perf_counter() - start_time
+    rss_after = _get_rss_mb()
+
+    try:
+        parameters_mb = sum(
+            p.numel() * p.element_size() for p in model.parameters()
+        ) / (1024 * 1024)
+    except Exception:
+        parameters_mb = None
+
+    _model_stats[model_name] = {
+        'model_name': model_name,
+        'embedding_dimension': model.get_sentence_embedding_dimension(),
+        'load_time_seconds': round(load_time, 3),
+        'rss_delta_mb': round(rss_after - rss_before, 1),
+        'rss_after_mb': round(rss_after, 1),
+        'parameters_mb': round(parameters_mb, 1) if parameters_mb is not None else None,
+        'loaded_at': time.time(),
+        'pid': os.getpid()
+    }
+
+    logger.info(
+        f"✅ Модель {model_name} загружена за {load_time:.2f} с "
+        f"(память процесса +{rss_after - rss_before:.1f} МБ, всего {rss_after:.1f} МБ)"
+    )
+    return model
+
+
+def get_embedding_model(model_name: Optional[str] = None) -> SentenceTransformer:
+    """
+    Получение общей модели эмбеддингов
+
+    Модель загружается при первом обращении и дальше переиспользуется
+    всеми потоками процесса (SimpleRAG, SearchService, Celery worker).
+
+    Args:
+        model_name: Имя модели (по умолчанию EMBEDDING_MODEL_NAME)
+
+    Returns:
+        SentenceTransformer: Загруженная модель
+    """
+    model_name = model_name or DEFAULT_MODEL_NAME
+
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Повторная проверка: модель могла загрузить другая нить
+        model = _models.get(model_name)
+        if model is None:
+            model = _load_model(model_name)
+            _models[model_name] = model
+
+    return model
+
+
+def warmup(model_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Прогрев модели при старте процесса
+
+    Загружает модель и выполняет пробное кодирование, чтобы первый
+    пользовательский запрос не платил за загрузку и инициализацию.
+
+    Returns:
+        Dict: Статистика загрузки модели
+    """
+    model_name = model_name or DEFAULT_MODEL_NAME
+    model = get_embedding_model(model_name)
+
+    start_time = time.perf_counter()
+    model.encode(["Прогрев модели"])
+    warmup_time = time.perf_counter() - start_time
+
+    stats = _model_stats.setdefault(model_name, {'model_name': model_name})
+    stats['warmup_encode_seconds'] = round(warmup_time, 3)
+
+    logger.info(f"🔥 Модель {model_name} прогрета за {warmup_time:.3f} с")
+    return dict(stats)
+
+
+def is_model_loaded(model_name: Optional[str] = None) -> bool:
+    """Проверка, загружена ли модель в текущем процессе"""
+    return (model_name or DEFAULT_MODEL_NAME) in _models
+
+
+def get_model_stats() -> Dict[str, Dict[str, Any]]:
+    """Статистика загруженных моделей (время загрузки, память)"""
+    return {name: dict(stats) for name, stats in _model_stats.items()}
@@ -0,0 +1,86 @@
+"""
+Подготовленные (PREPARE) SQL-запросы для горячих путей поиска
+- Запрос подготавливается один раз на соединение, дальше выполняется через EXECUTE:
+  PostgreSQL не разбирает текст и после нескольких вызовов переиспользует план
+- Подготовленные имена хранятся в info соединения пула (живут вместе с соединением)
+- С PgBouncer (DB_PGBOUNCER=true) запрос выполняется обычным образом:
+  в режиме transaction подготовленный запрос недоступен на другом серверном соединении
+"""
+
+import re
+import logging
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+try:
+    from shared.models.database import DB_PGBOUNCER
+except ImportError:
+    try:
+        from models.database import DB_PGBOUNCER
+    except ImportError:
+        from services.shared.models.database import DB_PGBOUNCER
+
+logger = logging.getLogger(__name__)
+
+# Именованный параметр :name (но не приведение типа ::type)
+_PARAM = re.compile(r"(?<![:\w]):([a-z_][a-z0-9_]*)")
+
+_INFO_KEY = "prepared_statements"
+
+# SQLSTATE 26000: подготовленного запроса с таким именем на сервере нет (например, после DISCARD ALL)
+_UNDEFINED_PREPARED_STATEMENT = "26000"
+
+_IS_PREPARED = text("SELECT EXISTS (SELECT 1 FROM pg_prepared_statements WHERE name = :name)")
+
+
+class PreparedStatement:
+    """
+    SQL-запрос с типизированными именованными параметрами
+
+    Args:
+        name: Имя подготовленного запроса (уникально в процессе; при изменении SQL - новая версия)
+        sql: Текст запроса с параметрами :name
+        param_types: Типы PostgreSQL параметров в порядке их объявления
+    """
+
+    def __init__(self, name: str, sql: str, param_types: List[Tuple[str, str]]):
+        self.name = name
+        self.sql = sql
+        self.param_names = [param for param, _ in param_types]
+        positions = {param: index + 1 for index, param in enumerate(self.param_names)}
+
+        unknown = set(_PARAM.findall(sql)) - set(positions)
+        if unknown:
+            raise ValueError(f"Не объявлены типы параметров {sorted(unknown)} запроса {name}")
+
+        types = ", ".join(pg_type for _, pg_type in param_types)
+        body = _PARAM.sub(lambda match: f"${positions[match.group(1)]}", sql)
+        self.prepare_sql = f"PREPARE {name} ({types}) AS {body}"
+        self.execute_clause = text(f"EXECUTE {name} ({', '.join(':' + param for param in self.param_names)})")
+        self.plain_clause = text(sql)
+
+    def execute(self, db: Session, params: Dict[str, Any]):
+        """Выполнение запроса (с подготовкой на этом соединении при первом вызове)"""
+        if DB_PGBOUNCER:
+            return db.execute(self.plain_clause, params)
+
+        connection = db.connection()
+        prepared = connection.connection.info.setdefault(_INFO_KEY, set())
+        if self.name not in prepared:
+            # PREPARE живет в сессии сервера и переживает ROLLBACK: повторный PREPARE дал бы 42P05
+            # и прервал транзакцию, поэтому сначала проверяем, не подготовлен ли запрос уже
+            if not connection.execute(_IS_PREPARED, {'name': self.name}).scalar():
+                # no_parameters: текст уходит драйверу как есть (без подстановки по %)
+                connection.exec_driver_sql(self.prepare_sql, execution_options={'no_parameters': True})
+                logger.debug(f"Подготовлен запрос {self.name}")
+            prepared.add(self.name)
+        try:
+            return connection.execute(self.execute_clause, {param: params[param] for param in self.param_names})
+        except DBAPIError as e:
+            # Ошибка выполнения (например, statement_timeout) не отменяет PREPARE;
+            # забываем имя, только если запроса на сервере больше нет
+            if getattr(e.orig, 'pgcode', None) == _UNDEFINED_PREPARED_STATEMENT:
+                prepared.discard(self.name)
+            raise
@@ -0,0 +1,200 @@
+"""
+Фоновая запись журнала запросов (query_logs)
+- Запросы логируются через ограниченную очередь в памяти, ответ пользователю не ждет INSERT
+- Отдельный поток пишет накопленные записи одним многострочным INSERT
+  каждые QUERY_LOG_FLUSH_MS мс или по QUERY_LOG_BATCH_SIZE записей
+- Если очередь заполнена (база медленная или недоступна), запись отбрасывается
+  и учитывается в счетчике dropped
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "200"))
+QUERY_LOG_FLUSH_MS = int(os.getenv("QUERY_LOG_FLUSH_MS", "500"))
+# Сколько запрос может ждать места в очереди, прежде чем запись будет отброшена
+QUERY_LOG_PUT_TIMEOUT_MS = int(os.getenv("QUERY_LOG_PUT_TIMEOUT_MS", "10"))
+
+
+def _load_models():
+    try:
+        from shared.models.database import SessionLocal
+        from shared.models.query_log import QueryLog
+    except ImportError:
+        try:
+            from models.database import SessionLocal
+            from models.query_log import QueryLog
+        except ImportError:
+            from services.shared.models.database import SessionLocal
+            from services.shared.models.query_log import QueryLog
+    return SessionLocal, QueryLog
+
+
+class QueryLogWriter:
+    """Очередь записей журнала запросов и поток, пишущий их пакетами"""
+
+    def __init__(self, queue_size: int = QUERY_LOG_QUEUE_SIZE,
+                 batch_size: int = QUERY_LOG_BATCH_SIZE,
+                 flush_ms: int = QUERY_LOG_FLUSH_MS,
+                 put_timeout_ms: int = QUERY_LOG_PUT_TIMEOUT_MS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.put_timeout = put_timeout_ms / 1000
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        # После fork (воркеры Celery) поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    atexit.register(self.stop)
+                self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, user_id: int, query: str, response: Optional[str],
+                response_time: Optional[float] = None,
+                similarity_score: Optional[float] = None,
+                documents_used: Optional[str] = None) -> bool:
+        """
+        Постановка записи в очередь
+
+        Returns:
+            bool: False, если очередь заполнена и запись отброшена
+        """
+        self._ensure_started()
+        row = {
+            'user_id': user_id,
+            'query': query,
+            'response': response,
+            'response_time': response_time,
+            'similarity_score': similarity_score,
+            'documents_used': documents_used,
+            'created_at': datetime.now(timezone.utc)
+        }
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            # Не засоряем лог при длительной перегрузке
+            if dropped == 1 or dropped % 100 == 0:
+                logger.warning(f"⚠️ Очередь журнала запросов заполнена, отброшено записей: {dropped}")
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            if stopping:
+                # Дописываем все, что успели поставить в очередь до остановки
+                while True:
+                    try:
+                        row = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if row is not None:
+                        batch.append(row)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """Многострочный INSERT пакета в отдельной сессии"""
+        SessionLocal, QueryLog = _load_models()
+        db = SessionLocal()
+        try:
+            db.execute(QueryLog.__table__.insert(), batch)
+            db.commit()
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+        except Exception as e:
+            db.rollback()
+            if len(batch) > 1:
+                # Одна плохая запись (например, пользователь уже удален) не должна терять весь пакет
+                logger.warning(f"⚠️ Пакет журнала запросов не записан, пишем по одной записи: {e}")
+                db.close()
+                for row in batch:
+                    self._write([row])
+                return
+            logger.error(f"❌ Ошибка записи журнала запросов: {e}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            db.close()
+
+    def stop(self, timeout: float = 5.0):
+        """Остановка потока с записью оставшейся очереди"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("⚠️ Очередь журнала запросов заполнена при остановке")
+            return
+        thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'max_queue': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches
+            }
+
+
+_writer = QueryLogWriter()
+
+
+def get_query_log_writer() -> QueryLogWriter:
+    return _writer
+
+
+def enqueue_query_log(user_id: int, query: str, response: Optional[str],
+                      response_time: Optional[float] = None,
+                      similarity_score: Optional[float] = None,
+                      documents_used: Optional[str] = None) -> bool:
+    """Запись в журнал запросов через общую очередь процесса (не блокирует запрос)"""
+    return _writer.enqueue(user_id, query, response, response_time, similarity_score, documents_used)
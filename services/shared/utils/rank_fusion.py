@@ -0,0 +1,148 @@
+"""
+Объединение результатов нескольких ретриверов (vector, text, fuzzy, salary_specific)
+- rrf    - Reciprocal Rank Fusion: sum(w / (k + rank)), не зависит от шкал оценок
+- zscore - взвешенная сумма z-нормализованных оценок каждого ретривера
+- Бюджеты кандидатов задаются на каждый ретривер как доля от limit
+
+Методы регистрируются в FUSION_METHODS, выбор - FUSION_METHOD.
+"""
+
+import os
+import math
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Порядок ретриверов: при равных оценках выше тот, что раньше в списке
+RETRIEVERS = ('salary_specific', 'vector', 'text', 'fuzzy')
+
+DEFAULT_WEIGHTS = {'salary_specific': 1.5, 'vector': 1.0, 'text': 0.8, 'fuzzy': 0.5}
+# Бюджет кандидатов ретривера = ceil(limit * доля)
+DEFAULT_BUDGETS = {'salary_specific': 0.2, 'vector': 1.5, 'text': 1.0, 'fuzzy': 0.5}
+
+# Отклонение меньше этой доли от среднего - погрешность округления, оценки считаются равными
+_ZERO_STD_TOLERANCE = 1e-9
+
+# Кандидат ретривера: (чанк, исходная оценка ретривера), список отсортирован по убыванию
+RankedList = List[Tuple[Dict, float]]
+
+
+def _parse_mapping(raw: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """Разбор строки вида 'vector=1.0,text=0.8' поверх значений по умолчанию"""
+    result = dict(defaults)
+    for item in filter(None, (part.strip() for part in raw.split(','))):
+        name, _, value = item.partition('=')
+        try:
+            result[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Некорректное значение '{item}', используется значение по умолчанию")
+    return result
+
+
+@dataclass
+class FusionConfig:
+    """Настройки объединения ретриверов"""
+    method: str = 'rrf'
+    rrf_k: int = 60
+    weights: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_WEIGHTS))
+    budgets: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_BUDGETS))
+
+    @classmethod
+    def from_env(cls) -> "FusionConfig":
+        return cls(
+            method=os.getenv("FUSION_METHOD", "rrf").lower(),
+            rrf_k=int(os.getenv("FUSION_RRF_K", "60")),
+            weights=_parse_mapping(os.getenv("FUSION_WEIGHTS", ""), DEFAULT_WEIGHTS),
+            budgets=_parse_mapping(os.getenv("FUSION_BUDGETS", ""), DEFAULT_BUDGETS)
+        )
+
+    def budget(self, retriever: str, limit: int) -> int:
+        """Число кандидатов, запрашиваемых у ретривера"""
+        return max(1, math.ceil(limit * self.budgets.get(retriever, 1.0)))
+
+    def describe(self) -> str:
+        if self.method == 'rrf':
+            return f"rrf(k={self.rrf_k})"
+        return self.method
+
+
+def rrf_scores(ranked: Dict[str, RankedList], config: FusionConfig) -> Dict[int, float]:
+    """Reciprocal Rank Fusion: вклад ретривера зависит только от позиции чанка"""
+    scores: Dict[int, float] = {}
+    for retriever, candidates in ranked.items():
+        weight = config.weights.get(retriever, 1.0)
+        for rank, (chunk, _) in enumerate(candidates, start=1):
+            scores[chunk['id']] = scores.get(chunk['id'], 0.0) + weight / (config.rrf_k + rank)
+    return scores
+
+
+def zscore_scores(ranked: Dict[str, RankedList], config: FusionConfig) -> Dict[int, float]:
+    """Взвешенная сумма z-оценок: шкалы ретриверов приводятся к среднему 0 и отклонению 1"""
+    scores: Dict[int, float] = {}
+    for retriever, candidates in ranked.items():
+        if not candidates:
+            continue
+        weight = config.weights.get(retriever, 1.0)
+        values = [score for _, score in candidates]
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+        # Сумма одинаковых float дает ненулевое отклонение порядка 1e-17
+        if std <= _ZERO_STD_TOLERANCE * max(1.0, abs(mean)):
+            std = 0.0
+        for chunk, score in candidates:
+            z = (score - mean) / std if std > 0 else 0.0
+            # Сдвиг на 1 сохраняет вклад единственного кандидата ретривера
+            scores[chunk['id']] = scores.get(chunk['id'], 0.0) + weight * (z + 1.0)
+    return scores
+
+
+FUSION_METHODS: Dict[str, Callable[[Dict[str, RankedList], FusionConfig], Dict[int, float]]] = {
+    'rrf': rrf_scores,
+    'zscore': zscore_scores
+}
+
+
+def fuse(ranked: Dict[str, RankedList], config: FusionConfig, limit: int) -> List[Dict]:
+    """
+    Объединение кандидатов ретриверов в один ранжированный список
+
+    Args:
+        ranked: Ретривер -> кандидаты по убыванию его собственной оценки
+        config: Метод, веса и бюджеты
+        limit: Сколько чанков вернуть
+
+    Returns:
+        List[Dict]: Чанки с fusion_score, retrievers и search_type (первый
+        ретривер из RETRIEVERS, нашедший чанк)
+    """
+    method = FUSION_METHODS.get(config.method)
+    if method is None:
+        logger.warning(f"Неизвестный метод объединения '{config.method}', используется rrf")
+        method = rrf_scores
+
+    # Каждый ретривер участвует не более чем своим бюджетом
+    ranked = {
+        retriever: candidates[:config.budget(retriever, limit)]
+        for retriever, candidates in ranked.items() if candidates
+    }
+    scores = method(ranked, config)
+
+    chunks: Dict[int, Dict] = {}
+    order = {name: position for position, name in enumerate(RETRIEVERS)}
+    for retriever in sorted(ranked, key=lambda name: order.get(name, len(order))):
+        for chunk, _ in ranked[retriever]:
+            merged = chunks.get(chunk['id'])
+            if merged is None:
+                merged = chunks[chunk['id']] = {**chunk, 'search_type': retriever, 'retrievers': []}
+            merged['retrievers'].append(retriever)
+
+    fused = sorted(
+        chunks.values(),
+        key=lambda chunk: (scores.get(chunk['id'], 0.0), chunk.get('similarity') or 0.0),
+        reverse=True
+    )
+    for chunk in fused:
+        chunk['fusion_score'] = round(scores.get(chunk['id'], 0.0), 6)
+    return fused[:limit]
@@ -0,0 +1,174 @@
+"""
+Офлайн-оценка поиска чанков по журналу запросов (query_logs)
+- Вопросы берутся из query_logs и прогоняются через каждую конфигурацию FusionConfig
+- Качество: nDCG@k по пулу результатов всех конфигураций (pooled nDCG)
+- Скорость: среднее, p50 и p95 времени поиска (эмбеддинг считается один раз)
+
+Разметка релевантности:
+- файл JSONL: {"query": ..., "relevant_chunk_ids": [...], "relevant_document_ids": [...]}
+- иначе documents_used из query_logs (названия документов -> id)
+"""
+
+import json
+import math
+import time
+import logging
+from typing import Dict, Any, List, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+try:
+    from .rank_fusion import FusionConfig
+except ImportError:
+    from rank_fusion import FusionConfig
+
+logger = logging.getLogger(__name__)
+
+# Оценка релевантности: чанк из разметки важнее чанка из нужного документа
+GAIN_CHUNK = 2
+GAIN_DOCUMENT = 1
+
+
+def parse_config_spec(spec: str, base: Optional[FusionConfig] = None) -> FusionConfig:
+    """Конфигурация из строки 'rrf', 'rrf:20' или 'zscore' (веса и бюджеты - из base)"""
+    base = base or FusionConfig.from_env()
+    method, _, argument = spec.partition(':')
+    config = FusionConfig(method=method.strip().lower(), rrf_k=base.rrf_k,
+                          weights=dict(base.weights), budgets=dict(base.budgets))
+    if argument:
+        config.rrf_k = int(argument)
+    return config
+
+
+def load_labels(path: str) -> Dict[str, Dict[str, set]]:
+    """Разметка из JSONL-файла: вопрос -> id релевантных чанков и документов"""
+    labels = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            labels[item['query']] = {
+                'chunks': set(item.get('relevant_chunk_ids', [])),
+                'documents': set(item.get('relevant_document_ids', []))
+            }
+    return labels
+
+
+def load_eval_queries(db: Session, limit: int = 100,
+                      labels: Optional[Dict[str, Dict[str, set]]] = None) -> List[Dict[str, Any]]:
+    """
+    Вопросы для оценки
+
+    С разметкой из файла оцениваются только размеченные вопросы. Иначе
+    берутся последние уникальные вопросы из query_logs, для которых
+    documents_used удается сопоставить с документами.
+    """
+    if labels:
+        return [{'query': query, **relevant} for query, relevant in list(labels.items())[:limit]]
+
+    titles = {
+        row.title: row.id for row in db.execute(text(
+            "SELECT id, title FROM documents WHERE processing_status = 'completed' AND title IS NOT NULL"
+        ))
+    }
+    rows = db.execute(text("""
+        SELECT DISTINCT ON (query) query, documents_used, created_at
+        FROM query_logs
+        WHERE documents_used IS NOT NULL
+          AND query NOT LIKE 'FAQ:%'
+          AND response NOT LIKE 'LLM_ERROR%'
+          AND response NOT LIKE 'SYSTEM_ERROR%'
+          AND response <> 'NO_CHUNKS_FOUND'
+        ORDER BY query, created_at DESC
+    """)).fetchall()
+    rows.sort(key=lambda row: row.created_at, reverse=True)
+
+    queries = []
+    for row in rows:
+        documents = {titles[title.strip()] for title in row.documents_used.split(',') if title.strip() in titles}
+        if documents:
+            queries.append({'query': row.query, 'chunks': set(), 'documents': documents})
+        if len(queries) >= limit:
+            break
+    return queries
+
+
+def _gain(chunk: Dict, relevant: Dict[str, Any]) -> int:
+    if chunk['id'] in relevant['chunks']:
+        return GAIN_CHUNK
+    if chunk['document_id'] in relevant['documents']:
+        return GAIN_DOCUMENT
+    return 0
+
+
+def _dcg(gains: List[int]) -> float:
+    return sum((2 ** gain - 1) / math.log2(position + 2) for position, gain in enumerate(gains))
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def evaluate_configs(rag, db: Session, queries: List[Dict[str, Any]],
+                     configs: List[FusionConfig], k: int = 10) -> Dict[str, Any]:
+    """
+    Прогон вопросов через конфигурации объединения
+
+    Args:
+        rag: Экземпляр SimpleRAG (кэши не используются)
+        db: Сессия базы данных
+        queries: Результат load_eval_queries
+        configs: Сравниваемые конфигурации
+        k: Глубина nDCG и число запрашиваемых чанков
+
+    Returns:
+        Dict: Отчет по каждой конфигурации и время эмбеддингов
+    """
+    original_config = rag.fusion_config
+    embedding_times = []
+    results: Dict[str, Dict[str, list]] = {config.describe(): {'ndcg': [], 'latency': []} for config in configs}
+
+    try:
+        for item in queries:
+            start_time = time.perf_counter()
+            embedding = rag.create_embedding(item['query'])
+            embedding_times.append(time.perf_counter() - start_time)
+
+            runs = {}
+            for config in configs:
+                rag.fusion_config = config
+                start_time = time.perf_counter()
+                chunks = rag._search_relevant_chunks_uncached(db, item['query'], k, question_embedding=embedding)
+                results[config.describe()]['latency'].append(time.perf_counter() - start_time)
+                runs[config.describe()] = chunks[:k]
+                db.rollback()  # Сбрасываем SET LOCAL между прогонами
+
+            # Идеальный порядок - по пулу найденных всеми конфигурациями и размеченных чанков
+            pool = {chunk['id']: _gain(chunk, item) for chunks in runs.values() for chunk in chunks}
+            for chunk_id in item['chunks']:
+                pool[chunk_id] = GAIN_CHUNK
+            ideal = _dcg(sorted(pool.values(), reverse=True)[:k])
+
+            for name, chunks in runs.items():
+                dcg = _dcg([_gain(chunk, item) for chunk in chunks])
+                results[name]['ndcg'].append(dcg / ideal if ideal > 0 else 0.0)
+    finally:
+        rag.fusion_config = original_config
+
+    report = {'queries': len(queries), 'k': k, 'configs': {}}
+    if embedding_times:
+        report['embedding_ms_avg'] = round(sum(embedding_times) / len(embedding_times) * 1000, 2)
+    for name, values in results.items():
+        latency = values['latency']
+        report['configs'][name] = {
+            f'ndcg@{k}': round(sum(values['ndcg']) / len(values['ndcg']), 4) if values['ndcg'] else 0.0,
+            'latency_ms_avg': round(sum(latency) / len(latency) * 1000, 2) if latency else 0.0,
+            'latency_ms_p50': round(_percentile(latency, 50) * 1000, 2),
+            'latency_ms_p95': round(_percentile(latency, 95) * 1000, 2)
+        }
+    return report
@@ -7,17 +7,24 @@ import logging
 from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from sqlalchemy.orm import Session
+from sqlalchemy import text
 
 # Исправляем импорты на абсолютные
 try:
     from services.shared.utils.embeddings import EmbeddingService
     from services.shared.utils.llm_service import LLMService
+    from services.shared.utils.vector_index import apply_search_settings
+    from services.shared.utils.chunk_quality import CHUNK_TYPE_CONTENT
+    from services.shared.utils.context_expansion import expand_context
     from services.shared.models.database import SessionLocal
     from services.shared.models.document import DocumentChunk, Document
 except ImportError:
     # Fallback для случая, если модули не найдены
     from utils.embeddings import EmbeddingService
     from utils.llm_service import LLMService
+    from utils.vector_index import apply_search_settings
+    from utils.chunk_quality import CHUNK_TYPE_CONTENT
+    from utils.context_expansion import expand_context
     from models.database import SessionLocal
     from models.document import DocumentChunk, Document
 
@@ -90,53 +97,124 @@ class SearchService:
     def _perform_search(self, query_embedding: List[float], max_results: int, min_similarity: float) -> List[Dict[str, Any]]:
         """
         Выполняет поиск по эмбеддингам
+        
+        Основной путь - top-k в pgvector; если он недоступен, используется
+        векторизованный поиск по матрице нормализованных эмбеддингов в NumPy.
         """
+        if not query_embedding:
+            return []
+        
         session = SessionLocal()
         try:
-            # Получаем все чанки с эмбеддингами
-            chunks = session.query(DocumentChunk).join(Document).filter(
-                DocumentChunk.embedding_vector.isnot(None)
-            ).all()
-            
-            if not chunks:
-                return []
-            
-            # Вычисляем схожесть для каждого чанка
-            similarities = []
-            query_embedding_np = np.array(query_embedding)
-            
-            for chunk in chunks:
-                try:
-                    chunk_embedding = np.array(chunk.embedding_vector)
-                    
-                    # Косинусная схожесть
-                    similarity = np.dot(query_embedding_np, chunk_embedding) / (
-                        np.linalg.norm(query_embedding_np) * np.linalg.norm(chunk_embedding)
-                    )
-                    
-                    if similarity >= min_similarity:
-                        similarities.append({
-                            'chunk_id': chunk.id,
-                            'content': chunk.content,
-                            'similarity': float(similarity),
-                            'document_name': chunk.document.original_filename,
-                            'document_id': chunk.document.id,
-                            'chunk_index': chunk.chunk_index,
-                            'content_length': chunk.content_length
-                        })
-                        
-                except Exception as e:
-                    logger.warning(f"Ошибка при обработке чанка {chunk.id}: {e}")
-                    continue
-            
-            # Сортируем по убыванию схожести
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            return similarities[:max_results]
+            try:
+                return self._pgvector_search(session, query_embedding, max_results, min_similarity)
+            except Exception as e:
+                logger.warning(f"pgvector поиск недоступен, используем NumPy: {e}")
+                session.rollback()
+                return self._numpy_search(session, query_embedding, max_results, min_similarity)
             
         finally:
             session.close()
     
+    def _pgvector_search(self, session: Session, query_embedding: List[float],
+                         max_results: int, min_similarity: float) -> List[Dict[str, Any]]:
+        """
+        Top-k по косинусному расстоянию внутри PostgreSQL (индекс pgvector)
+        """
+        apply_search_settings(session, max_results)
+        
+        result = session.execute(text("""
+            SELECT dc.id, dc.document_id, dc.chunk_index, dc.content, dc.content_length,
+                   d.original_filename,
+                   1 - (dc.embedding_vector <=> :embedding) AS similarity
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+            WHERE dc.embedding_vector IS NOT NULL
+              AND dc.chunk_type = 'content'
+            ORDER BY dc.embedding_vector <=> :embedding
+            LIMIT :limit
+        """), {
+            'embedding': str(list(query_embedding)).replace(' ', ''),
+            'limit': max_results
+        })
+        
+        return [
+            {
+                'chunk_id': row.id,
+                'content': row.content,
+                'similarity': float(row.similarity),
+                'document_name': row.original_filename,
+                'document_id': row.document_id,
+                'chunk_index': row.chunk_index,
+                'content_length': row.content_length
+            }
+            for row in result
+            if row.similarity >= min_similarity
+        ]
+    
+    def _numpy_search(self, session: Session, query_embedding: List[float],
+                      max_results: int, min_similarity: float) -> List[Dict[str, Any]]:
+        """
+        Офлайн-поиск: одна матрица эмбеддингов, одно умножение и argpartition
+        """
+        # Метаданные и названия документов одним запросом, без N+1 по chunk.document
+        rows = session.query(
+            DocumentChunk.id,
+            DocumentChunk.document_id,
+            DocumentChunk.chunk_index,
+            DocumentChunk.content_length,
+            DocumentChunk.embedding_vector,
+            Document.original_filename
+        ).join(Document, DocumentChunk.document_id == Document.id).filter(
+            DocumentChunk.embedding_vector.isnot(None),
+            DocumentChunk.chunk_type == CHUNK_TYPE_CONTENT
+        ).all()
+        
+        if not rows:
+            return []
+        
+        matrix = np.asarray([row.embedding_vector for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1.0
+        matrix /= norms[:, None]
+        
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        query /= query_norm
+        
+        similarities = matrix @ query
+        
+        k = min(max_results, len(rows))
+        top_indices = np.argpartition(-similarities, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-similarities[top_indices])]
+        top_indices = [i for i in top_indices if similarities[i] >= min_similarity]
+        
+        if not top_indices:
+            return []
+        
+        # Текст загружаем только для попавших в top-k чанков
+        top_ids = [rows[i].id for i in top_indices]
+        contents = dict(
+            session.query(DocumentChunk.id, DocumentChunk.content).filter(
+                DocumentChunk.id.in_(top_ids)
+            ).all()
+        )
+        
+        return [
+            {
+                'chunk_id': rows[i].id,
+                'content': contents.get(rows[i].id, ''),
+                'similarity': float(similarities[i]),
+                'document_name': rows[i].original_filename,
+                'document_id': rows[i].document_id,
+                'chunk_index': rows[i].chunk_index,
+                'content_length': rows[i].content_length
+            }
+            for i in top_indices
+        ]
+    
     def _determine_search_quality(self, similarity: float) -> str:
         """
         Определяет качество поиска на основе схожести
@@ -155,105 +233,53 @@ class SearchService:
     def search_with_context(self, query: str, context_size: int = 3) -> Dict[str, Any]:
         """
         Поиск с расширенным контекстом (соседние чанки)
+        
+        Соседи лучшего чанка дочитываются одним запросом, перекрытие чанков
+        вырезается, а ответ LLM формируется один раз - уже по расширенному контексту.
         """
         try:
-            # Выполняем обычный поиск
-            search_result = self.search(query, max_results=1)
+            query_embedding = self.embedding_service.create_embedding(query)
+            search_results = self._perform_search(query_embedding, 1, 0.3)
             
-            if not search_result['results']:
-                return search_result
+            if not search_results:
+                return {
+                    'query': query,
+                    'results': [],
+                    'formatted_answer': "❌ К сожалению, информация по вашему запросу не найдена.",
+                    'total_found': 0,
+                    'search_quality': 'no_results'
+                }
             
-            best_result = search_result['results'][0]
+            best_result = search_results[0]
             
-            # Получаем соседние чанки для контекста
-            context_chunks = self._get_context_chunks(
-                best_result['document_id'],
-                best_result['chunk_index'],
-                context_size
-            )
+            session = SessionLocal()
+            try:
+                passage = expand_context(session, [best_result], window=context_size, top_k=1)[0]
+            finally:
+                session.close()
             
-            # Объединяем контекст
-            full_context = self._merge_context(context_chunks, best_result['chunk_index'])
+            context_results = [{
+                'content': passage['content'],
+                'similarity': best_result['similarity'],
+                'document_name': best_result['document_name'],
+                'chunk_index': best_result['chunk_index']
+            }]
             
-            # Создаем расширенный результат
-            extended_result = {
-                **search_result,
-                'context': full_context,
-                'context_chunks': context_chunks
+            return {
+                'query': query,
+                'results': search_results,
+                'formatted_answer': self.llm_service.format_search_answer(query, context_results),
+                'total_found': len(search_results),
+                'search_quality': self._determine_search_quality(best_result['similarity']),
+                'best_similarity': best_result['similarity'],
+                'context': passage['content'],
+                'context_range': passage['chunk_range']
             }
             
-            # Переформатируем ответ с учетом контекста
-            if context_chunks:
-                context_results = [
-                    {
-                        'content': chunk['content'],
-                        'similarity': 1.0 if chunk['chunk_index'] == best_result['chunk_index'] else 0.8,
-                        'document_name': best_result['document_name'],
-                        'chunk_index': chunk['chunk_index']
-                    }
-                    for chunk in context_chunks
-                ]
-                
-                extended_result['formatted_answer'] = self.llm_service.format_search_answer(
-                    query, context_results
-                )
-            
-            return extended_result
-            
         except Exception as e:
             logger.error(f"Ошибка при поиске с контекстом: {e}")
             return self.search(query)  # Fallback к обычному поиску
     
-    def _get_context_chunks(self, document_id: int, chunk_index: int, context_size: int) -> List[Dict[str, Any]]:
-        """
-        Получает соседние чанки для контекста
-        """
-        session = SessionLocal()
-        try:
-            # Определяем диапазон чанков
-            start_index = max(0, chunk_index - context_size)
-            end_index = chunk_index + context_size + 1
-            
-            # Получаем чанки в диапазоне
-            chunks = session.query(DocumentChunk).filter(
-                DocumentChunk.document_id == document_id,
-                DocumentChunk.chunk_index >= start_index,
-                DocumentChunk.chunk_index < end_index
-            ).order_by(DocumentChunk.chunk_index).all()
-            
-            return [
-                {
-                    'chunk_index': chunk.chunk_index,
-                    'content': chunk.content,
-                    'content_length': chunk.content_length
-                }
-                for chunk in chunks
-            ]
-            
-        finally:
-            session.close()
-    
-    def _merge_context(self, context_chunks: List[Dict[str, Any]], target_index: int) -> str:
-        """
-        Объединяет контекстные чанки в единый текст
-        """
-        if not context_chunks:
-            return ""
-        
-        # Сортируем по индексу
-        sorted_chunks = sorted(context_chunks, key=lambda x: x['chunk_index'])
-        
-        # Объединяем тексты
-        merged_parts = []
-        for chunk in sorted_chunks:
-            if chunk['chunk_index'] == target_index:
-                # Выделяем целевой чанк
-                merged_parts.append(f"**{chunk['content']}**")
-            else:
-                merged_parts.append(chunk['content'])
-        
-        return " ".join(merged_parts)
-    
     def get_search_suggestions(self, partial_query: str) -> List[str]:
         """
         Возвращает предложения для автодополнения поиска
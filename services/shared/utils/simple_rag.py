@@ -3,66 +3,133 @@
 import os
 import logging
 import numpy as np
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import json
-import datetime
-
-# Исправляем импорт на абсолютный
-try:
-    # Сначала пробуем импорт из shared (Docker)
-    from shared.models.document import Document, DocumentChunk
-except ImportError:
-    try:
-        # Fallback для локальной разработки
-        from models.document import Document, DocumentChunk
-    except ImportError:
-        # Последний fallback
-        from services.shared.models.document import Document, DocumentChunk
+import time
 
 try:
     from .llm_client import SimpleLLMClient, LLMResponse
+    from .model_registry import get_embedding_model
+    from .vector_index import apply_search_settings
+    from .chunk_index import get_chunk_index
+    from .answer_cache import get_answer_cache
+    from .exact_cache import get_exact_cache
+    from .hybrid_search import StageTimer, HYBRID_SEARCH, FALLBACK_SEARCH
+    from .rank_fusion import FusionConfig, fuse
+    from .document_metadata import get_documents_metadata, attach_document_metadata, UNKNOWN_DOCUMENT_TITLE
+    from .context_expansion import CONTEXT_EXPANSION_ENABLED, expand_context
+    from .context_packer import pack_context, estimate_tokens
+    from .query_log_writer import enqueue_query_log
+    from .fulltext import (
+        FUZZY_SEARCH_ENABLED, build_fulltext_query, find_synonym_groups,
+        select_fuzzy_terms, apply_fuzzy_settings
+    )
 except ImportError:
     from llm_client import SimpleLLMClient, LLMResponse
+    from model_registry import get_embedding_model
+    from vector_index import apply_search_settings
+    from chunk_index import get_chunk_index
+    from answer_cache import get_answer_cache
+    from exact_cache import get_exact_cache
+    from hybrid_search import StageTimer, HYBRID_SEARCH, FALLBACK_SEARCH
+    from rank_fusion import FusionConfig, fuse
+    from document_metadata import get_documents_metadata, attach_document_metadata, UNKNOWN_DOCUMENT_TITLE
+    from context_expansion import CONTEXT_EXPANSION_ENABLED, expand_context
+    from context_packer import pack_context, estimate_tokens
+    from query_log_writer import enqueue_query_log
+    from fulltext import (
+        FUZZY_SEARCH_ENABLED, build_fulltext_query, find_synonym_groups,
+        select_fuzzy_terms, apply_fuzzy_settings
+    )
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class RAGTelemetry:
+    """Телеметрия одного вызова RAG (возвращается вызывающему, не хранится в экземпляре)"""
+    relevant_chunks: List[Dict] = field(default_factory=list)
+    similarity_score: float = 0.0
+    search_time: float = 0.0
+    llm_time: float = 0.0
+    total_time: float = 0.0
+    tokens_used: int = 0
+    context_tokens: int = 0
+    search_stages: Dict[str, float] = field(default_factory=dict)
+    
+    def set_chunks(self, chunks: List[Dict]):
+        """Сохраняет найденные чанки и среднюю схожесть"""
+        self.relevant_chunks = chunks
+        if chunks:
+            self.similarity_score = sum(c['similarity'] for c in chunks) / len(chunks)
+        else:
+            self.similarity_score = 0.0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Краткая сводка для ответа и логов"""
+        return {
+            'chunks_found': len(self.relevant_chunks),
+            'similarity_score': self.similarity_score,
+            'search_time': round(self.search_time, 4),
+            'llm_time': round(self.llm_time, 4),
+            'total_time': round(self.total_time, 4),
+            'tokens_used': self.tokens_used,
+            'context_tokens': self.context_tokens,
+            'search_stages_ms': {name: round(seconds * 1000, 2) for name, seconds in self.search_stages.items()}
+        }
+
+
 class SimpleRAG:
     """
     Максимально простая RAG система
     - Локальные эмбеддинги (бесплатно)
     - GigaChat для ответов (бесплатно)
     - Никаких сложностей!
+    
+    Экземпляр не хранит состояние запроса: сессия БД передается в каждый
+    вызов, а телеметрия возвращается в результате. Поэтому один экземпляр
+    можно безопасно использовать из нескольких потоков одновременно.
     """
     
-    def __init__(self, db_session: Session, gigachat_api_key: str):
+    def __init__(self, gigachat_api_key: str):
         """
         Инициализация RAG системы
         
         Args:
-            db_session: Сессия базы данных
             gigachat_api_key: API ключ для GigaChat
         """
-        self.db_session = db_session
         self.llm_client = SimpleLLMClient(gigachat_api_key)
         
         # Получаем настройки поиска из переменных окружения
         self.similarity_threshold = float(os.getenv("SIMILARITY_THRESHOLD", "0.3"))
         self.search_limit = int(os.getenv("SEARCH_LIMIT", "15"))
         self.min_similarity = float(os.getenv("MIN_SIMILARITY_THRESHOLD", "0.25"))
+        # Объединение ретриверов (FUSION_METHOD, FUSION_WEIGHTS, FUSION_BUDGETS)
+        self.fusion_config = FusionConfig.from_env()
         
         # Инициализируем логгер
         self.logger = logging.getLogger(__name__)
         
-        # Загружаем модель эмбеддингов
-        self.logger.info("Загружаем модель эмбеддингов...")
-        self.embedding_model = SentenceTransformer('cointegrated/rubert-tiny2')
-        self.logger.info(f"Модель эмбеддингов загружена! Настройки: similarity_threshold={self.similarity_threshold}, search_limit={self.search_limit}, min_similarity={self.min_similarity}")
-        self._relevant_chunks_for_logging: List[Dict] = []
-        self._similarity_score_for_logging: float = 0.0
+        # Берем общую модель эмбеддингов из реестра (загружается один раз на процесс)
+        self.embedding_model = get_embedding_model()
+        
+        # Опциональный индекс чанков в памяти (CHUNK_INDEX_ENABLED=true)
+        self.chunk_index = get_chunk_index()
+        
+        self.logger.info(f"RAG система готова! Настройки: similarity_threshold={self.similarity_threshold}, search_limit={self.search_limit}, min_similarity={self.min_similarity}, fusion={self.fusion_config.describe()}")
         
+    @property
+    def answer_cache(self):
+        """Семантический кэш ответов (ANSWER_CACHE_ENABLED=true; None, пока Redis недоступен)"""
+        return get_answer_cache()
+    
+    @property
+    def exact_cache(self):
+        """Кэш дословно повторяющихся вопросов (EXACT_CACHE_ENABLED=true; None, пока Redis недоступен)"""
+        return get_exact_cache()
+    
     def create_embedding(self, text: str) -> List[float]:
         """Создание эмбеддинга для текста"""
         try:
@@ -73,288 +140,236 @@ class SimpleRAG:
             return []
     
     def _format_embedding_for_pgvector(self, embedding: List[float]) -> str:
-        """Форматирование эмбеддинга для использования с pgvector"""
+        """Форматирование эмбеддинга для pgvector (передается параметром типа vector)"""
         return str(embedding).replace(' ', '')
     
-    def search_relevant_chunks(self, question: str, limit: int = 15) -> List[Dict]:
+    def search_relevant_chunks(self, db_session: Session, question: str, limit: int = 15,
+                               question_embedding: Optional[List[float]] = None,
+                               stage_timings: Optional[Dict[str, float]] = None) -> List[Dict]:
         """
         Поиск релевантных чанков для ответа на вопрос
         
         Args:
+            db_session: Сессия базы данных
             question: Вопрос пользователя
             limit: Максимальное количество чанков для возврата
+            question_embedding: Готовый эмбеддинг вопроса (если уже посчитан)
+            stage_timings: Словарь, куда записывается длительность этапов поиска
             
         Returns:
             List[Dict]: Список релевантных чанков с метаданными
         """
+        timer = StageTimer(stage_timings)
+        
+        exact_cache_version = None
+        if self.exact_cache is not None:
+            with timer.stage('exact_cache'):
+                cached, exact_cache_version = self.exact_cache.get_chunks(question, limit)
+                chunks = self._load_cached_chunks(db_session, cached) if cached is not None else None
+            if chunks is not None:
+                self.logger.info(f"⚡ Чанки взяты из кэша точных совпадений ({len(chunks)})")
+                return self._with_document_metadata(db_session, chunks, timer)
+        
+        chunks = self._search_relevant_chunks_uncached(db_session, question, limit, question_embedding, timer)
+        
+        if self.exact_cache is not None and chunks:
+            self.exact_cache.set_chunks(question, limit, chunks, exact_cache_version)
+        return self._with_document_metadata(db_session, chunks, timer)
+    
+    def _with_document_metadata(self, db_session: Session, chunks: List[Dict], timer: StageTimer) -> List[Dict]:
+        """Название, путь и тип документа для всех чанков (кэш + один запрос)"""
+        if chunks:
+            with timer.stage('document_metadata'):
+                attach_document_metadata(db_session, chunks)
+        return chunks
+    
+    def _load_cached_chunks(self, db_session: Session, cached: List[Dict]) -> Optional[List[Dict]]:
+        """Дочитывание текста закэшированных чанков одним запросом по id"""
+        if not cached:
+            return []
+        
+        rows = db_session.execute(
+            text("SELECT id, content FROM document_chunks WHERE id = ANY(:ids)"),
+            {'ids': [chunk['id'] for chunk in cached]}
+        ).fetchall()
+        contents = {row.id: row.content for row in rows}
+        
+        # Чанк удален (документ переобработан без смены версии корпуса) - ищем заново
+        if len(contents) != len(cached):
+            return None
+        
+        return [dict(chunk, content=contents[chunk['id']]) for chunk in cached]
+    
+    def _search_relevant_chunks_uncached(self, db_session: Session, question: str, limit: int,
+                                         question_embedding: Optional[List[float]] = None,
+                                         timer: Optional[StageTimer] = None) -> List[Dict]:
+        """
+        Поиск релевантных чанков без кэша
+        
+        Векторные, "зарплатные", лексические и нечеткие кандидаты получаются
+        одним подготовленным гибридным запросом (см. hybrid_search.HYBRID_SEARCH),
+        проходят фильтры качества и объединяются rank_fusion.fuse.
+        """
+        timer = timer or StageTimer()
+        config = self.fusion_config
         try:
             # 1. Создаем эмбеддинг для вопроса
-            question_embedding = self.create_embedding(question)
+            with timer.stage('embedding'):
+                if question_embedding is None:
+                    question_embedding = self.create_embedding(question)
             self.logger.info(f"Создан эмбеддинг для вопроса, размерность: {len(question_embedding)}")
             
             # 2. Специальная логика для вопросов о зарплате
             salary_keywords = ['зарплата', 'заработная плата', 'выплачивается', 'выплата', 'оплата труда']
             is_salary_question = any(keyword in question.lower() for keyword in salary_keywords)
-            
             if is_salary_question:
                 self.logger.info("Обнаружен вопрос о зарплате, используем специальную логику поиска")
-                
-                # Ищем чанки с конкретными датами выплат
-                salary_query = text("""
-                    SELECT dc.id, dc.document_id, dc.chunk_index, dc.content,
-                           1 - (dc.embedding_vector <=> :embedding) as similarity,
-                           dc.content_length
-                    FROM document_chunks dc
-                    JOIN documents d ON dc.document_id = d.id
-                    WHERE d.processing_status = 'completed'
-                      AND dc.embedding_vector IS NOT NULL
-                      AND (dc.content ILIKE '%12%' AND dc.content ILIKE '%27%' AND dc.content ILIKE '%выплачивается%')
-                    ORDER BY dc.embedding_vector <=> :embedding
-                    LIMIT 3
-                """)
-                
-                salary_result = self.db_session.execute(salary_query, {
-                    'embedding': self._format_embedding_for_pgvector(question_embedding)
-                })
-                
-                salary_chunks = []
-                for row in salary_result:
-                    if row.similarity > 0.3:  # Более низкий порог для специфичных чанков
-                        salary_chunks.append({
-                            'id': row.id,
-                            'document_id': row.document_id,
-                            'chunk_index': row.chunk_index,
-                            'content': row.content,
-                            'similarity': row.similarity + 0.2,  # Бонус за специфичность
-                            'search_type': 'salary_specific',
-                            'content_length': row.content_length
-                        })
-                
-                if salary_chunks:
-                    self.logger.info(f"Найдено {len(salary_chunks)} специфичных чанков о зарплате")
-            
-            # 3. Выполняем обычный векторный поиск
-            self.logger.info("Выполняем векторный поиск...")
-            
-            # Используем pgvector для поиска похожих эмбеддингов
-            query = text("""
-                SELECT dc.id, dc.document_id, dc.chunk_index, dc.content,
-                       1 - (dc.embedding_vector <=> :embedding) as similarity,
-                       dc.content_length
-                FROM document_chunks dc
-                JOIN documents d ON dc.document_id = d.id
-                WHERE d.processing_status = 'completed'
-                  AND dc.embedding_vector IS NOT NULL
-                  AND dc.content_length > 100
-                  AND dc.content_length < 4000
-                  AND dc.content NOT ILIKE '%приложение%'
-                  AND dc.content NOT ILIKE '%утверждаю%'
-                  AND dc.content NOT ILIKE '%генеральный директор%'
-                  AND dc.content NOT ILIKE '%система менеджмента%'
-                  AND dc.content NOT ILIKE '%введено впервые%'
-                  AND dc.content NOT ILIKE '%дата введения%'
-                ORDER BY dc.embedding_vector <=> :embedding
-                LIMIT :limit
-            """)
             
-            result = self.db_session.execute(query, {
-                'embedding': self._format_embedding_for_pgvector(question_embedding),
-                'limit': limit * 2
-            })
-            
-            vector_chunks = []
-            for row in result:
-                # Используем настраиваемый минимальный порог схожести
-                if (row.similarity > self.min_similarity and  # Используем переменную вместо 0.25
-                    self._is_relevant_content(row.content, question)):
-                    vector_chunks.append({
-                        'id': row.id,
-                        'document_id': row.document_id,
-                        'chunk_index': row.chunk_index,
-                        'content': row.content,
-                        'similarity': row.similarity,
-                        'search_type': 'vector',
-                        'content_length': row.content_length
-                    })
-            
-            self.logger.info(f"Векторный поиск завершен, найдено {len(vector_chunks)} качественных чанков")
-            
-            # 4. Объединяем результаты
-            all_chunks = []
-            
-            # Сначала добавляем специфичные чанки о зарплате (если есть)
-            if is_salary_question and 'salary_chunks' in locals():
-                all_chunks.extend(salary_chunks)
-            
-            # Затем добавляем векторные результаты (исключая дубликаты)
-            existing_ids = {chunk['id'] for chunk in all_chunks}
-            for chunk in vector_chunks:
-                if chunk['id'] not in existing_ids:
-                    all_chunks.append(chunk)
-            
-            # 5. Дополняем улучшенным текстовым поиском при необходимости
-            if len(all_chunks) < limit:
-                text_chunks = []
-                keywords = self._extract_keywords(question)
-                
-                if keywords:
-                    self.logger.info(f"Выполняем текстовый поиск по ключевым словам: {keywords}")
-                    
-                    # Улучшенный запрос для текстового поиска
-                    conditions = []
-                    params = {}
-                    
-                    for i, keyword in enumerate(keywords[:5]):  # Ограничиваем количество ключевых слов
-                        param_name = f'keyword_{i}'
-                        conditions.append(f"dc.content ILIKE :{param_name}")
-                        params[param_name] = f'%{keyword}%'
-                    
-                    text_query = text(f"""
-                        SELECT dc.id, dc.document_id, dc.chunk_index, dc.content,
-                                dc.content_length
-                        FROM document_chunks dc
-                        JOIN documents d ON dc.document_id = d.id
-                        WHERE d.processing_status = 'completed'
-                          AND dc.content_length > 200
-                          AND dc.content_length < 3000
-                          AND dc.content NOT ILIKE '%приложение%'
-                          AND dc.content NOT ILIKE '%утверждаю%'
-                          AND dc.content NOT ILIKE '%генеральный директор%'
-                          AND dc.content NOT ILIKE '%система менеджмента%'
-                          AND dc.content NOT ILIKE '%положение%о%'
-                          AND dc.content NOT ILIKE '%введено впервые%'
-                          AND dc.content NOT ILIKE '%дата введения%'
-                          AND ({' OR '.join(conditions)})
-                        ORDER BY dc.content_length DESC
-                        LIMIT :limit
-                    """)
+            keywords = self._extract_keywords(question)
+            # Все ключевые слова и их синонимы идут в один tsquery (GIN-индекс)
+            fts_query = build_fulltext_query(keywords)
+            # Опечатки и частичные совпадения слов - через индекс триграмм
+            fuzzy_terms = select_fuzzy_terms(keywords) if FUZZY_SEARCH_ENABLED else []
+            
+            vector_budget = config.budget('vector', limit)
+            
+            # 3. Векторные кандидаты из индекса в памяти (если включен)
+            memory_candidates = None
+            if self.chunk_index is not None:
+                with timer.stage('chunk_index'):
+                    memory_candidates = self._search_chunk_index(db_session, question_embedding, vector_budget)
+            
+            # 4. Один гибридный запрос: salary + vector + lexical + fuzzy с объединением на сервере
+            rows = []
+            include_vector = memory_candidates is None
+            if include_vector or is_salary_question or fts_query or fuzzy_terms:
+                with timer.stage('hybrid_sql'):
+                    # Настраиваем точность ANN-индекса (ef_search / probes) для этой транзакции
+                    apply_search_settings(db_session, vector_budget)
+                    if fuzzy_terms:
+                        apply_fuzzy_settings(db_session)
                     
-                    params['limit'] = limit
-                    text_result = self.db_session.execute(text_query, params)
-                    
-                    existing_ids = {chunk['id'] for chunk in all_chunks}
-                    for row in text_result:
-                        # Проверяем, что этот чанк еще не найден и содержит релевантную информацию
-                        if (row.id not in existing_ids and
-                            self._is_relevant_content(row.content, question)):
-                            
-                            # Вычисляем реальную схожесть на основе пересечения ключевых слов
-                            content_words = set(row.content.lower().split())
-                            question_words = set(question.lower().split())
-                            overlap = len(content_words & question_words)
-                            
-                            # Улучшенный расчет similarity
-                            base_similarity = 0.3
-                            keyword_bonus = 0.0
-                            
-                            # Проверяем наличие ключевых слов из вопроса
-                            for keyword in keywords:
-                                if keyword.lower() in row.content.lower():
-                                    keyword_bonus += 0.1
-                            
-                            # Бонус за пересечение слов
-                            word_bonus = min(overlap * 0.05, 0.3)
-                            
-                            calculated_similarity = base_similarity + keyword_bonus + word_bonus
-                            calculated_similarity = min(calculated_similarity, 0.95)  # Максимум 0.95
-                            
-                            if overlap >= 1:  # Минимум 1 общее слово
-                                text_chunks.append({
-                                    'id': row.id,
-                                    'document_id': row.document_id,
-                                    'chunk_index': row.chunk_index,
-                                    'content': row.content,
-                                    'similarity': calculated_similarity,
-                                    'search_type': 'text',
-                                    'content_length': row.content_length
-                                })
-                    
-                    all_chunks.extend(text_chunks)
-                    self.logger.info(f"Текстовый поиск завершен, найдено {len(text_chunks)} дополнительных чанков")
-            
-            # 6. Сортируем по схожести (убывание)
-            all_chunks.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            # Ограничиваем количество результатов
-            final_chunks = all_chunks[:limit]
+                    # Текст запроса всегда один, ветки включаются параметрами
+                    rows = HYBRID_SEARCH.execute(db_session, {
+                        'embedding': self._format_embedding_for_pgvector(question_embedding),
+                        'use_salary': is_salary_question,
+                        'salary_limit': config.budget('salary_specific', limit),
+                        'use_vector': include_vector,
+                        'vector_limit': vector_budget,
+                        'fts_query': fts_query or '',
+                        'lexical_limit': config.budget('text', limit),
+                        'fuzzy_terms': fuzzy_terms,
+                        'fuzzy_limit': config.budget('fuzzy', limit)
+                    }).fetchall()
+            
+            with timer.stage('postprocess'):
+                ranked = self._rank_candidates(rows, memory_candidates, question)
+                final_chunks = fuse(ranked, config, limit)
+                
+                self.logger.info(
+                    f"Кандидаты по ретриверам: { {name: len(items) for name, items in ranked.items()} }, "
+                    f"после объединения ({config.describe()}): {len(final_chunks)}"
+                )
             
             if not final_chunks:
                 self.logger.info("Улучшенный поиск не дал результатов, используем fallback")
-                return self._fallback_search(question, limit)
+                with timer.stage('fallback'):
+                    final_chunks = self._fallback_search(db_session, question, limit)
             
+            self.logger.info(f"⏱️ Этапы поиска: {timer.summary()}")
             return final_chunks
             
         except Exception as e:
             self.logger.error(f"Ошибка в search_relevant_chunks: {str(e)}")
-            return self._fallback_search(question, limit)
+            # Откатываем прерванную транзакцию, иначе fallback-запрос тоже упадет
+            db_session.rollback()
+            with timer.stage('fallback'):
+                return self._fallback_search(db_session, question, limit)
+    
+    def _rank_candidates(self, rows: List, memory_candidates: Optional[List[Dict]],
+                         question: str) -> Dict[str, List]:
+        """
+        Списки кандидатов по ретриверам для rank_fusion.fuse
+        
+        Кандидат каждого ретривера проходит его фильтр качества, а список
+        сортируется по собственной оценке ретривера (схожесть или ранг).
+        """
+        ranked: Dict[str, List] = {'salary_specific': [], 'vector': [], 'text': [], 'fuzzy': []}
+        
+        for row in rows:
+            candidate = {
+                'id': row.id,
+                'document_id': row.document_id,
+                'chunk_index': row.chunk_index,
+                'content': row.content,
+                'similarity': row.similarity,
+                'content_length': row.content_length
+            }
+            relevant = self._is_relevant_content(row.content, question)
+            for retriever, score in row.scores.items():
+                if retriever == 'salary_specific':
+                    # Более низкий порог для специфичных чанков
+                    if score > 0.3:
+                        ranked[retriever].append((candidate, score))
+                elif retriever == 'vector':
+                    if memory_candidates is None and score > self.min_similarity and relevant:
+                        ranked[retriever].append((candidate, score))
+                elif relevant:
+                    ranked[retriever].append((candidate, score))
+        
+        if memory_candidates is not None:
+            ranked['vector'] = [
+                (candidate, candidate['similarity']) for candidate in memory_candidates
+                if candidate['similarity'] > self.min_similarity
+                and self._is_relevant_content(candidate['content'], question)
+            ]
+        
+        for candidates in ranked.values():
+            candidates.sort(key=lambda item: item[1], reverse=True)
+        return ranked
+    
+    def _search_chunk_index(self, db_session: Session, question_embedding: List[float], limit: int) -> List[Dict]:
+        """
+        Векторный поиск по индексу в памяти вместо pgvector
+        
+        Из БД по первичному ключу читается только текст найденных чанков.
+        """
+        self.chunk_index.ensure_fresh(db_session)
+        
+        # Служебные чанки в индекс не попадают (chunk_type), но часть могла быть удалена
+        hits = self.chunk_index.search(
+            question_embedding, limit * 2,
+            min_similarity=self.min_similarity,
+            min_length=100, max_length=4000
+        )
+        if not hits:
+            return []
+        
+        rows = db_session.execute(text("""
+            SELECT id, chunk_index, content FROM document_chunks WHERE id = ANY(:ids)
+        """), {'ids': [hit['id'] for hit in hits]})
+        contents = {row.id: row for row in rows}
+        
+        candidates = []
+        for hit in hits:
+            row = contents.get(hit['id'])
+            if row is None:
+                continue
+            candidates.append({**hit, 'chunk_index': row.chunk_index, 'content': row.content})
+            if len(candidates) >= limit:
+                break
+        
+        return candidates
     
     def _extract_keywords(self, question: str) -> List[str]:
         """Улучшенное извлечение ключевых слов из вопроса с поддержкой новых категорий"""
-        # Расширенный словарь синонимов с новыми категориями
-        synonyms = {
-            # HR и зарплата
-            'аванс': ['аванс', 'авансовая', 'авансовый', 'первая часть', 'первая половина', 'предоплата'],
-            'зарплата': ['зарплата', 'заработная плата', 'оплата труда', 'вознаграждение', 'зп', 'доход'],
-            'выплата': ['выплата', 'выплачивается', 'перечисление', 'начисление', 'выдача', 'платеж'],
-            'дата': ['дата', 'число', 'срок', 'время', 'когда', 'день', 'период'],
-            'размер': ['размер', 'сумма', 'процент', 'сколько', 'величина', 'объем'],
-            'отпуск': ['отпуск', 'отпускные', 'отдых', 'каникулы', 'vacation'],
-            'больничный': ['больничный', 'болезнь', 'нетрудоспособность', 'лист нетрудоспособности'],
-            'премия': ['премия', 'бонус', 'поощрение', 'надбавка', 'стимулирование'],
-            'договор': ['договор', 'контракт', 'соглашение', 'трудовой договор'],
-            'увольнение': ['увольнение', 'расторжение', 'прекращение', 'уход', 'dismissal'],
-            'график': ['график', 'расписание', 'режим', 'время работы', 'смена'],
-            'документы': ['документы', 'справки', 'бумаги', 'формы', 'заявления'],
-            
-            # Техника безопасности
-            'безопасность': ['безопасность', 'охрана труда', 'техбезопасность', 'охрана', 'защита'],
-            'инструкция': ['инструкция', 'правила', 'порядок', 'процедура', 'регламент'],
-            'средства_защиты': ['сиз', 'средства защиты', 'спецодежда', 'каска', 'перчатки', 'очки'],
-            'несчастный_случай': ['несчастный случай', 'травма', 'происшествие', 'авария', 'инцидент'],
-            'обучение_бт': ['обучение', 'инструктаж', 'подготовка', 'курсы безопасности'],
-            'медосмотр': ['медосмотр', 'медицинский осмотр', 'диспансеризация', 'здоровье'],
-            'пожарная_безопасность': ['пожар', 'огнетушитель', 'эвакуация', 'пожарная безопасность'],
-            
-            # IT и информационная безопасность
-            'компьютер': ['компьютер', 'пк', 'ноутбук', 'рабочее место', 'техника'],
-            'пароль': ['пароль', 'авторизация', 'доступ', 'логин', 'учетная запись'],
-            'интернет': ['интернет', 'сеть', 'wifi', 'подключение', 'онлайн'],
-            'почта': ['почта', 'email', 'емейл', 'электронная почта', 'мейл'],
-            'программы': ['программы', 'софт', 'приложения', 'software', 'система'],
-            'данные': ['данные', 'информация', 'файлы', 'документооборот', 'архив'],
-            'вирус': ['вирус', 'антивирус', 'malware', 'защита', 'угроза'],
-            
-            # Общие рабочие процессы
-            'командировка': ['командировка', 'поездка', 'путешествие', 'business trip'],
-            'обед': ['обед', 'перерыв', 'питание', 'столовая', 'кафе'],
-            'транспорт': ['транспорт', 'проезд', 'автобус', 'машина', 'такси'],
-            'парковка': ['парковка', 'стоянка', 'автомобиль', 'место для машины'],
-            'пропуск': ['пропуск', 'доступ', 'проход', 'карта', 'badge'],
-            'дресс_код': ['дресс код', 'одежда', 'внешний вид', 'форма', 'uniform'],
-            
-            # Социальные льготы
-            'льготы': ['льготы', 'компенсации', 'возмещение', 'benefits', 'пособия'],
-            'страхование': ['страхование', 'дмс', 'полис', 'медстраховка'],
-            'спорт': ['спорт', 'фитнес', 'тренажерный зал', 'здоровье', 'физкультура'],
-            'обучение': ['обучение', 'курсы', 'тренинги', 'развитие', 'образование'],
-            
-            # Организационные вопросы
-            'офис': ['офис', 'помещение', 'рабочее место', 'кабинет', 'space'],
-            'оборудование': ['оборудование', 'инвентарь', 'техника', 'устройства'],
-            'уборка': ['уборка', 'чистота', 'клининг', 'санитария', 'гигиена'],
-            'ремонт': ['ремонт', 'поломка', 'неисправность', 'сервис', 'maintenance']
-        }
-        
         question_lower = question.lower()
         keywords = set()
         
-        # Ищем прямые совпадения с синонимами
-        for base_word, word_list in synonyms.items():
-            for word in word_list:
-                if word in question_lower:
-                    keywords.update([base_word])  # Добавляем базовое слово
-                    keywords.add(word)  # И само найденное слово
-                    break
+        # Ищем прямые совпадения с синонимами (полные группы раскрываются в tsquery)
+        for base_word, word in find_synonym_groups(question_lower).items():
+            keywords.add(base_word)  # Добавляем базовое слово
+            keywords.add(word)  # И само найденное слово
         
         # Добавляем числа (даты, проценты, суммы)
         import re
@@ -388,7 +403,7 @@ class SimpleRAG:
         self.logger.info(f"Извлеченные ключевые слова: {list(keywords)[:15]}")
         return list(keywords)[:15]  # Увеличиваем лимит до 15 слов
     
-    def _fallback_search(self, question: str, limit: int) -> List[Dict]:
+    def _fallback_search(self, db_session: Session, question: str, limit: int) -> List[Dict]:
         """Улучшенный резервный поиск с автоматическим извлечением ключевых слов"""
         try:
             self.logger.info("Используем улучшенный текстовый поиск как fallback")
@@ -396,53 +411,18 @@ class SimpleRAG:
             # Извлекаем ключевые слова из вопроса для более точного поиска
             question_keywords = self._extract_dynamic_keywords(question)
             
-            # Создаем более гибкий поисковый запрос
-            search_conditions = []
-            params = {'limit': limit}
-            
-            # Добавляем поиск по каждому ключевому слову
-            for i, keyword in enumerate(question_keywords[:5]):  # Ограничиваем до 5 ключевых слов
-                search_conditions.append(f"dc.content ILIKE :keyword_{i}")
-                params[f'keyword_{i}'] = f'%{keyword}%'
-            
-            if not search_conditions:
+            search_terms = question_keywords[:5]  # Ограничиваем до 5 ключевых слов
+            if not search_terms:
                 # Если нет ключевых слов, используем простой поиск по словам
-                words = question.lower().split()
-                search_terms = [word for word in words if len(word) > 2][:3]
-                
-                for i, term in enumerate(search_terms):
-                    search_conditions.append(f"dc.content ILIKE :term_{i}")
-                    params[f'term_{i}'] = f'%{term}%'
+                search_terms = [word for word in question.lower().split() if len(word) > 2][:3]
             
-            if not search_conditions:
+            # Полнотекстовый запрос по GIN-индексу (OR по словам и синонимам)
+            fts_query = build_fulltext_query(search_terms)
+            if not fts_query:
                 return []
             
-            # Строим запрос с OR условиями для большей гибкости
-            search_query = " OR ".join(search_conditions)
-            
-            query = text(f"""
-                SELECT dc.id, dc.document_id, dc.chunk_index, dc.content,
-                       0.6 as similarity
-                FROM document_chunks dc
-                JOIN documents d ON dc.document_id = d.id
-                WHERE d.processing_status = 'completed'
-                  AND ({search_query})
-                ORDER BY 
-                    CASE 
-                        WHEN dc.content ILIKE :first_keyword THEN 1
-                        ELSE 2
-                    END,
-                    LENGTH(dc.content) ASC
-                LIMIT :limit
-            """)
-            
-            # Добавляем параметр для сортировки по первому ключевому слову
-            if question_keywords:
-                params['first_keyword'] = f'%{question_keywords[0]}%'
-            else:
-                params['first_keyword'] = f'%{question.split()[0] if question.split() else ""}%'
-            
-            result = self.db_session.execute(query, params)
+            # Эмбеддинга здесь может не быть, поэтому оценка - ранг полнотекстового поиска
+            result = FALLBACK_SEARCH.execute(db_session, {'fts_query': fts_query, 'limit': limit})
             
             chunks = []
             for row in result:
@@ -500,7 +480,7 @@ class SimpleRAG:
         # Возвращаем топ-10 слов
         return [word for word, count in word_counts.most_common(10)]
     
-    def analyze_document_keywords(self, document_id: int) -> List[str]:
+    def analyze_document_keywords(self, db_session: Session, document_id: int) -> List[str]:
         """Анализ документа для извлечения ключевых слов и тем"""
         try:
             # Получаем все чанки документа
@@ -510,7 +490,7 @@ class SimpleRAG:
                 ORDER BY chunk_index
             """)
             
-            result = self.db_session.execute(chunks_query, {'doc_id': document_id})
+            result = db_session.execute(chunks_query, {'doc_id': document_id})
             
             # Объединяем весь текст документа
             full_text = " ".join([row.content for row in result])
@@ -572,19 +552,18 @@ class SimpleRAG:
         
         return list(set(found_terms))
     
-    def format_context(self, chunks: List[DocumentChunk]) -> str:
+    def format_context(self, db_session: Session, chunks: List[Dict]) -> str:
         """Форматирование контекста из найденных чанков"""
         if not chunks:
             return "Информация не найдена."
         
+        # Названия документов обычно уже добавлены поиском, остальные - одним запросом
+        if any('document_title' not in chunk for chunk in chunks):
+            attach_document_metadata(db_session, chunks)
+        
         context_parts = []
         for i, chunk in enumerate(chunks, 1):
-            # Получаем название документа
-            document = self.db_session.query(Document).filter(
-                Document.id == chunk['document_id']
-            ).first()
-            
-            doc_title = document.title if document else "Неизвестный документ"
+            doc_title = chunk.get('document_title', UNKNOWN_DOCUMENT_TITLE)
             
             context_parts.append(
                 f"[Источник {i}: {doc_title}]\n{chunk['content']}\n"
@@ -593,129 +572,255 @@ class SimpleRAG:
         return "\n".join(context_parts)
     
     def answer_question(self, 
+                       db_session: Session,
                        question: str,
                        user_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Главная функция - ответ на вопрос пользователя
         
         Args:
+            db_session: Сессия базы данных для этого вызова
             question: Вопрос пользователя
             user_id: ID пользователя (для логирования)
             
         Returns:
-            Dict с ответом и метаданными
+            Dict с ответом, метаданными и телеметрией вызова
+        """
+        prepared = self.prepare_answer(db_session, question, user_id)
+        if 'result' in prepared:
+            return prepared['result']
+        
+        llm_start = time.perf_counter()
+        llm_response = self.llm_client.generate_answer(
+            context=prepared['context'],
+            question=question
+        )
+        return self.finalize_answer(db_session, question, user_id, prepared,
+                                    llm_response, time.perf_counter() - llm_start)
+    
+    def prepare_answer(self,
+                       db_session: Session,
+                       question: str,
+                       user_id: Optional[int] = None,
+                       question_embedding: Optional[List[float]] = None,
+                       exact_cache_version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Первый этап ответа: поиск чанков и сборка промпта для LLM
+        
+        Разделение на этапы позволяет асинхронному боту ждать LLM
+        без занятого потока (см. RAGService.answer_question).
+        
+        Args:
+            question_embedding: Готовый эмбеддинг вопроса (бот считает его в своем пуле)
+            exact_cache_version: Версия корпуса, с которой уже проверен кэш точных
+                совпадений (answer_from_exact_cache); None - кэш еще не проверялся
+        
+        Returns:
+            Dict: {'result': ...} если ответ готов без LLM, иначе
+            контекст, чанки и телеметрия для finalize_answer
         """
-        start_time = datetime.datetime.now()
+        start_time = time.perf_counter()
+        telemetry = RAGTelemetry()
 
         try:
             self.logger.info(f"Обрабатываем вопрос от user_id={user_id}: {question[:100]}...")
             
-            relevant_chunks = self.search_relevant_chunks(question, limit=self.search_limit)
-
-            self._relevant_chunks_for_logging = relevant_chunks
-            if relevant_chunks:
-                total_similarity = sum(c['similarity'] for c in relevant_chunks)
-                self._similarity_score_for_logging = total_similarity / len(relevant_chunks) if relevant_chunks else 0.0
-            else:
-                self._similarity_score_for_logging = 0.0
-
+            if exact_cache_version is None:
+                cached, exact_cache_version = self.answer_from_exact_cache(question, user_id)
+                if cached is not None:
+                    return {'result': cached}
+            
+            if self.answer_cache is not None:
+                if question_embedding is None:
+                    question_embedding = self.create_embedding(question)
+                cached = self.answer_cache.lookup(question_embedding)
+                if cached is not None:
+                    return {'result': self._cached_answer_result(question, user_id, cached,
+                                                                 telemetry, start_time)}
+            
+            relevant_chunks = self.search_relevant_chunks(db_session, question, limit=self.search_limit,
+                                                          question_embedding=question_embedding,
+                                                          stage_timings=telemetry.search_stages)
+            telemetry.search_time = time.perf_counter() - start_time
+            telemetry.set_chunks(relevant_chunks)
             
             if not relevant_chunks:
+                telemetry.total_time = time.perf_counter() - start_time
                 if user_id:
-                    response_duration = (datetime.datetime.now() - start_time).total_seconds()
-                    self._log_query(user_id, question, "NO_CHUNKS_FOUND", response_duration)
+                    self._log_query(user_id, question, "NO_CHUNKS_FOUND", telemetry)
                 
-                return { 
+                return {'result': { 
                     'answer': 'К сожалению, я не нашел информации по вашему вопросу в корпоративной базе знаний. Попробуйте переформулировать вопрос или обратитесь к HR-отделу.',
                     'sources': [], 'chunks': [], 'files': [],
-                    'success': True, 'tokens_used': 0
-                }
-            
-            top_chunks = relevant_chunks[:10]
-            context = self.format_context(top_chunks)
-            
-            self.logger.info(f"🔍 КОНТЕКСТ ДЛЯ LLM (длина: {len(context)} символов):")
+                    'success': True, 'tokens_used': 0,
+                    'telemetry': telemetry.to_dict()
+                }}
+            
+            timer = StageTimer(telemetry.search_stages)
+            # Соседние чанки лучших результатов одним запросом; смежные чанки
+            # склеиваются без повторов на стыках и без расширения (window=0)
+            with timer.stage('context_expansion'):
+                passages = expand_context(db_session, relevant_chunks,
+                                          window=None if CONTEXT_EXPANSION_ENABLED else 0)
+            # Самые релевантные и непохожие друг на друга фрагменты в бюджет токенов
+            with timer.stage('context_packing'):
+                top_chunks = pack_context(passages)
+            context = self.format_context(db_session, top_chunks)
+            telemetry.context_tokens = estimate_tokens(context)
+            
+            self.logger.info(f"🔍 КОНТЕКСТ ДЛЯ LLM (длина: {len(context)} символов, ~{telemetry.context_tokens} токенов):")
             self.logger.info("="*80)
             self.logger.info(context[:2000] + "..." if len(context) > 2000 else context)
             self.logger.info("="*80)
             
-            enhanced_prompt = f"""
-Вопрос: {question}
-
-Контекст: {context}
-
-Требования к ответу:
-1. Будь максимально точным и подробным
-2. Используй только информацию из предоставленного контекста
-3. Структурируй ответ с нумерованными списками где это уместно
-4. Если в контексте есть конкретные цифры, даты, суммы - обязательно укажи их
-5. Отвечай на русском языке
-"""
-            
-            llm_response = self.llm_client.generate_answer(
-                context=enhanced_prompt,
-                question=question
-            )
+            # Промпт собирает SimpleLLMClient._build_answer_prompt из context и вопроса
+            return {
+                'context': context,
+                'relevant_chunks': relevant_chunks,
+                'top_chunks': top_chunks,
+                'telemetry': telemetry,
+                'start_time': start_time,
+                'question_embedding': question_embedding,
+                'exact_cache_version': exact_cache_version
+            }
+            
+        except Exception as e:
+            return {'result': self._system_error_result(db_session, question, user_id, telemetry, start_time, e)}
+    
+    def answer_from_exact_cache(self, question: str,
+                                user_id: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        """
+        Готовый ответ из кэша точных совпадений
+        
+        Не требует эмбеддинга вопроса, поэтому бот проверяет кэш
+        до очереди в пул эмбеддингов.
+        
+        Returns:
+            Tuple: ответ (None при промахе) и версия корпуса на момент проверки -
+            под ней новый ответ сохраняется в finalize_answer
+        """
+        if self.exact_cache is None:
+            return None, None
+        start_time = time.perf_counter()
+        cached, version = self.exact_cache.get_answer(question)
+        if cached is None:
+            return None, version
+        cached['cache'] = {'hit': True, 'type': 'exact'}
+        return self._cached_answer_result(question, user_id, cached, RAGTelemetry(), start_time), version
+    
+    def _cached_answer_result(self, question: str, user_id: Optional[int],
+                              cached: Dict[str, Any], telemetry: RAGTelemetry, start_time: float) -> Dict[str, Any]:
+        """Ответ из кэша с собственной телеметрией и логированием запроса"""
+        telemetry.set_chunks(cached.get('chunks', []))
+        telemetry.total_time = time.perf_counter() - start_time
+        if user_id:
+            self._log_query(user_id, question, cached['answer'], telemetry)
+        cached['telemetry'] = telemetry.to_dict()
+        return cached
+    
+    def finalize_answer(self,
+                        db_session: Session,
+                        question: str,
+                        user_id: Optional[int],
+                        prepared: Dict[str, Any],
+                        llm_response: LLMResponse,
+                        llm_time: float = 0.0) -> Dict[str, Any]:
+        """
+        Второй этап ответа: источники, постобработка и логирование
+        
+        Args:
+            db_session: Сессия базы данных (может отличаться от сессии prepare_answer)
+            prepared: Результат prepare_answer
+            llm_response: Ответ LLM по prepared['context']
+            llm_time: Длительность вызова LLM
+        """
+        start_time = prepared['start_time']
+        telemetry = prepared['telemetry']
+        top_chunks = prepared['top_chunks']
+        relevant_chunks = prepared['relevant_chunks']
+        
+        try:
+            telemetry.llm_time = llm_time
+            telemetry.tokens_used = llm_response.tokens_used
             
             if not llm_response.success:
+                telemetry.total_time = time.perf_counter() - start_time
                 if user_id:
-                    response_duration = (datetime.datetime.now() - start_time).total_seconds()
-                    self._log_query(user_id, question, f"LLM_ERROR: {llm_response.error}", response_duration)
+                    self._log_query(user_id, question, f"LLM_ERROR: {llm_response.error}", telemetry)
                 
                 return { 
                     'answer': 'Извините, произошла ошибка при генерации ответа. Попробуйте позже.',
                     'sources': [], 'chunks': [], 'files': [],
-                    'success': False, 'error': llm_response.error, 'tokens_used': 0
+                    'success': False, 'error': llm_response.error, 'tokens_used': 0,
+                    'telemetry': telemetry.to_dict()
                 }
             
             sources = []
             files = []
             seen_documents = set()
             
+            # Метаданные всех документов ответа - из кэша или одним запросом
+            documents = get_documents_metadata(db_session, (chunk['document_id'] for chunk in top_chunks))
+            
             for chunk in top_chunks:
-                document = self.db_session.query(Document).filter(
-                    Document.id == chunk['document_id']
-                ).first()
+                document = documents.get(chunk['document_id'])
                 
-                if document and document.title not in seen_documents:
-                    sources.append({ 'title': document.title, 'chunk_index': chunk['chunk_index'], 'document_id': document.id })
-                    self.logger.info(f"📄 ДОКУМЕНТ ID {document.id}:")
-                    self.logger.info(f"  - title: '{document.title}'")
-                    self.logger.info(f"  - file_path: '{document.file_path}'")
-                    self.logger.info(f"  - original_filename: '{document.original_filename}'")
-                    self.logger.info(f"  - file_type: '{document.file_type}'")
-                    self.logger.info(f"  - file_size: {document.file_size}")
+                if document and document['title'] not in seen_documents:
+                    sources.append({ 'title': document['title'], 'chunk_index': chunk['chunk_index'], 'document_id': document['id'] })
+                    self.logger.info(f"📄 ДОКУМЕНТ ID {document['id']}:")
+                    self.logger.info(f"  - title: '{document['title']}'")
+                    self.logger.info(f"  - file_path: '{document['file_path']}'")
+                    self.logger.info(f"  - original_filename: '{document['original_filename']}'")
+                    self.logger.info(f"  - file_type: '{document['file_type']}'")
+                    self.logger.info(f"  - file_size: {document['file_size']}")
                     files.append({
-                        'title': document.title, 'file_path': document.file_path, 'document_id': document.id,
-                        'similarity': chunk['similarity'], 'file_size': document.file_size, 'file_type': document.file_type,
-                        'original_filename': document.original_filename
+                        'title': document['title'], 'file_path': document['file_path'], 'document_id': document['id'],
+                        'similarity': chunk['similarity'], 'file_size': document['file_size'], 'file_type': document['file_type'],
+                        'original_filename': document['original_filename']
                     })
-                    seen_documents.add(document.title)
+                    seen_documents.add(document['title'])
             
             formatted_answer = self._post_process_answer(llm_response.text)
+            telemetry.total_time = time.perf_counter() - start_time
 
             if user_id:
-                response_duration = (datetime.datetime.now() - start_time).total_seconds()
-                self._log_query(user_id, question, formatted_answer, response_duration)
+                self._log_query(user_id, question, formatted_answer, telemetry)
             
-            return {
+            result = {
                 'answer': formatted_answer, 'sources': sources, 'chunks': relevant_chunks,
                 'files': files[:5], 'success': True, 'tokens_used': llm_response.tokens_used,
-                'chunks_found': len(relevant_chunks), 'context_length': len(context)
+                'chunks_found': len(relevant_chunks), 'context_length': len(prepared['context']),
+                'telemetry': telemetry.to_dict()
             }
             
-        except Exception as e:
-            self.logger.error(f"Ошибка в answer_question: {str(e)}", exc_info=True)
+            if self.answer_cache is not None and prepared.get('question_embedding'):
+                self.answer_cache.store(
+                    question, prepared['question_embedding'], result,
+                    document_ids=[chunk['document_id'] for chunk in top_chunks]
+                )
+            if self.exact_cache is not None:
+                self.exact_cache.set_answer(question, result, prepared.get('exact_cache_version'))
             
-            if user_id:
-                response_duration = (datetime.datetime.now() - start_time).total_seconds()
-                self._log_query(user_id, question, f"SYSTEM_ERROR: {str(e)}", response_duration)
+            return result
             
-            return {
-                'answer': 'Произошла техническая ошибка. Обратитесь к администратору.',
-                'sources': [], 'chunks': [], 'files': [],
-                'success': False, 'error': str(e), 'tokens_used': 0
-            }
+        except Exception as e:
+            return self._system_error_result(db_session, question, user_id, telemetry, start_time, e)
+    
+    def _system_error_result(self, db_session: Session, question: str, user_id: Optional[int],
+                             telemetry: RAGTelemetry, start_time: float, error: Exception) -> Dict[str, Any]:
+        """Ответ при технической ошибке с логированием запроса"""
+        self.logger.error(f"Ошибка в answer_question: {str(error)}", exc_info=True)
+        telemetry.total_time = time.perf_counter() - start_time
+        
+        if user_id:
+            self._log_query(user_id, question, f"SYSTEM_ERROR: {str(error)}", telemetry)
+        
+        return {
+            'answer': 'Произошла техническая ошибка. Обратитесь к администратору.',
+            'sources': [], 'chunks': [], 'files': [],
+            'success': False, 'error': str(error), 'tokens_used': 0,
+            'telemetry': telemetry.to_dict()
+        }
     
     def _post_process_answer(self, answer: str) -> str:
         """
@@ -763,62 +868,41 @@ class SimpleRAG:
         
         return '. '.join(final_sentences)
     
-    def _log_query(self, user_id: int, question: str, answer: str, response_duration: float):
-        """Логирование запроса пользователя"""
-        try:
-            from shared.models.query_log import QueryLog
-            
-            relevant_chunks_for_log = self._relevant_chunks_for_logging
-            similarity_score = self._similarity_score_for_logging
-            
-            # Извлекаем названия документов
-            documents_used_titles = []
-            if relevant_chunks_for_log:
-                # Получаем уникальные названия документов из чанков
-                seen_titles = set()
-                for chunk in relevant_chunks_for_log:
-                    doc_title = chunk.get('document_title', 'Неизвестный документ')
-                    if doc_title not in seen_titles:
-                        documents_used_titles.append(doc_title)
-                        seen_titles.add(doc_title)
-            
-            documents_used_str = ", ".join(documents_used_titles) if documents_used_titles else None
-
-            query_log = QueryLog(
-                user_id=user_id,
-                query=question,
-                response=answer,
-                response_time=response_duration,
-                similarity_score=similarity_score,
-                documents_used=documents_used_str
-            )
-            
-            self.db_session.add(query_log)
-            self.db_session.commit()
-            self.logger.info(f"Запрос для user_id={user_id} успешно залогирован.")
-
-        except Exception as e:
-            self.logger.error(f"Ошибка логирования запроса: {str(e)}", exc_info=True)
-            try:
-                self.db_session.rollback()
-            except Exception as rb_e:
-                self.logger.error(f"Не удалось откатить транзакцию после ошибки логирования: {rb_e}")
-        finally:
-            self._relevant_chunks_for_logging = []
-            self._similarity_score_for_logging = 0.0
+    def _log_query(self, user_id: int, question: str, answer: str, telemetry: RAGTelemetry):
+        """Логирование запроса пользователя через фоновую очередь (без ожидания INSERT)"""
+        # Уникальные названия документов из найденных чанков
+        documents_used_titles = list(dict.fromkeys(
+            chunk.get('document_title', UNKNOWN_DOCUMENT_TITLE) for chunk in telemetry.relevant_chunks or []
+        ))
+        documents_used_str = ", ".join(documents_used_titles) if documents_used_titles else None
+        
+        if not enqueue_query_log(user_id, question, answer,
+                                 response_time=telemetry.total_time,
+                                 similarity_score=telemetry.similarity_score,
+                                 documents_used=documents_used_str):
+            self.logger.warning(f"Запрос user_id={user_id} не залогирован: очередь журнала заполнена")
     
-    def health_check(self) -> Dict[str, bool]:
+    def health_check(self, db_session: Session) -> Dict[str, bool]:
         """Проверка работоспособности всех компонентов"""
+        status = self.check_local_components(db_session)
+        status['llm_client'] = self.check_llm()
+        return status
+
+    def check_local_components(self, db_session: Session) -> Dict[str, bool]:
+        """Проверка модели эмбеддингов и базы данных (без обращения к LLM)"""
         return {
             'embeddings_model': self.embedding_model is not None,
-            'llm_client': self.llm_client.health_check(),
-            'database': self._check_database()
+            'database': self._check_database(db_session)
         }
+
+    def check_llm(self) -> bool:
+        """Проверка LLM клиента (синхронный сетевой запрос к GigaChat)"""
+        return self.llm_client.health_check()
     
-    def _check_database(self) -> bool:
+    def _check_database(self, db_session: Session) -> bool:
         """Проверка подключения к базе данных"""
         try:
-            self.db_session.execute(text("SELECT 1"))
+            db_session.execute(text("SELECT 1"))
             return True
         except Exception:
             return False
@@ -828,18 +912,7 @@ class SimpleRAG:
         content_lower = content.lower()
         question_lower = question.lower()
         
-        # Исключаем технические части документов
-        technical_markers = [
-            'приложение', 'утверждаю', 'генеральный директор', 
-            'система менеджмента', 'введено впервые', 'дата введения',
-            'область применения', 'настоящее положение направлено',
-            'акционерное общество', 'сибгазполимер'
-        ]
-        
-        # Если содержит много технических маркеров, исключаем
-        technical_count = sum(1 for marker in technical_markers if marker in content_lower)
-        if technical_count > 2:
-            return False
+        # Технические части документов отсеиваются при загрузке (chunk_type)
         
         # Проверяем наличие ключевых слов из вопроса
         question_words = set(word for word in question_lower.split() if len(word) > 2)
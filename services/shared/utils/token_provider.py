@@ -0,0 +1,381 @@
+"""
+Общий провайдер OAuth токенов GigaChat
+- Один токен на процесс для всех клиентов с одним ключом авторизации
+- Одновременные обновления схлопываются в один запрос (single-flight)
+- Проактивное обновление до истечения 30-минутного токена
+- Опционально общий кэш между процессами через Redis
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+import httpx
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+OAUTH_SCOPE = os.getenv("GIGACHAT_SCOPE", "GIGACHAT_API_PERS")
+
+# Токен GigaChat живет 30 минут
+DEFAULT_TOKEN_TTL = 1800
+# Токен считается непригодным за REFRESH_MARGIN секунд до истечения
+TOKEN_REFRESH_MARGIN = int(os.getenv("GIGACHAT_TOKEN_REFRESH_MARGIN", "300"))
+# В последние PROACTIVE_WINDOW секунд перед этим токен обновляется в фоне
+TOKEN_PROACTIVE_WINDOW = int(os.getenv("GIGACHAT_TOKEN_PROACTIVE_WINDOW", "300"))
+
+TOKEN_REDIS_ENABLED = os.getenv("GIGACHAT_TOKEN_REDIS_ENABLED", "false").lower() == "true"
+TOKEN_REDIS_URL = os.getenv("GIGACHAT_TOKEN_REDIS_URL") or os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Сколько ждать токен, который обновляет другой процесс
+TOKEN_REDIS_WAIT_SECONDS = float(os.getenv("GIGACHAT_TOKEN_REDIS_WAIT_SECONDS", "5"))
+
+# Снятие блокировки только ее владельцем (сравнение значения и удаление атомарно)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class GigaChatTokenProvider:
+    """
+    Провайдер Access token для одного ключа авторизации
+
+    Экземпляры получаются через get_token_provider() и разделяются
+    всеми GigaChatClient процесса.
+    """
+
+    def __init__(self, authorization_key: str):
+        self.authorization_key = authorization_key
+        self.access_token: Optional[str] = None
+        self.expires_at: float = 0
+
+        # Single-flight для потоков
+        self._lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background_refresh = False
+        # Single-flight для корутин (задача привязана к своему event loop)
+        self._async_task: Optional[asyncio.Task] = None
+
+        key_hash = hashlib.sha1(authorization_key.encode('utf-8')).hexdigest()[:16]
+        self._redis_key = f"gigachat:token:{key_hash}"
+        self._redis_lock_key = f"{self._redis_key}:lock"
+        self._redis = self._connect_redis()
+
+        self._stats = {
+            'oauth_requests': 0,
+            'oauth_errors': 0,
+            'redis_hits': 0,
+            'background_refreshes': 0
+        }
+
+    def _connect_redis(self):
+        """Подключение к Redis для общего кэша токена (если включено)"""
+        if not TOKEN_REDIS_ENABLED:
+            return None
+        if redis is None:
+            logger.warning("GIGACHAT_TOKEN_REDIS_ENABLED=true, но пакет redis не установлен")
+            return None
+        try:
+            client = redis.Redis.from_url(TOKEN_REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+            client.ping()
+            logger.info("🔑 Токен GigaChat кэшируется в Redis")
+            return client
+        except Exception as e:
+            logger.warning(f"Redis для токенов GigaChat недоступен: {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # Состояние токена
+    # ------------------------------------------------------------------
+
+    def _remaining(self) -> float:
+        return self.expires_at - time.time()
+
+    def _is_usable(self) -> bool:
+        """Токен можно использовать для запроса"""
+        return bool(self.access_token) and self._remaining() > TOKEN_REFRESH_MARGIN
+
+    def _is_due_for_refresh(self) -> bool:
+        """Токен еще годен, но пора обновить его заранее"""
+        return self._remaining() <= TOKEN_REFRESH_MARGIN + TOKEN_PROACTIVE_WINDOW
+
+    def _set_token(self, access_token: str, expires_at: float):
+        self.access_token = access_token
+        self.expires_at = expires_at
+
+    def invalidate(self):
+        """Сброс токена (например, после ответа 401)"""
+        self.access_token = None
+        self.expires_at = 0
+        if self._redis is None:
+            return
+        try:
+            # Из корутины клиент Redis не вызывается в потоке event loop
+            asyncio.get_running_loop().run_in_executor(None, self._delete_from_redis)
+        except RuntimeError:
+            self._delete_from_redis()
+
+    def _delete_from_redis(self):
+        try:
+            self._redis.delete(self._redis_key)
+        except Exception as e:
+            logger.debug(f"Не удалось удалить токен из Redis: {e}")
+
+    # ------------------------------------------------------------------
+    # Redis
+    # ------------------------------------------------------------------
+
+    def _load_from_redis(self) -> bool:
+        """Берем токен, полученный другим процессом"""
+        if self._redis is None:
+            return False
+        try:
+            raw = self._redis.get(self._redis_key)
+            if not raw:
+                return False
+            data = json.loads(raw)
+            if data['expires_at'] - time.time() <= TOKEN_REFRESH_MARGIN:
+                return False
+            self._set_token(data['access_token'], data['expires_at'])
+            self._stats['redis_hits'] += 1
+            return True
+        except Exception as e:
+            logger.debug(f"Ошибка чтения токена из Redis: {e}")
+            return False
+
+    def _save_to_redis(self):
+        if self._redis is None or not self.access_token:
+            return
+        try:
+            ttl = int(self._remaining())
+            if ttl > 0:
+                self._redis.set(
+                    self._redis_key,
+                    json.dumps({'access_token': self.access_token, 'expires_at': self.expires_at}),
+                    ex=ttl
+                )
+        except Exception as e:
+            logger.debug(f"Ошибка записи токена в Redis: {e}")
+
+    def _acquire_redis_lock(self) -> Optional[str]:
+        """
+        Межпроцессная блокировка обновления
+
+        Returns:
+            Значение блокировки для _release_redis_lock; пустая строка, если Redis
+            не используется (блокировка не нужна); None, если токен обновляет другой процесс
+        """
+        if self._redis is None:
+            return ""
+        lock_token = uuid.uuid4().hex
+        try:
+            acquired = self._redis.set(self._redis_lock_key, lock_token, nx=True,
+                                       px=int(TOKEN_REDIS_WAIT_SECONDS * 2000))
+        except Exception:
+            return ""
+        return lock_token if acquired else None
+
+    def _release_redis_lock(self, lock_token: Optional[str]):
+        """Снятие своей блокировки (чужую, взятую после истечения нашей, не трогаем)"""
+        if self._redis is None or not lock_token:
+            return
+        try:
+            self._redis.eval(_RELEASE_LOCK_SCRIPT, 1, self._redis_lock_key, lock_token)
+        except Exception:
+            pass
+
+    async def _redis_call(self, func, *args):
+        """Вызов синхронного клиента Redis из корутины в отдельном потоке"""
+        if self._redis is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    # ------------------------------------------------------------------
+    # OAuth
+    # ------------------------------------------------------------------
+
+    def _oauth_request_kwargs(self) -> Dict[str, Any]:
+        """Параметры OAuth запроса"""
+        return {
+            'headers': {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Accept': 'application/json',
+                'RqUID': str(uuid.uuid4()),
+                'Authorization': f'Basic {self.authorization_key}'
+            },
+            'data': {
+                'scope': OAUTH_SCOPE
+            }
+        }
+
+    def _store_response(self, response: httpx.Response) -> Optional[str]:
+        """Сохранение токена из ответа OAuth"""
+        if response.status_code != 200:
+            self._stats['oauth_errors'] += 1
+            logger.error(f"Ошибка получения токена: {response.status_code} - {response.text}")
+            return None
+
+        token_data = response.json()
+        # GigaChat возвращает expires_at в миллисекундах
+        expires_at = token_data.get('expires_at')
+        if expires_at:
+            expires_at = expires_at / 1000 if expires_at > 10 ** 11 else expires_at
+        else:
+            expires_at = time.time() + DEFAULT_TOKEN_TTL
+
+        self._set_token(token_data.get('access_token'), expires_at)
+        self._save_to_redis()
+        logger.info(f"✅ Access token успешно получен (действует {int(self._remaining())} с)")
+        return self.access_token
+
+    def _fetch(self, client: httpx.Client, timeout: Optional[float]) -> Optional[str]:
+        """Синхронный запрос нового токена с межпроцессной координацией"""
+        lock_token = self._acquire_redis_lock()
+        if lock_token is None:
+            # Токен обновляет другой процесс - ждем его результат
+            deadline = time.monotonic() + TOKEN_REDIS_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.2)
+                if self._load_from_redis():
+                    return self.access_token
+
+        try:
+            logger.info("Запрашиваем новый Access token от GigaChat...")
+            self._stats['oauth_requests'] += 1
+            kwargs = self._oauth_request_kwargs()
+            if timeout is not None:
+                kwargs['timeout'] = max(1.0, timeout)
+            response = client.post(OAUTH_URL, **kwargs)
+            return self._store_response(response)
+        except Exception as e:
+            self._stats['oauth_errors'] += 1
+            logger.error(f"Ошибка при получении Access token: {str(e)}")
+            return None
+        finally:
+            self._release_redis_lock(lock_token)
+
+    async def _afetch(self, client: httpx.AsyncClient) -> Optional[str]:
+        """Асинхронный запрос нового токена с межпроцессной координацией"""
+        lock_token = await self._redis_call(self._acquire_redis_lock)
+        if lock_token is None:
+            deadline = time.monotonic() + TOKEN_REDIS_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+                if await self._redis_call(self._load_from_redis):
+                    return self.access_token
+
+        try:
+            logger.info("Запрашиваем новый Access token от GigaChat...")
+            self._stats['oauth_requests'] += 1
+            response = await client.post(OAUTH_URL, **self._oauth_request_kwargs())
+            return await self._redis_call(self._store_response, response)
+        except Exception as e:
+            self._stats['oauth_errors'] += 1
+            logger.error(f"Ошибка при получении Access token: {str(e)}")
+            return None
+        finally:
+            await self._redis_call(self._release_redis_lock, lock_token)
+
+    # ------------------------------------------------------------------
+    # Публичный API
+    # ------------------------------------------------------------------
+
+    def get_token(self, client: httpx.Client, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Актуальный токен (синхронно)
+
+        Args:
+            client: HTTP клиент для OAuth запроса
+            timeout: Оставшийся бюджет времени запроса
+        """
+        if self._is_usable():
+            if self._is_due_for_refresh():
+                self._start_background_refresh(client)
+            return self.access_token
+
+        with self._lock:
+            # Пока ждали блокировку, токен мог обновить другой поток
+            if self._is_usable() or self._load_from_redis():
+                return self.access_token
+            return self._fetch(client, timeout)
+
+    async def aget_token(self, client: httpx.AsyncClient) -> Optional[str]:
+        """Актуальный токен (асинхронно, одно обновление на все корутины)"""
+        if self._is_usable():
+            if self._is_due_for_refresh():
+                self._start_async_refresh(client)
+            return self.access_token
+
+        if await self._redis_call(self._load_from_redis):
+            return self.access_token
+
+        task = self._start_async_refresh(client)
+        return await asyncio.shield(task)
+
+    def _start_async_refresh(self, client: httpx.AsyncClient) -> asyncio.Task:
+        """Запуск (или переиспользование) единственной задачи обновления"""
+        task = self._async_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            if self.access_token:
+                self._stats['background_refreshes'] += 1
+            task = asyncio.get_running_loop().create_task(self._afetch(client))
+            self._async_task = task
+        return task
+
+    def _start_background_refresh(self, client: httpx.Client):
+        """Проактивное обновление токена в фоновом потоке"""
+        with self._background_lock:
+            if self._background_refresh:
+                return
+            self._background_refresh = True
+
+        def _refresh():
+            try:
+                with self._lock:
+                    if self._is_due_for_refresh() and not self._load_from_redis():
+                        self._fetch(client, None)
+            finally:
+                self._background_refresh = False
+
+        self._stats['background_refreshes'] += 1
+        threading.Thread(target=_refresh, name="gigachat-token-refresh", daemon=True).start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика провайдера"""
+        stats = dict(self._stats)
+        stats['has_token'] = bool(self.access_token)
+        stats['expires_in'] = max(0, int(self._remaining())) if self.access_token else 0
+        stats['redis'] = self._redis is not None
+        return stats
+
+
+# Провайдеры по ключу авторизации (один на процесс)
+_providers: Dict[str, GigaChatTokenProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(authorization_key: str) -> GigaChatTokenProvider:
+    """Общий провайдер токенов для ключа авторизации"""
+    provider = _providers.get(authorization_key)
+    if provider is not None:
+        return provider
+
+    with _providers_lock:
+        provider = _providers.get(authorization_key)
+        if provider is None:
+            provider = GigaChatTokenProvider(authorization_key)
+            _providers[authorization_key] = provider
+    return provider
@@ -0,0 +1,53 @@
+"""
+События об изменении пользователей между процессами
+- Админ-панель публикует telegram_id в канал Redis при блокировке,
+  разблокировке и удалении пользователя
+- Бот подписан на канал и сразу сбрасывает запись в кэше пользователей
+"""
+
+import os
+import logging
+import threading
+from typing import Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+USER_EVENTS_REDIS_URL = os.getenv("USER_EVENTS_REDIS_URL") or os.getenv("REDIS_URL", "")
+
+USER_INVALIDATION_CHANNEL = "users:invalidate"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global _client
+    if not USER_EVENTS_REDIS_URL or redis is None:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(USER_EVENTS_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=1)
+    return _client
+
+
+def publish_user_invalidation(telegram_id: Optional[int]) -> bool:
+    """
+    Сообщение боту, что данные пользователя изменились
+
+    Без Redis бот узнает об изменении по истечении TTL кэша.
+    """
+    client = _get_client()
+    if client is None or telegram_id is None:
+        return False
+    try:
+        client.publish(USER_INVALIDATION_CHANNEL, str(telegram_id))
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось отправить событие об изменении пользователя {telegram_id}: {e}")
+        return False
@@ -0,0 +1,364 @@
+"""
+Управление векторным индексом document_chunks.embedding_vector
+- HNSW или IVFFlat индекс с параметрами под размер корпуса
+- Сессионные настройки точности поиска (hnsw.ef_search / ivfflat.probes)
+- Перестроение индекса после массовой загрузки документов
+- Бенчмарк recall@k относительно точного (полного) поиска
+"""
+
+import os
+import math
+import time
+import logging
+from typing import Dict, Any, Optional, List
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+try:
+    from .chunk_quality import CONTENT_CHUNKS_PREDICATE
+except ImportError:
+    from chunk_quality import CONTENT_CHUNKS_PREDICATE
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "idx_document_chunks_embedding_vector"
+
+# Настройки индекса из переменных окружения
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))  # 0 - подбирается по числу строк
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "0"))  # 0 - sqrt(lists)
+
+SUPPORTED_INDEX_TYPES = ("hnsw", "ivfflat")
+
+# Имя индекса на время построения (CREATE INDEX CONCURRENTLY), затем переименовывается в INDEX_NAME
+NEW_INDEX_NAME = f"{INDEX_NAME}_new"
+
+# Число списков текущего ivfflat индекса (0 - индекс не ivfflat) и время чтения (для расчета probes)
+_current_ivfflat_lists: Optional[int] = None
+_ivfflat_lists_read_at = 0.0
+# Индекс могли перестроить в другом процессе (Celery), поэтому значение периодически перечитывается
+IVFFLAT_LISTS_REFRESH_SECONDS = 300
+
+
+def recommended_ivfflat_lists(rows_count: int) -> int:
+    """Рекомендация pgvector: rows / 1000 для корпусов до 1 млн строк"""
+    if IVFFLAT_LISTS > 0:
+        return IVFFLAT_LISTS
+    return max(10, rows_count // 1000)
+
+
+def recommended_ivfflat_probes(lists: int) -> int:
+    """Рекомендация pgvector: sqrt(lists)"""
+    if IVFFLAT_PROBES > 0:
+        return IVFFLAT_PROBES
+    return max(1, int(math.sqrt(lists)))
+
+
+def _remember_ivfflat_lists(lists: Optional[int]):
+    global _current_ivfflat_lists, _ivfflat_lists_read_at
+    _current_ivfflat_lists = lists or 0
+    _ivfflat_lists_read_at = time.monotonic()
+
+
+def _get_ivfflat_lists(db: Session) -> int:
+    """Число списков ivfflat индекса из его определения (0, если индекс не ivfflat)"""
+    if _current_ivfflat_lists is None or time.monotonic() - _ivfflat_lists_read_at > IVFFLAT_LISTS_REFRESH_SECONDS:
+        definition = db.execute(
+            text("SELECT indexdef FROM pg_indexes WHERE indexname = :index_name"),
+            {'index_name': INDEX_NAME}
+        ).scalar()
+        definition = (definition or '').lower()
+        lists = _parse_index_option(definition, 'lists') if 'using ivfflat' in definition else 0
+        _remember_ivfflat_lists(lists)
+    return _current_ivfflat_lists
+
+
+def get_index_info(db: Session) -> Dict[str, Any]:
+    """
+    Информация о текущем векторном индексе
+
+    Returns:
+        Dict: тип индекса, параметры, размер и число векторов
+    """
+    row = db.execute(text("""
+        SELECT indexdef,
+               pg_relation_size(format('%I.%I', schemaname, indexname)::regclass) AS size_bytes
+        FROM pg_indexes
+        WHERE indexname = :index_name
+    """), {'index_name': INDEX_NAME}).fetchone()
+
+    vectors_count = db.execute(text(
+        f"SELECT COUNT(*) FROM document_chunks WHERE embedding_vector IS NOT NULL AND {CONTENT_CHUNKS_PREDICATE}"
+    )).scalar() or 0
+
+    info = {
+        'index_name': INDEX_NAME,
+        'exists': row is not None,
+        'index_type': None,
+        'definition': None,
+        'size_bytes': None,
+        'vectors_count': vectors_count,
+        'configured_type': VECTOR_INDEX_TYPE
+    }
+
+    if row is None:
+        _remember_ivfflat_lists(0)
+        return info
+
+    definition = row.indexdef
+    info['definition'] = definition
+    info['size_bytes'] = row.size_bytes
+
+    definition_lower = definition.lower()
+    info['partial'] = ' where ' in definition_lower
+    lists = None
+    if 'using hnsw' in definition_lower:
+        info['index_type'] = 'hnsw'
+    elif 'using ivfflat' in definition_lower:
+        info['index_type'] = 'ivfflat'
+        lists = _parse_index_option(definition_lower, 'lists')
+        info['lists'] = lists
+        info['recommended_lists'] = recommended_ivfflat_lists(vectors_count)
+    _remember_ivfflat_lists(lists)
+
+    return info
+
+
+def _parse_index_option(definition: str, option: str) -> Optional[int]:
+    """Извлечение числового параметра из WITH (...) определения индекса"""
+    marker = f"{option}='"
+    position = definition.find(marker)
+    if position == -1:
+        marker = f"{option}="
+        position = definition.find(marker)
+    if position == -1:
+        return None
+
+    digits = ""
+    for char in definition[position + len(marker):]:
+        if char.isdigit():
+            digits += char
+        elif digits:
+            break
+    return int(digits) if digits else None
+
+
+def needs_rebuild(info: Dict[str, Any]) -> bool:
+    """
+    Нужно ли перестроить индекс
+
+    HNSW обновляется инкрементально и перестроения не требует.
+    IVFFlat кластеризуется при создании, поэтому после роста корпуса
+    число списков перестает соответствовать данным и recall падает.
+    """
+    if not info.get('exists'):
+        return info.get('vectors_count', 0) > 0
+
+    if info.get('index_type') != VECTOR_INDEX_TYPE:
+        return True
+
+    # Индекс должен быть частичным (только содержательные чанки)
+    if not info.get('partial'):
+        return True
+
+    if info.get('index_type') == 'ivfflat':
+        lists = info.get('lists') or 0
+        recommended = info.get('recommended_lists') or 0
+        # Перестраиваем при расхождении более чем в 2 раза
+        return lists == 0 or recommended >= lists * 2 or recommended * 2 <= lists
+
+    return False
+
+
+def rebuild_vector_index(db: Session, index_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Перестроение векторного индекса без блокировки поиска
+
+    Новый индекс строится через CREATE INDEX CONCURRENTLY под временным
+    именем, затем в короткой транзакции заменяет старый. Во время
+    построения чтение и запись document_chunks не блокируются.
+
+    Args:
+        db: Сессия базы данных
+        index_type: 'hnsw' или 'ivfflat' (по умолчанию VECTOR_INDEX_TYPE)
+
+    Returns:
+        Dict: Информация о созданном индексе и длительность перестроения
+    """
+    index_type = (index_type or VECTOR_INDEX_TYPE).lower()
+    if index_type not in SUPPORTED_INDEX_TYPES:
+        raise ValueError(f"Неподдерживаемый тип индекса: {index_type}")
+
+    vectors_count = db.execute(text(
+        f"SELECT COUNT(*) FROM document_chunks WHERE embedding_vector IS NOT NULL AND {CONTENT_CHUNKS_PREDICATE}"
+    )).scalar() or 0
+    # CREATE INDEX CONCURRENTLY ждет завершения открытых транзакций, включая транзакцию этой сессии
+    db.commit()
+
+    # Частичный индекс: служебные чанки (chunk_type) в векторный поиск не попадают
+    if index_type == 'hnsw':
+        create_sql = (
+            f"CREATE INDEX CONCURRENTLY {NEW_INDEX_NAME} ON document_chunks "
+            f"USING hnsw (embedding_vector vector_cosine_ops) "
+            f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}) "
+            f"WHERE {CONTENT_CHUNKS_PREDICATE}"
+        )
+    else:
+        lists = recommended_ivfflat_lists(vectors_count)
+        create_sql = (
+            f"CREATE INDEX CONCURRENTLY {NEW_INDEX_NAME} ON document_chunks "
+            f"USING ivfflat (embedding_vector vector_cosine_ops) "
+            f"WITH (lists = {lists}) "
+            f"WHERE {CONTENT_CHUNKS_PREDICATE}"
+        )
+
+    logger.info(f"Перестраиваем векторный индекс ({index_type}) для {vectors_count} векторов...")
+    start_time = time.perf_counter()
+
+    engine = db.get_bind()
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # Построение индекса дольше DB_STATEMENT_TIMEOUT_MS; настройка сессии
+        # сбрасывается до возврата соединения в пул
+        connection.execute(text("SET statement_timeout = 0"))
+        try:
+            # Недостроенный (INVALID) индекс от прерванной попытки
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {NEW_INDEX_NAME}"))
+            connection.execute(text(create_sql))
+
+            # Замена индекса: ACCESS EXCLUSIVE только на время DROP + RENAME
+            with engine.begin() as swap:
+                swap.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+                swap.execute(text(f"ALTER INDEX {NEW_INDEX_NAME} RENAME TO {INDEX_NAME}"))
+
+            connection.execute(text("ANALYZE document_chunks"))
+        except Exception as e:
+            logger.error(f"Ошибка перестроения векторного индекса: {e}")
+            try:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {NEW_INDEX_NAME}"))
+            except Exception as cleanup_error:
+                logger.warning(f"Не удалось удалить недостроенный индекс {NEW_INDEX_NAME}: {cleanup_error}")
+            raise
+        finally:
+            connection.execute(text("RESET statement_timeout"))
+
+    duration = time.perf_counter() - start_time
+
+    info = get_index_info(db)
+    info['rebuild_seconds'] = round(duration, 3)
+    logger.info(f"✅ Векторный индекс перестроен за {duration:.2f} с: {info['definition']}")
+    return info
+
+
+def apply_search_settings(db: Session, limit: int = 10):
+    """
+    Настройка точности ANN-поиска для текущей транзакции
+
+    SET LOCAL действует до конца транзакции, поэтому вызывать нужно
+    перед векторными запросами в той же сессии.
+
+    Args:
+        db: Сессия базы данных
+        limit: Сколько кандидатов запросит следующий векторный запрос
+    """
+    # HNSW возвращает не больше ef_search кандидатов (максимум pgvector - 1000)
+    ef_search = min(1000, max(HNSW_EF_SEARCH, limit))
+    db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+
+    # probes считается от фактического числа списков индекса
+    lists = _get_ivfflat_lists(db)
+    if lists:
+        probes = recommended_ivfflat_probes(lists)
+        db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+
+
+def _nearest_ids(db: Session, embedding: str, k: int) -> List[int]:
+    """Ближайшие чанки по косинусному расстоянию"""
+    result = db.execute(text(f"""
+        SELECT id FROM document_chunks
+        WHERE embedding_vector IS NOT NULL AND {CONTENT_CHUNKS_PREDICATE}
+        ORDER BY embedding_vector <=> :embedding
+        LIMIT :k
+    """), {'embedding': embedding, 'k': k})
+    return [row.id for row in result]
+
+
+def benchmark_recall(db: Session, k: int = 10, sample_size: int = 50) -> Dict[str, Any]:
+    """
+    Бенчмарк recall@k индекса относительно точного поиска
+
+    В качестве запросов берутся эмбеддинги случайных чанков. Точный
+    поиск выполняется с отключенными индексными сканами.
+
+    Args:
+        db: Сессия базы данных
+        k: Глубина выдачи
+        sample_size: Количество запросов
+
+    Returns:
+        Dict: recall@k и задержки ANN/точного поиска
+    """
+    info = get_index_info(db)
+
+    samples = db.execute(text(f"""
+        SELECT embedding_vector::text AS embedding FROM document_chunks
+        WHERE embedding_vector IS NOT NULL AND {CONTENT_CHUNKS_PREDICATE}
+        ORDER BY random()
+        LIMIT :sample_size
+    """), {'sample_size': sample_size}).fetchall()
+    db.rollback()
+
+    if not samples:
+        return {'index': info, 'queries': 0, 'k': k, 'recall_at_k': None}
+
+    recalls = []
+    ann_latencies = []
+    exact_latencies = []
+
+    for sample in samples:
+        # ANN поиск через индекс
+        apply_search_settings(db, k)
+        start_time = time.perf_counter()
+        ann_ids = _nearest_ids(db, sample.embedding, k)
+        ann_latencies.append(time.perf_counter() - start_time)
+        db.rollback()
+
+        # Точный поиск без индекса
+        db.execute(text("SET LOCAL enable_indexscan = off"))
+        db.execute(text("SET LOCAL enable_bitmapscan = off"))
+        start_time = time.perf_counter()
+        exact_ids = _nearest_ids(db, sample.embedding, k)
+        exact_latencies.append(time.perf_counter() - start_time)
+        db.rollback()
+
+        if exact_ids:
+            recalls.append(len(set(ann_ids) & set(exact_ids)) / len(exact_ids))
+
+    def _percentile(values: List[float], percent: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index] * 1000
+
+    report = {
+        'index': info,
+        'queries': len(samples),
+        'k': k,
+        'hnsw_ef_search': min(1000, max(HNSW_EF_SEARCH, k)),
+        'recall_at_k': round(sum(recalls) / len(recalls), 4) if recalls else None,
+        'ann_latency_ms': {
+            'p50': round(_percentile(ann_latencies, 50), 2),
+            'p95': round(_percentile(ann_latencies, 95), 2)
+        },
+        'exact_latency_ms': {
+            'p50': round(_percentile(exact_latencies, 50), 2),
+            'p95': round(_percentile(exact_latencies, 95), 2)
+        }
+    }
+
+    logger.info(f"📊 Бенчмарк векторного индекса: recall@{k}={report['recall_at_k']}, "
+                f"ANN p50={report['ann_latency_ms']['p50']} мс, "
+                f"точный p50={report['exact_latency_ms']['p50']} мс")
+    return report
@@ -34,6 +34,10 @@ class Config:
         self.MAX_DOCUMENTS_IN_CONTEXT: int = int(os.getenv("MAX_DOCUMENTS_IN_CONTEXT", "5"))
         self.SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.3"))
         
+        # Потоковый показ ответа (SSE GigaChat + редактирование сообщения)
+        self.STREAMING_ENABLED: bool = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
+        self.STREAM_EDIT_INTERVAL: float = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+        
         # Настройки бота
         self.RATE_LIMIT_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_PER_MINUTE", "10"))
         self.ADMIN_IDS: list = self._parse_admin_ids(os.getenv("ADMIN_IDS", ""))
@@ -6,11 +6,14 @@ import logging
 import os
 import sys
 from pathlib import Path
-from typing import Generator
+from typing import Generator, AsyncIterator, Optional
+from contextlib import asynccontextmanager
 import asyncio
+import json
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import text, select, func
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
 # Добавляем путь к shared модулям
 project_root = Path(__file__).parent.parent.parent
@@ -18,21 +21,25 @@ sys.path.insert(0, str(project_root / "shared"))
 
 try:
     # Попытка импорта из shared (для Docker)
-    from shared.models.database import Base
+    from shared.models.database import Base, engine as shared_engine, SessionLocal as shared_session_factory
+    from shared.models.database import create_async_db_engine
     from shared.models.user import User
     from shared.models.admin import Admin
     from shared.models.document import Document, DocumentChunk
     from shared.models.query_log import QueryLog
     from shared.models.menu import MenuSection, MenuItem
+    from shared.utils.query_log_writer import enqueue_query_log
 except ImportError:
     # Fallback для локальной разработки
     sys.path.insert(0, str(project_root / "services" / "shared"))
-    from models.database import Base
+    from models.database import Base, engine as shared_engine, SessionLocal as shared_session_factory
+    from models.database import create_async_db_engine
     from models.user import User
     from models.admin import Admin
     from models.document import Document, DocumentChunk
     from models.query_log import QueryLog
     from models.menu import MenuSection, MenuItem
+    from utils.query_log_writer import enqueue_query_log
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +47,10 @@ logger = logging.getLogger(__name__)
 engine = None
 SessionLocal = None
 
+# Асинхронное подключение (asyncpg) для обработчиков бота
+async_engine = None
+AsyncSessionLocal = None
+
 def init_database():
     """Инициализация подключения к базе данных"""
     global engine, SessionLocal
@@ -48,33 +59,37 @@ def init_database():
     if not database_url:
         raise ValueError("DATABASE_URL не найден в переменных окружения")
     
-    try:
-        # Создаем движок базы данных
-        engine = create_engine(
-            database_url,
-            pool_pre_ping=True,
-            pool_recycle=300,
-            echo=False  # Установите True для отладки SQL запросов
-        )
-        
-        # Создаем фабрику сессий
-        SessionLocal = sessionmaker(
-            autocommit=False,
-            autoflush=False,
-            bind=engine
-        )
-        
-        logger.info("✅ Подключение к базе данных установлено")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка подключения к базе данных: {e}")
-        raise
+    # Синхронные запросы бота идут через общий пул процесса ("main"),
+    # им же пользуется фоновая запись журнала запросов
+    engine = shared_engine
+    SessionLocal = shared_session_factory
+    
+    logger.info("✅ Подключение к базе данных установлено")
+
+def init_async_database():
+    """Инициализация асинхронного подключения к базе данных"""
+    global async_engine, AsyncSessionLocal
+    
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL не найден в переменных окружения")
+    
+    async_engine = create_async_db_engine(database_url, name="bot-async")
+    # Объекты остаются доступными после commit без повторного запроса
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    logger.info("✅ Асинхронное подключение к базе данных установлено")
+
+async def close_async_database():
+    """Закрытие пула асинхронных соединений"""
+    if async_engine is not None:
+        await async_engine.dispose()
 
 async def init_db():
     """Асинхронная инициализация базы данных"""
     try:
         # Инициализируем подключение
         init_database()
+        init_async_database()
         
         # Создаем таблицы, если их нет
         Base.metadata.create_all(bind=engine)
@@ -105,6 +120,63 @@ def get_db_session() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+def _update_user_names(user: User, username: str = None, first_name: str = None, last_name: str = None) -> bool:
+    """Обновление имени пользователя, если оно изменилось в Telegram"""
+    updated = False
+    if username and user.username != username:
+        user.username = username
+        updated = True
+    if first_name and user.first_name != first_name:
+        user.first_name = first_name
+        updated = True
+    if last_name and user.last_name != last_name:
+        user.last_name = last_name
+        updated = True
+    return updated
+
+def _document_to_dict(document: Document) -> dict:
+    return {
+        'id': document.id,
+        'title': document.title or document.original_filename,
+        'original_filename': document.original_filename,
+        'file_path': document.file_path,
+        'file_type': document.file_type,
+        'file_size': document.file_size,
+        'created_at': document.created_at,
+        'status': document.processing_status
+    }
+
+def _document_brief(document: Document) -> dict:
+    return {
+        'title': document.title or document.original_filename,
+        'original_filename': document.original_filename,
+        'created_at': document.created_at
+    }
+
+def _menu_item_content(item: MenuItem) -> dict:
+    """Содержимое элемента меню с разобранными JSON-полями источников"""
+    source_document_ids = []
+    source_document_names = []
+    source_chunk_ids = []
+    
+    try:
+        if item.source_document_ids:
+            source_document_ids = json.loads(item.source_document_ids)
+        if item.source_document_names:
+            source_document_names = json.loads(item.source_document_names)
+        if item.source_chunk_ids:
+            source_chunk_ids = json.loads(item.source_chunk_ids)
+    except json.JSONDecodeError:
+        logger.warning(f"Ошибка парсинга JSON источников для элемента {item.id}")
+    
+    return {
+        "title": item.title, 
+        "content": item.content,
+        "source_document_ids": source_document_ids,
+        "source_document_names": source_document_names,
+        "source_chunk_ids": source_chunk_ids
+    }
+
 def get_or_create_user(telegram_id: int, username: str = None, first_name: str = None, last_name: str = None) -> User:
     """
     Получение или создание пользователя
@@ -126,18 +198,7 @@ def get_or_create_user(telegram_id: int, username: str = None, first_name: str =
         
         if user:
             # Обновляем информацию, если она изменилась
-            updated = False
-            if username and user.username != username:
-                user.username = username
-                updated = True
-            if first_name and user.first_name != first_name:
-                user.first_name = first_name
-                updated = True
-            if last_name and user.last_name != last_name:
-                user.last_name = last_name
-                updated = True
-            
-            if updated:
+            if _update_user_names(user, username, first_name, last_name):
                 db.commit()
                 logger.info(f"Обновлена информация пользователя {telegram_id}")
             
@@ -172,6 +233,9 @@ def log_user_query(user_id: int, query: str, response_text: str,
     """
     Логирование запроса пользователя
     
+    Запись ставится в очередь и пишется в БД пакетом в фоновом потоке
+    (shared/utils/query_log_writer.py), вызов не ждет INSERT.
+    
     Args:
         user_id: ID пользователя
         query: Текст запроса
@@ -181,31 +245,9 @@ def log_user_query(user_id: int, query: str, response_text: str,
         documents_used: JSON со списком использованных документов
         
     Returns:
-        bool: Успешность операции
+        bool: False, если очередь журнала заполнена и запись отброшена
     """
-    db = next(get_db_session())
-    
-    try:
-        query_log = QueryLog(
-            user_id=user_id,
-            query=query,
-            response=response_text,
-            response_time=response_time,
-            similarity_score=similarity_score,
-            documents_used=documents_used
-        )
-        
-        db.add(query_log)
-        db.commit()
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Ошибка логирования запроса: {e}")
-        db.rollback()
-        return False
-    finally:
-        db.close()
+    return enqueue_query_log(user_id, query, response_text, response_time, similarity_score, documents_used)
 
 def get_user_stats(telegram_id: int) -> dict:
     """
@@ -318,32 +360,7 @@ def get_menu_item_content(item_id: int):
     try:
         db = next(get_db_session())
         item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
-        if item:
-            import json
-            
-            # Парсим JSON поля источников
-            source_document_ids = []
-            source_document_names = []
-            source_chunk_ids = []
-            
-            try:
-                if item.source_document_ids:
-                    source_document_ids = json.loads(item.source_document_ids)
-                if item.source_document_names:
-                    source_document_names = json.loads(item.source_document_names)
-                if item.source_chunk_ids:
-                    source_chunk_ids = json.loads(item.source_chunk_ids)
-            except json.JSONDecodeError:
-                logger.warning(f"Ошибка парсинга JSON источников для элемента {item_id}")
-            
-            return {
-                "title": item.title, 
-                "content": item.content,
-                "source_document_ids": source_document_ids,
-                "source_document_names": source_document_names,
-                "source_chunk_ids": source_chunk_ids
-            }
-        return None
+        return _menu_item_content(item) if item else None
     except Exception as e:
         logger.error(f"Ошибка получения содержимого элемента: {e}")
         return None
@@ -359,16 +376,7 @@ def get_documents_by_ids(document_ids: list):
             return []
         
         documents = db.query(Document).filter(Document.id.in_(document_ids)).all()
-        result = []
-        
-        for doc in documents:
-            result.append({
-                'title': doc.title or doc.original_filename,
-                'original_filename': doc.original_filename,
-                'created_at': doc.created_at
-            })
-        
-        return result
+        return [_document_brief(doc) for doc in documents]
     except Exception as e:
         logger.error(f"Ошибка получения документов по ID: {e}")
         return []
@@ -387,21 +395,7 @@ def get_completed_documents(limit: int = None, offset: int = None):
             query = query.limit(limit)
             
         documents = query.all()
-        
-        result = []
-        for doc in documents:
-            result.append({
-                'id': doc.id,
-                'title': doc.title or doc.original_filename,
-                'original_filename': doc.original_filename,
-                'file_path': doc.file_path,
-                'file_type': doc.file_type,
-                'file_size': doc.file_size,
-                'created_at': doc.created_at,
-                'status': doc.processing_status
-            })
-        
-        return result
+        return [_document_to_dict(doc) for doc in documents]
     except Exception as e:
         logger.error(f"Ошибка получения завершенных документов: {e}")
         return []
@@ -426,21 +420,193 @@ def get_document_by_id(doc_id: int):
         db = next(get_db_session())
         document = db.query(Document).filter(Document.id == doc_id).first()
         
-        if not document:
-            return None
-            
-        return {
-            'id': document.id,
-            'title': document.title or document.original_filename,
-            'original_filename': document.original_filename,
-            'file_path': document.file_path,
-            'file_type': document.file_type,
-            'file_size': document.file_size,
-            'created_at': document.created_at,
-            'status': document.processing_status
-        }
+        return _document_to_dict(document) if document else None
     except Exception as e:
         logger.error(f"Ошибка получения документа по ID {doc_id}: {e}")
         return None
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# ---------------------------------------------------------------------------
+# Асинхронные версии (asyncpg): обработчики бота не блокируют event loop
+# ---------------------------------------------------------------------------
+
+@asynccontextmanager
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """
+    Получение асинхронной сессии базы данных
+    
+    Yields:
+        AsyncSession: Асинхронная сессия SQLAlchemy
+    """
+    if AsyncSessionLocal is None:
+        init_async_database()
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"Ошибка в асинхронной сессии БД: {e}")
+            await db.rollback()
+            raise
+
+async def get_or_create_user_async(telegram_id: int, username: str = None,
+                                   first_name: str = None, last_name: str = None) -> User:
+    """Асинхронная версия get_or_create_user"""
+    async with get_async_session() as db:
+        try:
+            user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+            
+            if user:
+                if _update_user_names(user, username, first_name, last_name):
+                    await db.commit()
+                    logger.info(f"Обновлена информация пользователя {telegram_id}")
+                return user
+            
+            new_user = User(
+                telegram_id=telegram_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+                is_active=True
+            )
+            db.add(new_user)
+            await db.commit()
+            await db.refresh(new_user)
+            
+            logger.info(f"Создан новый пользователь: {telegram_id} ({username})")
+            return new_user
+            
+        except Exception as e:
+            logger.error(f"Ошибка при работе с пользователем {telegram_id}: {e}")
+            await db.rollback()
+            raise
+
+async def log_user_query_async(user_id: int, query: str, response_text: str,
+                               response_time: float = None, similarity_score: float = None,
+                               documents_used: str = None) -> bool:
+    """Асинхронная версия log_user_query (постановка в очередь не блокирует event loop)"""
+    return log_user_query(user_id, query, response_text, response_time, similarity_score, documents_used)
+
+async def get_user_stats_async(telegram_id: int) -> dict:
+    """Асинхронная версия get_user_stats"""
+    try:
+        async with get_async_session() as db:
+            user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+            if not user:
+                return {'error': 'Пользователь не найден'}
+            
+            # Количество запросов и время последнего - одним запросом
+            stats = (await db.execute(
+                select(func.count(QueryLog.id), func.max(QueryLog.created_at)).where(QueryLog.user_id == user.id)
+            )).one()
+            
+            return {
+                'user_id': user.id,
+                'telegram_id': user.telegram_id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'is_active': user.is_active,
+                'created_at': user.created_at,
+                'query_count': stats[0],
+                'last_query_at': stats[1]
+            }
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики пользователя {telegram_id}: {e}")
+        return {'error': str(e)}
+
+async def check_database_health_async() -> bool:
+    """Асинхронная версия check_database_health"""
+    try:
+        async with get_async_session() as db:
+            await db.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка проверки БД: {e}")
+        return False
+
+async def get_completed_documents_count_async() -> int:
+    """Асинхронная версия get_completed_documents_count"""
+    try:
+        async with get_async_session() as db:
+            return await db.scalar(
+                select(func.count(Document.id)).where(Document.processing_status == 'completed')
+            )
+    except Exception as e:
+        logger.error(f"Ошибка получения количества завершенных документов: {e}")
+        return 0
+
+# Количество документов для /health совпадает с количеством завершенных
+get_documents_count_async = get_completed_documents_count_async
+
+async def get_menu_sections_async() -> list:
+    """Асинхронная версия get_menu_sections"""
+    try:
+        async with get_async_session() as db:
+            sections = (await db.execute(select(MenuSection).order_by(MenuSection.order_index))).scalars().all()
+            return [{"id": s.id, "title": s.title} for s in sections]
+    except Exception as e:
+        logger.error(f"Ошибка получения разделов меню: {e}")
+        return []
+
+async def get_menu_items_async(section_id: int) -> list:
+    """Асинхронная версия get_menu_items"""
+    try:
+        async with get_async_session() as db:
+            items = (await db.execute(
+                select(MenuItem).where(MenuItem.section_id == section_id).order_by(MenuItem.order_index)
+            )).scalars().all()
+            return [{"id": i.id, "title": i.title, "content": i.content} for i in items]
+    except Exception as e:
+        logger.error(f"Ошибка получения элементов меню: {e}")
+        return []
+
+async def get_menu_item_content_async(item_id: int) -> Optional[dict]:
+    """Асинхронная версия get_menu_item_content"""
+    try:
+        async with get_async_session() as db:
+            item = await db.get(MenuItem, item_id)
+            return _menu_item_content(item) if item else None
+    except Exception as e:
+        logger.error(f"Ошибка получения содержимого элемента: {e}")
+        return None
+
+async def get_documents_by_ids_async(document_ids: list) -> list:
+    """Асинхронная версия get_documents_by_ids"""
+    if not document_ids:
+        return []
+    try:
+        async with get_async_session() as db:
+            documents = (await db.execute(select(Document).where(Document.id.in_(document_ids)))).scalars().all()
+            return [_document_brief(doc) for doc in documents]
+    except Exception as e:
+        logger.error(f"Ошибка получения документов по ID: {e}")
+        return []
+
+async def get_completed_documents_async(limit: int = None, offset: int = None) -> list:
+    """Асинхронная версия get_completed_documents"""
+    try:
+        async with get_async_session() as db:
+            query = select(Document).where(
+                Document.processing_status == 'completed'
+            ).order_by(Document.created_at.desc())
+            if offset:
+                query = query.offset(offset)
+            if limit:
+                query = query.limit(limit)
+            documents = (await db.execute(query)).scalars().all()
+            return [_document_to_dict(doc) for doc in documents]
+    except Exception as e:
+        logger.error(f"Ошибка получения завершенных документов: {e}")
+        return []
+
+async def get_document_by_id_async(doc_id: int) -> Optional[dict]:
+    """Асинхронная версия get_document_by_id"""
+    try:
+        async with get_async_session() as db:
+            document = await db.get(Document, doc_id)
+            return _document_to_dict(document) if document else None
+    except Exception as e:
+        logger.error(f"Ошибка получения документа по ID {doc_id}: {e}")
+        return None
@@ -0,0 +1,133 @@
+"""
+Отдельные ограниченные пулы потоков бота
+- embedding - эмбеддинги вопросов (CPU; torch отпускает GIL, поэтому потоки)
+- db        - запросы к PostgreSQL (поиск, логирование, статистика)
+- llm       - синхронные вызовы GigaChat (FAQ); основной путь ответа асинхронный
+
+У каждого пула своя очередь ограниченной длины: если она заполнена,
+задача отклоняется (ExecutorBusy), а не ждет неопределенно долго.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_CPU_COUNT = os.cpu_count() or 2
+
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(min(4, _CPU_COUNT))))
+DB_WORKERS = int(os.getenv("DB_WORKERS", "10"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", os.getenv("GIGACHAT_MAX_CONCURRENCY", "8")))
+# Сколько задач может ждать свободного потока в каждом пуле
+EXECUTOR_MAX_QUEUE = int(os.getenv("EXECUTOR_MAX_QUEUE", "50"))
+
+# Корутина, которую вызывают, если задача встала в очередь (позиция в очереди)
+QueuedCallback = Callable[[int], Awaitable[None]]
+
+
+class ExecutorBusy(Exception):
+    """Очередь пула заполнена, задача не принята"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Пул '{name}' перегружен")
+        self.name = name
+
+
+class BoundedExecutor:
+    """Пул потоков с ограниченной очередью и метриками ожидания"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int = EXECUTOR_MAX_QUEUE):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"bot-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0  # принятые и еще не завершенные задачи
+        self._active = 0
+        self.started = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def queued(self) -> int:
+        return max(0, self._pending - self._active)
+
+    async def run(self, func: Callable[..., Any], *args,
+                  on_queued: Optional[QueuedCallback] = None) -> Any:
+        """
+        Выполнение func(*args) в пуле
+
+        Raises:
+            ExecutorBusy: очередь пула заполнена
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorBusy(self.name)
+            self._pending += 1
+            position = self._pending - self.max_workers
+
+        submitted_at = time.perf_counter()
+
+        def call():
+            wait = time.perf_counter() - submitted_at
+            with self._lock:
+                self._active += 1
+                self.started += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+        try:
+            if position > 0 and on_queued is not None:
+                try:
+                    await on_queued(position)
+                except Exception as e:
+                    logger.debug(f"Не удалось сообщить о позиции в очереди: {e}")
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'active': self._active,
+                'queued': self.queued,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_ms_avg': round(self._wait_total / max(1, self.started) * 1000, 2),
+                'wait_ms_max': round(self._wait_max * 1000, 2)
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+embedding_executor = BoundedExecutor("embedding", EMBEDDING_WORKERS)
+db_executor = BoundedExecutor("db", DB_WORKERS)
+llm_executor = BoundedExecutor("llm", LLM_WORKERS)
+
+
+def get_executor_stats() -> Dict[str, Dict[str, Any]]:
+    """Метрики всех пулов бота"""
+    return {executor.name: executor.get_stats() for executor in (embedding_executor, db_executor, llm_executor)}
+
+
+def shutdown_executors():
+    for executor in (embedding_executor, db_executor, llm_executor):
+        executor.shutdown()
@@ -23,8 +23,14 @@ from aiogram.fsm.context import FSMContext
 
 try:
     from bot.config import Config
-    from bot.database import log_user_query, get_user_stats, check_database_health, get_documents_count, get_or_create_user, get_menu_sections, get_menu_items, get_menu_item_content, get_documents_by_ids, get_completed_documents, get_completed_documents_count, get_document_by_id
+    from bot.database import (
+        log_user_query_async, get_user_stats_async, check_database_health_async, get_documents_count_async,
+        get_menu_sections_async, get_menu_items_async, get_menu_item_content_async,
+        get_completed_documents_async, get_completed_documents_count_async, get_document_by_id_async
+    )
     from bot.rag_service import RAGService
+    from bot.streaming import StreamingMessageUpdater
+    from bot.user_registry import user_registry
 except ImportError:
     # Fallback для тестирования
     import os
@@ -33,8 +39,14 @@ except ImportError:
     sys.path.insert(0, current_dir)
     
     from config import Config
-    from database import log_user_query, get_user_stats, check_database_health, get_documents_count, get_or_create_user, get_menu_sections, get_menu_items, get_menu_item_content, get_documents_by_ids, get_completed_documents, get_completed_documents_count, get_document_by_id
+    from database import (
+        log_user_query_async, get_user_stats_async, check_database_health_async, get_documents_count_async,
+        get_menu_sections_async, get_menu_items_async, get_menu_item_content_async,
+        get_completed_documents_async, get_completed_documents_count_async, get_document_by_id_async
+    )
     from rag_service import RAGService
+    from streaming import StreamingMessageUpdater
+    from user_registry import user_registry
 
 logger = logging.getLogger(__name__)
 
@@ -271,10 +283,10 @@ def format_response_for_telegram(text: str) -> str:
     
     return text.strip()
 
-def create_faq_keyboard():
+async def create_faq_keyboard():
     """Создание клавиатуры для FAQ на основе данных из БД"""
     try:
-        sections = get_menu_sections()
+        sections = await get_menu_sections_async()
         keyboard_buttons = []
         
         for section in sections:
@@ -314,10 +326,10 @@ def create_main_keyboard(user_telegram_id: int = None):
     keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     return keyboard
 
-def create_section_keyboard(section_id: int):
+async def create_section_keyboard(section_id: int):
     """Создание клавиатуры для вопросов в разделе"""
     try:
-        items = get_menu_items(section_id)
+        items = await get_menu_items_async(section_id)
         keyboard_buttons = []
         
         for item in items:
@@ -341,18 +353,18 @@ def create_section_keyboard(section_id: int):
         ])
         return keyboard
 
-def create_documents_keyboard(page: int = 0, documents_per_page: int = 10):
+async def create_documents_keyboard(page: int = 0, documents_per_page: int = 10):
     """Создание клавиатуры для списка документов с пагинацией"""
     try:
         # Получаем общее количество документов
-        total_documents = get_completed_documents_count()
+        total_documents = await get_completed_documents_count_async()
         
         # Вычисляем пагинацию
         total_pages = (total_documents + documents_per_page - 1) // documents_per_page
         offset = page * documents_per_page
         
         # Получаем документы для текущей страницы
-        documents = get_completed_documents(limit=documents_per_page, offset=offset)
+        documents = await get_completed_documents_async(limit=documents_per_page, offset=offset)
         
         keyboard_buttons = []
         
@@ -410,47 +422,16 @@ def create_documents_keyboard(page: int = 0, documents_per_page: int = 10):
         ])
         return keyboard, 0
 
-def get_document_info(doc_id: int):
+async def get_document_info(doc_id: int):
     """Получение информации о документе"""
-    return get_document_by_id(doc_id)
-
-async def get_or_create_user_async(telegram_id: int, username: str = None, 
-                                 first_name: str = None, last_name: str = None):
-    """Асинхронная версия get_or_create_user"""
-    loop = asyncio.get_event_loop()
-    
-    return await loop.run_in_executor(
-        None, 
-        get_or_create_user, 
-        telegram_id, 
-        username, 
-        first_name,
-        last_name
-    )
-
-async def log_user_query_async(user_id: int, query: str, response: str, 
-                              response_time: float = None, similarity_score: float = None,
-                              documents_used: str = None):
-    """Асинхронная версия log_user_query"""
-    loop = asyncio.get_event_loop()
-    
-    return await loop.run_in_executor(
-        None,
-        log_user_query,
-        user_id,
-        query,
-        response,
-        response_time,
-        similarity_score,
-        documents_used
-    )
+    return await get_document_by_id_async(doc_id)
 
 @router.message(CommandStart())
 async def start_handler(message: Message):
     """Обработчик команды /start"""
     try:
         # Получаем или создаем пользователя
-        user = await get_or_create_user_async(
+        user = await user_registry.get_or_create(
             telegram_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name,
@@ -515,7 +496,7 @@ async def stats_handler(message: Message):
     """Обработчик команды /stats"""
     try:
         # Получаем пользователя
-        user = await get_or_create_user_async(
+        user = await user_registry.get_or_create(
             telegram_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name,
@@ -523,12 +504,7 @@ async def stats_handler(message: Message):
         )
         
         # Получаем статистику
-        loop = asyncio.get_event_loop()
-        stats = await loop.run_in_executor(
-            None,
-            get_user_stats,
-            message.from_user.id
-        )
+        stats = await get_user_stats_async(message.from_user.id)
         
         if 'error' in stats:
             await message.answer("❌ Ошибка получения статистики")
@@ -568,8 +544,7 @@ async def health_handler(message: Message):
         
         # Проверяем базу данных
         try:
-            loop = asyncio.get_event_loop()
-            db_health = await loop.run_in_executor(None, check_database_health)
+            db_health = await check_database_health_async()
             if db_health:
                 health_status.append("✅ База данных: OK")
             else:
@@ -589,8 +564,7 @@ async def health_handler(message: Message):
         
         # Проверяем количество документов
         try:
-            loop = asyncio.get_event_loop()
-            docs_count = await loop.run_in_executor(None, get_documents_count)
+            docs_count = await get_documents_count_async()
             health_status.append(f"📄 Документов в базе: {docs_count}")
         except Exception as e:
             health_status.append(f"❌ Документы: {str(e)[:50]}")
@@ -609,7 +583,7 @@ async def question_handler(message: Message):
     """Обработчик текстовых сообщений (вопросов пользователей)"""
     try:
         # Получаем или создаем пользователя
-        user = await get_or_create_user_async(
+        user = await user_registry.get_or_create(
             telegram_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name,
@@ -627,8 +601,19 @@ async def question_handler(message: Message):
         # Отправляем индикатор "печатает"
         await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
         
-        # Получаем ответ от RAG системы
-        result = await rag_service.answer_question(message.text, user_id=user.id)
+        # Получаем ответ от RAG системы, показывая текст по мере генерации
+        stream_updater = None
+        if config.STREAMING_ENABLED:
+            stream_updater = StreamingMessageUpdater(search_message, min_interval=config.STREAM_EDIT_INTERVAL)
+        
+        async def show_queue_position(position: int):
+            await search_message.edit_text(f"⏳ Ваш вопрос в очереди (перед вами: {position})...")
+        
+        result = await rag_service.answer_question(message.text, user_id=user.id, on_partial=stream_updater,
+                                                   on_queued=show_queue_position)
+        if stream_updater and stream_updater.edits:
+            logger.info(f"Потоковый ответ: {stream_updater.edits} обновлений, "
+                        f"первый текст через {stream_updater.first_edit_latency:.2f} с")
         
         # Проверяем качество результата
         if not result or 'answer' not in result:
@@ -801,7 +786,7 @@ async def show_faq_callback(callback: CallbackQuery):
     """Показать FAQ меню"""
     await callback.message.edit_text(
         "📚 **Часто задаваемые вопросы**\n\nВыберите интересующую вас категорию:",
-        reply_markup=create_faq_keyboard(),
+        reply_markup=await create_faq_keyboard(),
         parse_mode='Markdown'
     )
     await callback.answer()
@@ -811,7 +796,7 @@ async def show_stats_callback(callback: CallbackQuery):
     """Показать статистику через callback"""
     try:
         # Получаем пользователя
-        user = await get_or_create_user_async(
+        user = await user_registry.get_or_create(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username,
             first_name=callback.from_user.first_name,
@@ -819,12 +804,7 @@ async def show_stats_callback(callback: CallbackQuery):
         )
         
         # Получаем статистику
-        loop = asyncio.get_event_loop()
-        stats = await loop.run_in_executor(
-            None,
-            get_user_stats,
-            callback.from_user.id
-        )
+        stats = await get_user_stats_async(callback.from_user.id)
         
         if 'error' in stats:
             await callback.message.edit_text("❌ Ошибка получения статистики")
@@ -870,8 +850,7 @@ async def show_health_callback(callback: CallbackQuery):
         
         # Проверяем базу данных
         try:
-            loop = asyncio.get_event_loop()
-            db_health = await loop.run_in_executor(None, check_database_health)
+            db_health = await check_database_health_async()
             if db_health:
                 health_status.append("✅ База данных: OK")
             else:
@@ -891,8 +870,7 @@ async def show_health_callback(callback: CallbackQuery):
         
         # Проверяем количество документов
         try:
-            loop = asyncio.get_event_loop()
-            docs_count = await loop.run_in_executor(None, get_documents_count)
+            docs_count = await get_documents_count_async()
             health_status.append(f"📄 Документов в базе: {docs_count}")
         except Exception as e:
             health_status.append(f"❌ Документы: {str(e)[:50]}")
@@ -941,7 +919,7 @@ async def faq_section_callback(callback: CallbackQuery):
         section_id = int(callback.data.replace("faq_section_", ""))
         
         # Получаем информацию о разделе
-        sections = get_menu_sections()
+        sections = await get_menu_sections_async()
         section = next((s for s in sections if s['id'] == section_id), None)
         
         if not section:
@@ -955,7 +933,7 @@ async def faq_section_callback(callback: CallbackQuery):
             return
         
         # Создаем клавиатуру с вопросами
-        keyboard = create_section_keyboard(section_id)
+        keyboard = await create_section_keyboard(section_id)
         
         section_text = f"📚 **{section['title']}**\n\nВыберите интересующий вас вопрос:"
         
@@ -983,7 +961,7 @@ async def faq_item_callback(callback: CallbackQuery):
         item_id = int(callback.data.replace("faq_item_", ""))
         
         # Получаем содержимое элемента меню
-        item_data = get_menu_item_content(item_id)
+        item_data = await get_menu_item_content_async(item_id)
         
         if not item_data:
             await callback.message.edit_text(
@@ -1021,7 +999,7 @@ async def faq_item_callback(callback: CallbackQuery):
         )
         
         # Логируем просмотр FAQ
-        user = await get_or_create_user_async(
+        user = await user_registry.get_or_create(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username,
             first_name=callback.from_user.first_name,
@@ -1034,7 +1012,7 @@ async def faq_item_callback(callback: CallbackQuery):
         await log_user_query_async(
             user_id=user.id,
             query=f"FAQ: {item_data['title']}",
-            response=item_data['content'],
+            response_text=item_data['content'],
             documents_used=sources_str
         )
             
@@ -1269,7 +1247,7 @@ async def show_files_callback(callback: CallbackQuery):
 async def show_documents_callback(callback: CallbackQuery):
     """Показать список документов"""
     try:
-        keyboard, total_docs = create_documents_keyboard(page=0)
+        keyboard, total_docs = await create_documents_keyboard(page=0)
         
         if total_docs == 0:
             await callback.message.edit_text(
@@ -1301,7 +1279,7 @@ async def docs_page_callback(callback: CallbackQuery):
     """Обработчик пагинации документов"""
     try:
         page = int(callback.data.replace("docs_page_", ""))
-        keyboard, total_docs = create_documents_keyboard(page=page)
+        keyboard, total_docs = await create_documents_keyboard(page=page)
         
         await callback.message.edit_text(
             f"📄 **Корпоративные документы**\n\nВсего документов: {total_docs}\n\nВыберите документ для просмотра:",
@@ -1336,7 +1314,7 @@ async def doc_info_callback(callback: CallbackQuery):
     """Показать информацию о документе"""
     try:
         doc_id = int(callback.data.replace("doc_info_", ""))
-        doc_info = get_document_info(doc_id)
+        doc_info = await get_document_info(doc_id)
         
         if not doc_info:
             await callback.message.edit_text(
@@ -1439,7 +1417,7 @@ async def download_doc_callback(callback: CallbackQuery):
             await callback.answer()
             return
         
-        doc_info = get_document_info(doc_id)
+        doc_info = await get_document_info(doc_id)
         
         if not doc_info:
             await callback.message.answer(
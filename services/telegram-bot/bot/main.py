@@ -24,8 +24,10 @@ except ImportError:
     sys.exit(1)
 
 from bot.config import Config
-from bot.database import init_db
-from bot.handlers import router
+from bot.database import init_db, close_async_database
+from bot.handlers import router, rag_service
+from bot.executors import shutdown_executors
+from bot.user_registry import user_registry
 from bot.middleware import LoggingMiddleware, AuthMiddleware, RateLimitMiddleware
 
 # Настройка логирования
@@ -77,10 +79,14 @@ class POLIOMBot:
         try:
             await init_db()
             logger.info("✅ База данных инициализирована")
+            user_registry.start()
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации БД: {e}")
             raise
         
+        # Загружаем и прогреваем модель эмбеддингов до приема сообщений
+        await rag_service.initialize()
+        
         # Настраиваем команды бота
         await self.setup_bot_commands()
         
@@ -91,6 +97,9 @@ class POLIOMBot:
         logger.info("👋 Завершение работы бота...")
         
         # Здесь можно добавить очистку ресурсов
+        await user_registry.stop()
+        shutdown_executors()
+        await close_async_database()
         await self.bot.session.close()
     
     async def run(self):
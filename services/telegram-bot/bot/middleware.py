@@ -4,7 +4,7 @@ from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
 
-from bot.database import get_or_create_user
+from bot.user_registry import user_registry
 
 logger = logging.getLogger(__name__)
 
@@ -77,10 +77,11 @@ class AuthMiddleware(BaseMiddleware):
         
         try:
             # Получаем или создаем пользователя в БД
-            user_db = get_or_create_user(
+            user_db = await user_registry.get_or_create(
                 telegram_id=user_tg.id,
                 username=user_tg.username,
-                full_name=user_tg.full_name
+                first_name=user_tg.first_name,
+                last_name=user_tg.last_name
             )
             
             # Проверяем, активен ли пользователь
@@ -2,11 +2,12 @@
 Асинхронный сервис для работы с RAG системой
 """
 
+import asyncio
 import sys
 import os
+import time
 import logging
-import asyncio
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Awaitable
 from pathlib import Path
 
 # Определяем корневую директорию проекта
@@ -22,13 +23,19 @@ if shared_path not in sys.path:
 try:
     from shared.utils.simple_rag import SimpleRAG
     from shared.utils.llm_client import SimpleLLMClient
+    from shared.utils.model_registry import warmup as warmup_embedding_model, get_model_stats
+    from shared.utils.query_log_writer import get_query_log_writer
     from shared.models.document import Document, DocumentChunk
+    from shared.models.database import get_pool_stats
 except ImportError:
     # Добавляем пути в систему
     sys.path.insert(0, str(project_root / "services" / "shared"))
     from utils.simple_rag import SimpleRAG
     from utils.llm_client import SimpleLLMClient
+    from utils.model_registry import warmup as warmup_embedding_model, get_model_stats
+    from utils.query_log_writer import get_query_log_writer
     from models.document import Document, DocumentChunk
+    from models.database import get_pool_stats
 
 try:
     from bot.database import get_db_session
@@ -38,12 +45,22 @@ except ImportError:
     sys.path.insert(0, current_dir)
     from database import get_db_session
 
+try:
+    from bot.executors import embedding_executor, db_executor, llm_executor, ExecutorBusy, get_executor_stats
+except ImportError:
+    from executors import embedding_executor, db_executor, llm_executor, ExecutorBusy, get_executor_stats
+
 logger = logging.getLogger(__name__)
 
 class RAGService:
     """
     Асинхронный сервис для работы с RAG системой
     Адаптер между синхронной RAG системой и асинхронным ботом
+    
+    Один экземпляр SimpleRAG обслуживает все параллельные вопросы,
+    каждый вызов получает собственную сессию БД.
+    Эмбеддинги и запросы к БД выполняются в отдельных ограниченных пулах
+    (bot.executors), поэтому медленная база не задерживает эмбеддинги и наоборот.
     """
     
     def __init__(self, gigachat_api_key: str):
@@ -59,16 +76,12 @@ class RAGService:
         try:
             logger.info("🔄 Инициализируем RAG систему...")
             
-            # Получаем синхронную сессию БД
-            db_session = next(get_db_session())
+            # Прогреваем общую модель эмбеддингов до первого вопроса
+            model_stats = await embedding_executor.run(warmup_embedding_model)
+            logger.info(f"📊 Модель эмбеддингов: {model_stats}")
             
-            # Создаем RAG систему в отдельном потоке
-            loop = asyncio.get_event_loop()
-            self.rag_system = await loop.run_in_executor(
-                None, 
-                self._create_rag_system, 
-                db_session
-            )
+            # Создаем общую RAG систему в отдельном потоке
+            self.rag_system = await db_executor.run(self._create_rag_system)
             
             self.initialized = True
             logger.info("✅ RAG система инициализирована")
@@ -77,17 +90,21 @@ class RAGService:
             logger.error(f"❌ Ошибка инициализации RAG системы: {e}")
             raise
     
-    def _create_rag_system(self, db_session):
+    def _create_rag_system(self):
         """Создание RAG системы (синхронно)"""
-        return SimpleRAG(db_session, self.gigachat_api_key)
+        return SimpleRAG(self.gigachat_api_key)
     
-    async def answer_question(self, question: str, user_id: Optional[int] = None) -> Dict[str, Any]:
+    async def answer_question(self, question: str, user_id: Optional[int] = None,
+                              on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+                              on_queued: Optional[Callable[[int], Awaitable[None]]] = None) -> Dict[str, Any]:
         """
         Асинхронный ответ на вопрос пользователя
         
         Args:
             question: Вопрос пользователя
             user_id: ID пользователя Telegram
+            on_partial: Корутина для потокового показа ответа (накопленный текст LLM)
+            on_queued: Корутина, вызываемая с позицией в очереди, если пул занят
             
         Returns:
             Dict с ответом и метаданными
@@ -96,17 +113,57 @@ class RAGService:
             await self.initialize()
         
         try:
-            # Выполняем поиск ответа в отдельном потоке с новой сессией
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                self._answer_question_sync,
-                question,
-                user_id
+            # Повторный вопрос отвечается из кэша точных совпадений без эмбеддинга
+            exact_cache_version = None
+            if self.rag_system.exact_cache is not None:
+                cached, exact_cache_version = await db_executor.run(
+                    self.rag_system.answer_from_exact_cache, question, user_id, on_queued=on_queued
+                )
+                if cached is not None:
+                    return cached
+            
+            # Эмбеддинг вопроса - в пуле эмбеддингов, поиск и сборка контекста - в пуле БД
+            question_embedding = await embedding_executor.run(
+                self.rag_system.create_embedding, question, on_queued=on_queued
+            )
+            prepared = await db_executor.run(
+                self._prepare_answer_sync, question, user_id, question_embedding, exact_cache_version,
+                on_queued=on_queued
+            )
+            if 'result' in prepared:
+                return prepared['result']
+            
+            # Ответ LLM ждем асинхронно, не занимая поток executor
+            llm_start = time.perf_counter()
+            if on_partial is not None:
+                llm_response = await self.rag_system.llm_client.astream_answer(
+                    context=prepared['context'],
+                    question=question,
+                    on_delta=on_partial
+                )
+            else:
+                llm_response = await self.rag_system.llm_client.agenerate_answer(
+                    context=prepared['context'],
+                    question=question
+                )
+            llm_time = time.perf_counter() - llm_start
+            
+            result = await db_executor.run(
+                self._finalize_answer_sync, question, user_id, prepared, llm_response, llm_time
             )
             
             return result
             
+        except ExecutorBusy as e:
+            logger.warning(f"⚠️ Вопрос отклонен: {e}")
+            return {
+                'answer': 'Сейчас очень много вопросов, попробуйте через минуту.',
+                'sources': [],
+                'success': False,
+                'error': 'busy',
+                'busy': True,
+                'tokens_used': 0
+            }
         except Exception as e:
             logger.error(f"Ошибка получения ответа: {e}")
             return {
@@ -117,20 +174,48 @@ class RAGService:
                 'tokens_used': 0
             }
     
-    def _answer_question_sync(self, question: str, user_id: Optional[int] = None) -> Dict[str, Any]:
-        """Синхронный ответ на вопрос с правильным управлением сессией"""
+    def _prepare_answer_sync(self, question: str, user_id: Optional[int] = None,
+                             question_embedding: Optional[List[float]] = None,
+                             exact_cache_version: Optional[int] = None) -> Dict[str, Any]:
+        """Синхронный поиск чанков и сборка промпта с отдельной сессией"""
+        db_session = None
+        try:
+            db_session = next(get_db_session())
+            return self.rag_system.prepare_answer(db_session, question, user_id, question_embedding,
+                                                  exact_cache_version=exact_cache_version)
+        except Exception as e:
+            logger.error(f"Ошибка подготовки ответа: {e}")
+            return {'result': {
+                'answer': 'Произошла ошибка при обработке вашего вопроса.',
+                'sources': [],
+                'success': False,
+                'error': str(e),
+                'tokens_used': 0
+            }}
+        finally:
+            if db_session:
+                try:
+                    db_session.close()
+                except:
+                    pass
+    
+    def _finalize_answer_sync(self, question: str, user_id: Optional[int], prepared: Dict[str, Any],
+                              llm_response, llm_time: float) -> Dict[str, Any]:
+        """Синхронное завершение ответа (источники, лог запроса) с правильным управлением сессией"""
         db_session = None
         try:
-            # Создаем новую сессию для каждого запроса
+            # Создаем новую сессию для каждого этапа, RAG система общая
             db_session = next(get_db_session())
-            rag_system = SimpleRAG(db_session, self.gigachat_api_key)
             
-            result = rag_system.answer_question(question, user_id)
+            result = self.rag_system.finalize_answer(
+                db_session, question, user_id, prepared, llm_response, llm_time
+            )
             
             # ДОПОЛНИТЕЛЬНОЕ ЛОГИРОВАНИЕ ДЛЯ ОТСЛЕЖИВАНИЯ FILE_PATH
             logger.info(f"🔍 RAG СЕРВИС TELEGRAM БОТА - Получен результат от SimpleRAG:")
             logger.info(f"  - success: {result.get('success', 'НЕТ')}")
             logger.info(f"  - chunks_found: {result.get('chunks_found', 0)}")
+            logger.info(f"  - telemetry: {result.get('telemetry', {})}")
             
             files = result.get('files', [])
             logger.info(f"  - файлов получено: {len(files)}")
@@ -187,12 +272,13 @@ class RAGService:
                 }
         
         try:
-            # Проверяем статус в отдельном потоке
-            loop = asyncio.get_event_loop()
-            status = await loop.run_in_executor(
-                None,
-                self.rag_system.health_check
+            # БД и эмбеддинги проверяются в пуле БД, GigaChat - в пуле LLM:
+            # сетевой запрос к LLM не должен занимать поток db_executor
+            status, llm_ok = await asyncio.gather(
+                db_executor.run(self._health_check_sync),
+                llm_executor.run(self.rag_system.check_llm)
             )
+            status['llm_client'] = llm_ok
             
             # Получаем количество документов
             documents_count = await self._get_documents_count()
@@ -208,7 +294,11 @@ class RAGService:
                 'llm': status['llm_client'],
                 'embeddings': status['embeddings_model'],
                 'database': status['database'],
-                'documents_count': documents_count
+                'documents_count': documents_count,
+                'embedding_model_stats': get_model_stats(),
+                'executors': get_executor_stats(),
+                'query_log': get_query_log_writer().get_stats(),
+                'db_pools': get_pool_stats()
             }
             
         except Exception as e:
@@ -222,15 +312,23 @@ class RAGService:
                 'error': str(e)
             }
     
+    def _health_check_sync(self) -> Dict[str, bool]:
+        """Синхронная проверка БД и эмбеддингов с отдельной сессией"""
+        db_session = None
+        try:
+            db_session = next(get_db_session())
+            return self.rag_system.check_local_components(db_session)
+        finally:
+            if db_session:
+                try:
+                    db_session.close()
+                except:
+                    pass
+    
     async def _get_documents_count(self) -> Optional[int]:
         """Получение количества документов в базе"""
         try:
-            loop = asyncio.get_event_loop()
-            count = await loop.run_in_executor(
-                None,
-                self._count_documents_sync
-            )
-            return count
+            return await db_executor.run(self._count_documents_sync)
         except Exception as e:
             logger.error(f"Ошибка подсчета документов: {e}")
             return None
@@ -269,13 +367,7 @@ class RAGService:
             await self.initialize()
         
         try:
-            loop = asyncio.get_event_loop()
-            chunks = await loop.run_in_executor(
-                None,
-                self._search_documents_sync,
-                query,
-                limit
-            )
+            chunks = await db_executor.run(self._search_documents_sync, query, limit)
             
             # Возвращаем чанки в правильном формате
             formatted_chunks = []
@@ -307,9 +399,8 @@ class RAGService:
         db_session = None
         try:
             db_session = next(get_db_session())
-            rag_system = SimpleRAG(db_session, self.gigachat_api_key)
             
-            chunks = rag_system.search_relevant_chunks(query, limit)
+            chunks = self.rag_system.search_relevant_chunks(db_session, query, limit)
             return chunks
             
         except Exception as e:
@@ -322,47 +413,6 @@ class RAGService:
                 except:
                     pass
     
-    async def _get_document_info(self, document_id: int) -> Optional[Dict[str, Any]]:
-        """Получение информации о документе"""
-        try:
-            loop = asyncio.get_event_loop()
-            doc_info = await loop.run_in_executor(
-                None,
-                self._get_document_info_sync,
-                document_id
-            )
-            return doc_info
-        except Exception as e:
-            logger.error(f"Ошибка получения информации о документе: {e}")
-            return None
-    
-    def _get_document_info_sync(self, document_id: int) -> Optional[Dict[str, Any]]:
-        """Синхронное получение информации о документе"""
-        db_session = None
-        try:
-            db_session = next(get_db_session())
-            document = db_session.query(Document).filter(
-                Document.id == document_id
-            ).first()
-            
-            if document:
-                return {
-                    'id': document.id,
-                    'title': document.title,
-                    'file_type': document.file_type,
-                    'created_at': document.created_at
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка получения документа {document_id}: {e}")
-            return None
-        finally:
-            if db_session:
-                try:
-                    db_session.close()
-                except:
-                    pass
-
     async def get_faq_by_category(self, category: str) -> Dict[str, Any]:
         """
         Получение FAQ по категории
@@ -377,13 +427,8 @@ class RAGService:
             await self.initialize()
         
         try:
-            # Выполняем поиск FAQ в отдельном потоке
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                self._get_faq_by_category_sync,
-                category
-            )
+            # FAQ без готовой категории отвечает синхронным вызовом GigaChat - пул LLM
+            result = await llm_executor.run(self._get_faq_by_category_sync, category)
             
             return result
             
@@ -401,10 +446,10 @@ class RAGService:
         try:
             # Создаем новую сессию
             db_session = next(get_db_session())
-            rag_system = SimpleRAG(db_session, self.gigachat_api_key)
+            rag_system = self.rag_system
             
             if hasattr(rag_system, 'get_faq_by_category'):
-                return rag_system.get_faq_by_category(category)
+                return rag_system.get_faq_by_category(db_session, category)
             else:
                 # Fallback - используем поиск по ключевым словам
                 category_keywords = {
@@ -418,7 +463,7 @@ class RAGService:
                 }
                 
                 keyword = category_keywords.get(category, category)
-                result = rag_system.answer_question(f"FAQ {keyword}")
+                result = rag_system.answer_question(db_session, f"FAQ {keyword}")
                 
                 if result.get('success'):
                     # Парсим ответ как FAQ
@@ -467,28 +512,19 @@ class RAGService:
             await self.initialize()
         
         try:
-            loop = asyncio.get_event_loop()
-            chunks = await loop.run_in_executor(
-                None,
-                self._search_relevant_chunks_sync,
-                query,
-                limit
-            )
+            chunks = await db_executor.run(self._search_relevant_chunks_sync, query, limit)
             
-            # Обогащаем чанки информацией о документах
-            enriched_chunks = []
-            for chunk in chunks:
-                doc_info = await self._get_document_info(chunk['document_id'])
-                enriched_chunk = {
+            # Название документа добавляется при поиске (кэш метаданных + один запрос)
+            return [
+                {
                     'document_id': chunk['document_id'],
-                    'document_title': doc_info['title'] if doc_info else 'Неизвестный документ',
+                    'document_title': chunk.get('document_title', 'Неизвестный документ'),
                     'content': chunk['content'],
                     'chunk_index': chunk['chunk_index'],
                     'similarity': chunk.get('similarity', 0.0)
                 }
-                enriched_chunks.append(enriched_chunk)
-            
-            return enriched_chunks
+                for chunk in chunks
+            ]
             
         except Exception as e:
             logger.error(f"Ошибка поиска релевантных чанков: {e}")
@@ -499,9 +535,8 @@ class RAGService:
         db_session = None
         try:
             db_session = next(get_db_session())
-            rag_system = SimpleRAG(db_session, self.gigachat_api_key)
             
-            chunks = rag_system.search_relevant_chunks(query, limit)
+            chunks = self.rag_system.search_relevant_chunks(db_session, query, limit)
             return chunks
             
         except Exception as e:
@@ -0,0 +1,66 @@
+"""
+Потоковый показ ответа LLM в Telegram
+Сообщение "Ищу ответ..." редактируется по мере генерации с ограничением частоты
+"""
+
+import time
+import logging
+from typing import Optional
+
+from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Курсор в конце частичного ответа
+STREAM_CURSOR = " ▌"
+
+
+class StreamingMessageUpdater:
+    """
+    Троттлинг edit_text для частичного ответа
+
+    Telegram ограничивает редактирование примерно одним разом в секунду
+    на чат, поэтому промежуточный текст отправляется не чаще min_interval
+    и только если заметно вырос. Ошибки редактирования не прерывают поток
+    генерации: при RetryAfter обновления откладываются на указанное время.
+    """
+
+    def __init__(self, message: Message, min_interval: float = 1.5, min_growth: int = 40):
+        self.message = message
+        self.min_interval = min_interval
+        self.min_growth = min_growth
+        self._last_edit_at = 0.0
+        self._last_length = 0
+        self._paused_until = 0.0
+        self.edits = 0
+        self.first_edit_latency: Optional[float] = None
+        self._started_at = time.monotonic()
+
+    async def __call__(self, text: str):
+        """Получение накопленного текста от LLM"""
+        now = time.monotonic()
+        if now < self._paused_until or now - self._last_edit_at < self.min_interval:
+            return
+        if len(text) - self._last_length < self.min_growth:
+            return
+
+        preview = text[:TELEGRAM_MESSAGE_LIMIT - len(STREAM_CURSOR)] + STREAM_CURSOR
+        try:
+            # Частичный Markdown может быть незакрыт, поэтому без parse_mode
+            await self.message.edit_text(preview)
+            self.edits += 1
+            if self.first_edit_latency is None:
+                self.first_edit_latency = now - self._started_at
+        except TelegramRetryAfter as e:
+            self._paused_until = now + e.retry_after
+            logger.debug(f"Telegram ограничил редактирование на {e.retry_after} с")
+        except TelegramBadRequest as e:
+            logger.debug(f"Промежуточное обновление ответа пропущено: {e}")
+        except Exception as e:
+            logger.warning(f"Ошибка промежуточного обновления ответа: {e}")
+        finally:
+            self._last_edit_at = time.monotonic()
+            self._last_length = len(text)
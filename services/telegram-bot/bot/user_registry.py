@@ -0,0 +1,225 @@
+"""
+Кэш пользователей бота с отложенной записью
+- Пользователь ищется в памяти по telegram_id, в БД - только при промахе или истечении TTL
+- Блокировка и разблокировка в админ-панели сбрасывают запись сразу (канал Redis)
+- Изменения имени и last_activity копятся в памяти и пишутся в БД
+  одним UPDATE раз в USER_FLUSH_INTERVAL секунд
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+project_root = Path(__file__).parent.parent.parent
+
+try:
+    from shared.utils.user_events import USER_EVENTS_REDIS_URL, USER_INVALIDATION_CHANNEL
+except ImportError:
+    sys.path.insert(0, str(project_root / "services" / "shared"))
+    from utils.user_events import USER_EVENTS_REDIS_URL, USER_INVALIDATION_CHANNEL
+
+try:
+    from bot.database import get_or_create_user_async, get_async_session
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from database import get_or_create_user_async, get_async_session
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "30"))
+
+# Пустые значения в пакете означают "без изменений"
+_FLUSH_QUERY = text("""
+    UPDATE users AS u SET
+        username = COALESCE(v.username, u.username),
+        first_name = COALESCE(v.first_name, u.first_name),
+        last_name = COALESCE(v.last_name, u.last_name),
+        last_activity = GREATEST(u.last_activity, v.last_activity)
+    FROM unnest(CAST(:telegram_ids AS bigint[]),
+                CAST(:usernames AS varchar[]),
+                CAST(:first_names AS varchar[]),
+                CAST(:last_names AS varchar[]),
+                CAST(:last_activities AS timestamptz[]))
+         AS v(telegram_id, username, first_name, last_name, last_activity)
+    WHERE u.telegram_id = v.telegram_id
+""")
+
+
+@dataclass
+class CachedUser:
+    """Снимок пользователя для обработчиков (поля как у модели User)"""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    is_active: bool
+
+
+class UserRegistry:
+    """Пользователи бота по telegram_id с TTL и пакетной записью изменений"""
+
+    def __init__(self, ttl: int = USER_CACHE_TTL, flush_interval: float = USER_FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._entries: Dict[int, Tuple[float, CachedUser]] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._tasks = []
+        self.hits = 0
+        self.misses = 0
+        self.flushed = 0
+        self.invalidations = 0
+
+    async def get_or_create(self, telegram_id: int, username: str = None,
+                            first_name: str = None, last_name: str = None) -> CachedUser:
+        """
+        Пользователь из кэша или БД (новый создается сразу)
+
+        Изменения имени и время активности не пишутся в БД на каждое сообщение,
+        а попадают в следующий пакет flush().
+        """
+        entry = self._entries.get(telegram_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            user = entry[1]
+            changes = {}
+            for field, value in (('username', username), ('first_name', first_name), ('last_name', last_name)):
+                if value and getattr(user, field) != value:
+                    setattr(user, field, value)
+                    changes[field] = value
+            if changes:
+                self._pending.setdefault(telegram_id, {}).update(changes)
+        else:
+            self.misses += 1
+            user = await self._load(telegram_id, username, first_name, last_name)
+
+        self._pending.setdefault(telegram_id, {})['last_activity'] = datetime.now(timezone.utc)
+        return user
+
+    async def _load(self, telegram_id: int, username: str, first_name: str, last_name: str) -> CachedUser:
+        """Загрузка из БД; параллельные события одного пользователя ждут один запрос"""
+        loading = self._loading.get(telegram_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._fetch(telegram_id, username, first_name, last_name))
+            self._loading[telegram_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(telegram_id, None))
+        return await asyncio.shield(loading)
+
+    async def _fetch(self, telegram_id: int, username: str, first_name: str, last_name: str) -> CachedUser:
+        db_user = await get_or_create_user_async(telegram_id, username, first_name, last_name)
+        user = CachedUser(
+            id=db_user.id,
+            telegram_id=db_user.telegram_id,
+            username=db_user.username,
+            first_name=db_user.first_name,
+            last_name=db_user.last_name,
+            is_active=db_user.is_active
+        )
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, user)
+        return user
+
+    def invalidate(self, telegram_id: Optional[int] = None):
+        """Сброс записи пользователя (или всего кэша)"""
+        self.invalidations += 1
+        if telegram_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(telegram_id, None)
+
+    async def flush(self) -> int:
+        """Запись накопленных изменений одним UPDATE"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        telegram_ids = list(pending)
+        try:
+            async with get_async_session() as db:
+                await db.execute(_FLUSH_QUERY, {
+                    'telegram_ids': telegram_ids,
+                    'usernames': [pending[key].get('username') for key in telegram_ids],
+                    'first_names': [pending[key].get('first_name') for key in telegram_ids],
+                    'last_names': [pending[key].get('last_name') for key in telegram_ids],
+                    'last_activities': [pending[key].get('last_activity') for key in telegram_ids]
+                })
+                await db.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи изменений пользователей: {e}")
+            # Возвращаем пакет, более новые изменения остаются приоритетными
+            for telegram_id, changes in pending.items():
+                self._pending[telegram_id] = {**changes, **self._pending.get(telegram_id, {})}
+            return 0
+        self.flushed += len(telegram_ids)
+        return len(telegram_ids)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _listen_invalidations(self):
+        """Подписка на события админ-панели о блокировке и разблокировке"""
+        if not USER_EVENTS_REDIS_URL or aioredis is None:
+            logger.info("ℹ️ Redis не настроен: изменения пользователей применяются по TTL кэша")
+            return
+        while True:
+            client = aioredis.Redis.from_url(USER_EVENTS_REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+                    # Изменения, пропущенные без подписки, могли устареть
+                    self.invalidate()
+                    async for message in pubsub.listen():
+                        if message.get('type') == 'message':
+                            self.invalidate(int(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Подписка на события пользователей прервана: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await client.aclose()
+
+    def start(self):
+        """Запуск фоновой записи изменений и подписки на события"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._listen_invalidations())
+        ]
+
+    async def stop(self):
+        """Остановка фоновых задач с записью оставшихся изменений"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries), 'ttl': self.ttl,
+            'hits': self.hits, 'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'pending': len(self._pending), 'flushed': self.flushed,
+            'invalidations': self.invalidations
+        }
+
+
+user_registry = UserRegistry()
@@ -20,8 +20,10 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 
 from bot.config import config
-from bot.database import init_db
-from bot.handlers import register_handlers
+from bot.database import init_db, close_async_database
+from bot.executors import shutdown_executors
+from bot.user_registry import user_registry
+from bot.handlers import register_handlers, rag_service
 
 # Настройка логирования
 logging.basicConfig(
@@ -47,6 +49,11 @@ async def main():
         logger.info("🔄 Инициализация базы данных...")
         await init_db()
         logger.info("✅ База данных инициализирована")
+        user_registry.start()
+        
+        # Загружаем и прогреваем модель эмбеддингов до приема сообщений
+        logger.info("🔄 Инициализация RAG системы...")
+        await rag_service.initialize()
         
         # Создаем бота
         bot = Bot(
@@ -95,6 +102,9 @@ async def main():
         except:
             pass
         
+        await user_registry.stop()
+        shutdown_executors()
+        await close_async_database()
         logger.info("👋 Бот остановлен")
 
 if __name__ == "__main__":